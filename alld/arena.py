@@ -0,0 +1,47 @@
+"""Module contains per-resolution arena of reusable frame buffers
+
+Per-frame stages write into buffers of the arena (OpenCV `dst=` and numpy
+`out=` arguments), so steady-state processing does not allocate full-frame
+arrays:
+
+    arena = Arena()
+    hls = cv2.cvtColor(image, cv2.COLOR_BGR2HLS, dst=arena.get('hls', image.shape))
+
+A buffer is identified by (name, shape, dtype) and is overwritten by the
+next frame: never return arena buffers to code which keeps frames (queues,
+callbacks) and never share an arena between threads.
+"""
+
+import numpy as np
+
+
+class Arena:
+
+    def __init__(self):
+        self._buffers = {}
+
+    def get(self, name, shape, dtype=np.uint8):
+        """Return buffer `name` of `shape` and `dtype` (allocated once)"""
+        key = (name, tuple(shape), np.dtype(dtype))
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = self._buffers[key] = np.empty(shape, dtype=dtype)
+        return buffer
+
+    def __len__(self):
+        return len(self._buffers)
+
+    @property
+    def nbytes(self):
+        """Total size of buffers"""
+        return sum(buffer.nbytes for buffer in self._buffers.values())
+
+    def clear(self):
+        self._buffers.clear()
+
+
+def get(arena, name, shape, dtype=np.uint8):
+    """Return buffer of `arena` (new array if `arena` is None)"""
+    if arena is None:
+        return np.empty(shape, dtype=dtype)
+    return arena.get(name, shape, dtype)
@@ -0,0 +1,53 @@
+"""Module contains functions to describe bands around lane lines
+
+A band is a set of pixels closer than `margin` (by X) to a line polynom.
+Bands are covered by rectangles (y0, y1, x0, x1) built for horizontal
+strips of the image.
+"""
+
+import collections
+
+import numpy as np
+
+
+Rect = collections.namedtuple('Rect', ['y0', 'y1', 'x0', 'x1'])
+
+
+def rects(shape, polys, margin, strip_height=48):
+    """Return a list of Rect covering bands around `polys`
+
+    Overlapping spans of the same strip are merged.
+    """
+    height, width = shape[:2]
+    result = []
+    for y0 in range(0, height, strip_height):
+        y1 = min(y0 + strip_height, height)
+        ys = np.arange(y0, y1)
+        spans = []
+        for poly2 in polys:
+            xs = poly2(ys)
+            x0 = max(int(np.floor(np.min(xs) - margin)), 0)
+            x1 = min(int(np.ceil(np.max(xs) + margin)) + 1, width)
+            if x0 < x1:
+                spans.append([x0, x1])
+        spans.sort()
+        merged = []
+        for span in spans:
+            if merged and span[0] <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], span[1])
+            else:
+                merged.append(span)
+        result.extend(Rect(y0, y1, x0, x1) for x0, x1 in merged)
+    return result
+
+
+def pad(rect, halo, shape):
+    """Grow `rect` by `halo` pixels (clipped by image `shape`)"""
+    height, width = shape[:2]
+    return Rect(max(rect.y0 - halo, 0), min(rect.y1 + halo, height),
+                max(rect.x0 - halo, 0), min(rect.x1 + halo, width))
+
+
+def area(rects_):
+    """Total area of rectangles"""
+    return sum((rect.y1 - rect.y0) * (rect.x1 - rect.x0) for rect in rects_)
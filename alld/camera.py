@@ -4,6 +4,7 @@
 import pickle
 
 import cv2
+import numpy as np
 
 
 class Camera:
@@ -17,6 +18,8 @@ class Camera:
         """
         self.cmx = cmx
         self.dist = dist
+        # undistortion maps cached by (height, width)
+        self._maps = {}
 
     def save(self, filename):
         camera = {
@@ -33,9 +36,46 @@ class Camera:
             camera = pickle.load(f)
             return cls(camera['cmx'], camera['dist'])
 
+    def scaled(self, x_scale, y_scale):
+        """Return Camera for images resized by (x_scale, y_scale)
+
+        Distortion coefficients are in normalized coords, so only the camera
+        matrix changes.
+        """
+        cmx = np.array(self.cmx, dtype=np.float64)
+        cmx[0, :] *= x_scale
+        cmx[1, :] *= y_scale
+        return Camera(cmx, self.dist)
+
+    def undistort_maps(self, shape):
+        """Return cached (map1, map2) for cv2.remap to undistort `shape` images"""
+        size = tuple(shape[:2])
+        if size not in self._maps:
+            h, w = size
+            self._maps[size] = cv2.initUndistortRectifyMap(
+                self.cmx, self.dist, None, self.cmx, (w, h), cv2.CV_16SC2)
+        return self._maps[size]
+
     def undistort(self, img):
         """undistort undistorts source image and returns undistorted image"""
-        return cv2.undistort(img, self.cmx, self.dist, None, self.cmx)
+        map1, map2 = self.undistort_maps(img.shape)
+        return cv2.remap(img, map1, map2, cv2.INTER_LINEAR)
+
+    def distort_points(self, points):
+        """Map points of undistorted image to points of source (distorted) image
+
+        `points` is a (N, 2) array of pixel coords. Returns (N, 2) float32 array.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        fx, fy = self.cmx[0, 0], self.cmx[1, 1]
+        cx, cy = self.cmx[0, 2], self.cmx[1, 2]
+        normalized = np.empty((len(points), 3), dtype=np.float64)
+        normalized[:, 0] = (points[:, 0] - cx) / fx
+        normalized[:, 1] = (points[:, 1] - cy) / fy
+        normalized[:, 2] = 1
+        zero = np.zeros(3)
+        distorted, _ = cv2.projectPoints(normalized, zero, zero, self.cmx, self.dist)
+        return distorted.reshape(-1, 2).astype(np.float32)
 
 
 def fromfile(filename):
@@ -13,12 +13,12 @@ def rgb2hls(image):
     return cv2.cvtColor(image, cv2.COLOR_RGB2HLS)
 
 
-def bgr2hls(image):
-    return cv2.cvtColor(image, cv2.COLOR_BGR2HLS)
+def bgr2hls(image, dst=None):
+    return cv2.cvtColor(image, cv2.COLOR_BGR2HLS, dst=dst)
 
 
-def bgr2gray(image):
-    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+def bgr2gray(image, dst=None):
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=dst)
 
 
 def hls2gray(image):
@@ -0,0 +1,52 @@
+"""Module contains controller of quality degradation under a latency budget
+
+Degradation chooses a level (0 is full quality) for the next frame:
+
+    degradation = deadline.Degradation(budget=0.04, levels=5)
+    for frame in frames:
+        start = time.perf_counter()
+        process(frame, degradation.level)
+        degradation.update(time.perf_counter() - start)
+
+Level steps down (increases) as soon as the running estimate of frame
+latency (exponentially weighted) exceeds the budget, and steps up after
+`recover_frames` frames with estimate below `recover_ratio * budget`.
+The estimate is restarted after each step.
+"""
+
+
+class Degradation:
+
+    def __init__(self, budget, levels, alpha=0.2, recover_ratio=0.5, recover_frames=30):
+        self.budget = budget
+        self.levels = levels
+        self.alpha = alpha
+        self.recover_ratio = recover_ratio
+        self.recover_frames = recover_frames
+        self.level = 0
+        self.estimate = None  # seconds per frame at current level
+        self._fast_frames = 0  # frames in a row with estimate below recover_ratio * budget
+
+    def update(self, seconds):
+        """Add latency of a frame processed at `level`, return level for the next frame"""
+        if self.estimate is None:
+            self.estimate = seconds
+        else:
+            self.estimate += self.alpha * (seconds - self.estimate)
+
+        if self.estimate > self.budget:
+            self._fast_frames = 0
+            if self.level < self.levels - 1:
+                self._step(1)
+        elif self.estimate < self.recover_ratio * self.budget:
+            self._fast_frames += 1
+            if self._fast_frames >= self.recover_frames and self.level > 0:
+                self._step(-1)
+        else:
+            self._fast_frames = 0
+        return self.level
+
+    def _step(self, delta):
+        self.level += delta
+        self.estimate = None
+        self._fast_frames = 0
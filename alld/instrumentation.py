@@ -0,0 +1,232 @@
+"""Module contains low-overhead instrumentation for pipeline hot paths
+
+Code under measurement wraps each stage in a `with`-block and reports
+events and observed values:
+
+    with timer('thresholds'):
+        ...
+    timer.count('margin_search')
+    timer.observe('pixels.left', len(left_points))
+
+`Recorder` collects stage durations, counters and values, `NULL` recorder
+does nothing (it is the default, so disabled instrumentation costs one
+method call per hook).
+
+Collected data is exported by `to_json`, `to_prometheus` and
+`write_chrome_trace`.
+"""
+
+import collections
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+
+class _Stage:
+
+    __slots__ = ('_recorder', '_name', '_start')
+
+    def __init__(self, recorder, name):
+        self._recorder = recorder
+        self._name = name
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._recorder.add(self._name, time.perf_counter() - self._start, self._start)
+        return False
+
+
+class _NullStage:
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class NullRecorder:
+    """Recorder which records nothing"""
+
+    enabled = False
+
+    def __call__(self, name):
+        return _NULL_STAGE
+
+    def add(self, name, seconds, start=None):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    def observe(self, name, value):
+        pass
+
+
+NULL = NullRecorder()
+
+
+class Series:
+    """count, sum and recent values (at most `window`, all if window is None)"""
+
+    __slots__ = ('count', 'total', 'values')
+
+    def __init__(self, window=None):
+        self.count = 0
+        self.total = 0.0
+        self.values = collections.deque(maxlen=window)
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.values.append(value)
+
+    def percentiles(self, q=(50, 95, 99)):
+        """Return percentiles of recent values"""
+        if not self.values:
+            return np.full(len(q), np.nan)
+        return np.percentile(self.values, q)
+
+
+class Recorder:
+    """Collects durations (seconds) of named stages, counters and values
+
+    Percentiles are calculated over the last `window` values of each series
+    (all values if `window` is None). Set `trace` to True to keep trace
+    events (at most `max_trace_events`) for `write_chrome_trace`.
+    """
+
+    enabled = True
+
+    def __init__(self, window=10000, trace=False, max_trace_events=100000):
+        self.window = window
+        self.durations = collections.OrderedDict()
+        self.counters = collections.OrderedDict()
+        self.values = collections.OrderedDict()
+        self.trace = collections.deque(maxlen=max_trace_events) if trace else None
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def __call__(self, name):
+        return _Stage(self, name)
+
+    def _series(self, series, name):
+        if name not in series:
+            with self._lock:
+                if name not in series:
+                    series[name] = Series(self.window)
+        return series[name]
+
+    def add(self, name, seconds, start=None):
+        """Record stage duration (`start` is time.perf_counter() at stage start)"""
+        self._series(self.durations, name).add(seconds)
+        if self.trace is not None:
+            if start is None:
+                start = time.perf_counter() - seconds
+            self.trace.append((name, start, seconds, threading.get_ident()))
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name, value):
+        self._series(self.values, name).add(value)
+
+    def reset(self):
+        with self._lock:
+            self.durations.clear()
+            self.counters.clear()
+            self.values.clear()
+            if self.trace is not None:
+                self.trace.clear()
+            self._origin = time.perf_counter()
+
+    def percentiles(self, name, q=(50, 95, 99)):
+        """Return percentiles of stage durations (seconds)"""
+        return self.durations[name].percentiles(q)
+
+    def summary(self, q=(50, 95, 99)):
+        """Return dictionary with stages, counters and values"""
+        def series_summary(series):
+            result = {'count': series.count, 'sum': series.total}
+            for quantile, value in zip(q, series.percentiles(q)):
+                result['p%d' % quantile] = float(value)
+            return result
+
+        return {
+            'stages': {name: series_summary(s) for name, s in self.durations.items()},
+            'counters': dict(self.counters),
+            'values': {name: series_summary(s) for name, s in self.values.items()},
+        }
+
+
+def to_json(recorder, file_name=None):
+    """Return JSON summary of `recorder` (and write it to `file_name` if set)"""
+    text = json.dumps(recorder.summary(), indent=2, sort_keys=True)
+    if file_name is not None:
+        with open(file_name, 'w') as f:
+            f.write(text)
+    return text
+
+
+def _prometheus_name(name):
+    return ''.join(c if c.isalnum() else '_' for c in name)
+
+
+def to_prometheus(recorder, prefix='alld', q=(50, 95, 99)):
+    """Return Prometheus text exposition snapshot of `recorder`"""
+    lines = []
+
+    def summary(metric, label, series_dict, help_):
+        lines.append('# HELP %s %s' % (metric, help_))
+        lines.append('# TYPE %s summary' % metric)
+        for name, series in series_dict.items():
+            for quantile, value in zip(q, series.percentiles(q)):
+                lines.append('%s{%s="%s",quantile="%g"} %r' % (metric, label, name, quantile / 100, float(value)))
+            lines.append('%s_sum{%s="%s"} %r' % (metric, label, name, float(series.total)))
+            lines.append('%s_count{%s="%s"} %d' % (metric, label, name, series.count))
+
+    summary(prefix + '_stage_seconds', 'stage', recorder.durations, 'Duration of pipeline stages')
+
+    metric = prefix + '_events_total'
+    lines.append('# HELP %s Pipeline events' % metric)
+    lines.append('# TYPE %s counter' % metric)
+    for name, value in recorder.counters.items():
+        lines.append('%s{event="%s"} %d' % (metric, name, value))
+
+    for name, series in recorder.values.items():
+        metric_name = '%s_%s' % (prefix, _prometheus_name(name))
+        summary(metric_name, 'name', {name: series}, 'Observed values of %s' % name)
+
+    return '\n'.join(lines) + '\n'
+
+
+def write_chrome_trace(recorder, file_name):
+    """Write trace events in Chrome trace-event format (chrome://tracing)"""
+    if recorder.trace is None:
+        raise RuntimeError('recorder was created without trace=True')
+    pid = os.getpid()
+    events = []
+    for name, start, seconds, tid in list(recorder.trace):
+        events.append({
+            'name': name,
+            'ph': 'X',
+            'ts': (start - recorder._origin) * 1e6,
+            'dur': seconds * 1e6,
+            'pid': pid,
+            'tid': tid,
+        })
+    with open(file_name, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
@@ -1,46 +1,194 @@
-import collections
-
 from alld import polynom2
 
 import numpy as np
 
 
+# smoothing methods (see Line)
+MEAN = 'mean'  # mean of the last `maxlen` fits
+EWMA = 'ewma'  # exponentially weighted moving average
+CONFIDENCE = 'confidence'  # mean of the last `maxlen` fits weighted by confidence
+
+SMOOTHING = (MEAN, EWMA, CONFIDENCE)
+
+# running sums are recalculated from the ring buffer every _RESUM fits
+# (subtracting evicted fits accumulates float rounding errors)
+_RESUM = 1024
+
+
 class Line():
-    """Define a class to receive the characteristics of each line detection"""
+    """Define a class to receive the characteristics of each line detection
+
+    History of fits is kept in a fixed (maxlen, 3) ring buffer with running
+    sums, so `fit` and `smoothed` cost O(1) and do not allocate (`smoothed`
+    is one Polynom2 updated in place).
+    `smoothing` is one of MEAN, EWMA (`alpha` is weight of the new fit) or
+    CONFIDENCE (fits are weighted by `confidence` passed to `fit`).
+    """
 
-    def __init__(self, maxlen=10):
+    def __init__(self, maxlen=10, point_store=None, smoothing=MEAN, alpha=0.3):
+        if smoothing not in SMOOTHING:
+            raise ValueError('unknown smoothing: %s' % smoothing)
         # was the line detected in the last iteration?
         self.detected = False
         # polynomial coefficients for the most recent fit
         # self.current_poly contains alld.polynom2.Polynom2
         self.current_poly2 = None
-        # poly2 of the last n fits
-        self.history = collections.deque(maxlen=maxlen)
         # difference in fit coefficients between last and new fits
         self.diffs = np.array([0, 0, 0], dtype='float')
         # x values for detected line pixels
         self.allx = []
         # y values for detected line pixels
         self.ally = []
+        # alld.pointstore.PointStore (if set, points are stored on disk, not in allx/ally)
+        self.point_store = point_store
 
-    def collect_points(self, points):
+        self.maxlen = maxlen
+        self.smoothing = smoothing
+        self.alpha = alpha
+        # ring buffer: coefficients and weights of the last `maxlen` fits
+        self._coefficients = np.zeros((maxlen, 3))
+        self._weights = np.zeros(maxlen)
+        self._frames = np.zeros(maxlen)  # frame numbers of fits (see `predict`)
+        self._polys = [None] * maxlen  # fitted Polynom2 (see `history`)
+        self._next = 0  # position of the next fit in ring buffer
+        self._n = 0  # number of fits in ring buffer
+        self._fits = 0  # number of fits since construction
+        # running sums: sum(weight * coefficients) and sum(weight)
+        self._sum = np.zeros(3)
+        self._weight_sum = 0.0
+        self._ewma = np.zeros(3)
+        self._tmp = np.zeros(3)
+        # smoothed Polynom2 (updated in place on demand, invalidated by fit)
+        self._smoothed = polynom2.Polynom2(np.zeros(3))
+        self._smoothed_valid = False
+
+    def reset(self):
+        """Forget history of fits (collected points are kept)"""
+        self.detected = False
+        self.current_poly2 = None
+        self.diffs[:] = 0
+        self._coefficients[:] = 0
+        self._weights[:] = 0
+        self._frames[:] = 0
+        self._polys = [None] * self.maxlen
+        self._next = 0
+        self._n = 0
+        self._fits = 0
+        self._sum[:] = 0
+        self._weight_sum = 0.0
+        self._ewma[:] = 0
+        self._smoothed_valid = False
+
+    def collect_points(self, points, frame=None):
+        if self.point_store is not None:
+            self.point_store.append(points.xs, points.ys, frame)
+            return
         self.allx.extend(points.xs)
         self.ally.extend(points.ys)
 
-    def fit(self, line):
+    def fit(self, line, confidence=1.0, frame=None):
+        """Add fitted `line` to history
+
+        `confidence` (> 0, e.g. number of detected points) is used by
+        CONFIDENCE smoothing only. `frame` is a number of frame (number
+        of fit by default), it is used by `predict`.
+        """
         self.detected = line.is_fitted
         if not self.detected:
             if not self.current_poly2:
                 self.current_poly2 = line
             return
 
+        if self.smoothing != CONFIDENCE:
+            confidence = 1.0
+        elif confidence <= 0:
+            raise ValueError('confidence should be positive: %s' % confidence)
+
+        if self.current_poly2 is not None and self.current_poly2.is_fitted:
+            np.subtract(line.coefficients, self.current_poly2.coefficients, out=self.diffs)
+
         self.current_poly2 = line
 
-        self.history.append(line)
+        self._polys[self._next] = line
+        self._append(line.coefficients, confidence, self._fits if frame is None else frame)
+        self._smoothed_valid = False
+
+    def _append(self, coefficients, weight, frame):
+        i = self._next
+        self._frames[i] = frame
+        slot = self._coefficients[i]
+        if self._n == self.maxlen:
+            # evict the oldest fit
+            np.multiply(slot, self._weights[i], out=self._tmp)
+            self._sum -= self._tmp
+            self._weight_sum -= self._weights[i]
+        else:
+            self._n += 1
+        slot[:] = coefficients
+        self._weights[i] = weight
+        np.multiply(slot, weight, out=self._tmp)
+        self._sum += self._tmp
+        self._weight_sum += weight
+        self._next = (i + 1) % self.maxlen
+
+        if self._fits == 0:
+            self._ewma[:] = coefficients
+        else:
+            self._ewma *= 1 - self.alpha
+            np.multiply(slot, self.alpha, out=self._tmp)
+            self._ewma += self._tmp
+
+        self._fits += 1
+        if self._fits % _RESUM == 0:
+            # unused slots have zero weights
+            np.dot(self._weights, self._coefficients, out=self._sum)
+            self._weight_sum = float(self._weights.sum())
+
+    def predict(self, frame):
+        """Extrapolate line to `frame`: Polynom2 (None if line was not fitted yet)
+
+        Coefficients are linear functions of frame number fitted to history
+        (least squares), smoothed line is returned if history has one frame.
+        """
+        n = self._n
+        if not n:
+            return None
+        # the first n slots are used until ring buffer is full
+        frames = self._frames[:n]
+        coefficients = self._coefficients[:n]
+        t = frames - frames.mean()
+        variance = np.dot(t, t)
+        if variance == 0:
+            return self.smoothed
+        mean = coefficients.mean(axis=0)
+        slope = np.dot(t, coefficients - mean) / variance
+        return polynom2.Polynom2(mean + slope * (frame - frames.mean()))
+
+    @property
+    def history(self):
+        """Polynom2 of the last fits (list from the oldest to the newest)"""
+        return [self._polys[(self._next - self._n + i) % self.maxlen] for i in range(self._n)]
+
+    @property
+    def history_coefficients(self):
+        """Coefficients of the last fits, (n, 3) array from the oldest to the newest"""
+        return self._coefficients[(self._next - self._n + np.arange(self._n)) % self.maxlen]
 
     @property
     def smoothed(self):
-        coeffs = [poly2.coefficients for poly2 in self.history]
-        mean_poly2 = np.mean(coeffs, axis=0)
-        return polynom2.Polynom2(mean_poly2)
+        """Smoothed Polynom2 (None if line was not fitted yet)
 
+        The same object is returned by each call, its coefficients are
+        updated in place after `fit` (copy them to keep old values).
+        """
+        if not self._n:
+            return None
+        if not self._smoothed_valid:
+            coefficients = self._smoothed.coefficients
+            if self.smoothing == EWMA:
+                np.copyto(coefficients, self._ewma)
+            else:
+                np.divide(self._sum, self._weight_sum, out=coefficients)
+            self._smoothed.assign(coefficients)
+            self._smoothed_valid = True
+        return self._smoothed
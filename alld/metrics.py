@@ -0,0 +1,132 @@
+"""Module contains bounded-memory sink for per-frame metrics
+
+MetricsSink records frames into a preallocated structured numpy buffer and
+flushes full chunks to an appendable .npy file. The header of the file is
+rewritten on each flush, so the file is always a valid .npy file with all
+flushed records (even if the process crashes):
+
+    records = numpy.load('metrics.npy', mmap_mode='r')
+
+"""
+
+import ast
+import os
+
+import numpy as np
+
+try:
+    import scipy.io as scipy_io
+except ImportError:
+    scipy_io = None
+
+
+_MAGIC = b'\x93NUMPY\x01\x00'
+
+# header is padded to this size, so it can be rewritten in place
+_HEADER_SIZE = 1024
+
+
+def _header(dtype, rows):
+    header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (
+        np.lib.format.dtype_to_descr(dtype), rows)
+    # magic (8 bytes) + header length (2 bytes) + header + '\n'
+    padding = _HEADER_SIZE - len(_MAGIC) - 2 - len(header) - 1
+    if padding < 0:
+        raise ValueError('too many metrics fields: %d' % len(dtype.names))
+    header = header + ' ' * padding + '\n'
+    return _MAGIC + np.uint16(len(header)).astype('<u2').tobytes() + header.encode('latin1')
+
+
+class MetricsSink:
+    """Append-only storage of per-frame metrics
+
+    `fields` is a list of (name, dtype) pairs. If `file_name` is None
+    flushed chunks are kept in memory (as compact numpy arrays), so memory
+    grows by dtype.itemsize bytes per record: use `file_name` for
+    unbounded streams.
+    """
+
+    def __init__(self, fields, file_name=None, chunk_size=1024):
+        self.dtype = np.dtype(fields)
+        self.file_name = file_name
+        self._buffer = np.zeros(chunk_size, dtype=self.dtype)
+        self._n = 0  # records in buffer
+        self._flushed = 0  # records in file (or in self._chunks)
+        self._chunks = []
+        self._f = None
+        if file_name is not None:
+            self._f = open(file_name, 'wb')
+            self._f.write(_header(self.dtype, 0))
+
+    def __len__(self):
+        return self._flushed + self._n
+
+    def append(self, **values):
+        """Record one frame (missing fields are zeros)"""
+        self._buffer[self._n] = 0
+        record = self._buffer[self._n]
+        for name, value in values.items():
+            record[name] = value
+        self._n += 1
+        if self._n == len(self._buffer):
+            self.flush()
+
+    def flush(self):
+        """Write buffered records to file (or to memory)"""
+        if self._n:
+            chunk = self._buffer[:self._n]
+            if self._f is None:
+                self._chunks.append(chunk.copy())
+            else:
+                self._f.seek(0, os.SEEK_END)
+                self._f.write(chunk.tobytes())
+            self._flushed += self._n
+            self._n = 0
+        if self._f is not None:
+            self._f.seek(0)
+            self._f.write(_header(self.dtype, self._flushed))
+            self._f.flush()
+
+    def close(self):
+        self.flush()
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    def records(self):
+        """Return all records as structured numpy array"""
+        self.flush()
+        if self.file_name is None:
+            if not self._chunks:
+                return np.zeros(0, dtype=self.dtype)
+            self._chunks = [np.concatenate(self._chunks)]
+            return self._chunks[0]
+        return load(self.file_name)
+
+    def column(self, name):
+        return self.records()[name]
+
+    def save_mat(self, file_name):
+        """Convert all records to MAT file (one variable per field)"""
+        to_mat(self.records(), file_name)
+
+
+def load(file_name):
+    """Load metrics written by MetricsSink (memory-mapped)"""
+    with open(file_name, 'rb') as f:
+        if f.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError('not a metrics file: %s' % file_name)
+        header_len = int(np.frombuffer(f.read(2), dtype='<u2')[0])
+        header = ast.literal_eval(f.read(header_len).decode('latin1'))
+    dtype = np.lib.format.descr_to_dtype(header['descr'])
+    rows = header['shape'][0]
+    if not rows:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(file_name, dtype=dtype, mode='r', offset=_HEADER_SIZE, shape=(rows,))
+
+
+def to_mat(records, file_name):
+    """Save structured array `records` to MAT file"""
+    if not scipy_io:
+        raise RuntimeError('scipy.io is not installed')
+    scipy_io.savemat(file_name, {name: np.asarray(records[name]) for name in records.dtype.names})
@@ -14,6 +14,12 @@ import numpy as np
 Pair = collections.namedtuple('Pair', ['src', 'dst'])
 
 
+def scaled(pair, src_scale=(1, 1), dst_scale=(1, 1)):
+    """Return Pair with src and dst coords multiplied by (x, y) scales"""
+    return Pair(src=(pair.src[0] * src_scale[0], pair.src[1] * src_scale[1]),
+                dst=(pair.dst[0] * dst_scale[0], pair.dst[1] * dst_scale[1]))
+
+
 class _Map4(collections.namedtuple('_Map4', ['p1', 'p2', 'p3', 'p4'])):
 
     @property
@@ -47,3 +53,54 @@ class Perspective:
 
     def unwarp(self, image):
         return cv2.warpPerspective(image, self.backmtx, (image.shape[1], image.shape[0]))
+
+    def source_points(self, shape):
+        """Return (H, W, 2) float32 array: source coords of each warped pixel"""
+        h, w = shape[:2]
+        xs, ys = np.meshgrid(np.arange(w, dtype=np.float32), np.arange(h, dtype=np.float32))
+        grid = np.dstack((xs, ys))
+        return cv2.perspectiveTransform(grid, self.backmtx)
+
+
+class UndistortWarp:
+    """Fused Camera.undistort + Perspective.warp
+
+    Builds one remap table per input resolution and warps a raw frame
+    into bird's-eye space with a single cv2.remap (one interpolation).
+
+    `size` is (width, height) of warped images (the size of input frames
+    if None), so frames can be warped and downscaled at once.
+    """
+
+    def __init__(self, cam, persp, size=None):
+        self.cam = cam
+        self.persp = persp
+        self.size = size
+        # remap tables cached by (height, width) of input frames
+        self._maps = {}
+
+    def output_shape(self, shape):
+        """Return (height, width) of warped images for `shape` frames"""
+        if self.size is None:
+            return tuple(shape[:2])
+        return self.size[1], self.size[0]
+
+    def maps(self, shape):
+        """Return cached (map1, map2) for `shape` images"""
+        size = tuple(shape[:2])
+        if size not in self._maps:
+            h, w = self.output_shape(size)
+            undistorted = self.persp.source_points((h, w)).reshape(-1, 2)
+            raw = self.cam.distort_points(undistorted).reshape(h, w, 2)
+            self._maps[size] = cv2.convertMaps(raw, None, cv2.CV_16SC2)
+        return self._maps[size]
+
+    def __call__(self, frame, out=None):
+        """Return warped frame (written into `out` if set)"""
+        map1, map2 = self.maps(frame.shape)
+        return cv2.remap(frame, map1, map2, cv2.INTER_LINEAR, dst=out)
+
+    def crop(self, frame, y0, y1, x0, x1):
+        """Return [y0:y1, x0:x1] crop of warped frame (only the crop is resampled)"""
+        map1, map2 = self.maps(frame.shape)
+        return cv2.remap(frame, map1[y0:y1, x0:x1], map2[y0:y1, x0:x1], cv2.INTER_LINEAR)
@@ -1,4 +1,8 @@
-"""Module contains functions to convert from pixel space to real world space"""
+"""Module contains functions to convert from pixel space to real world space
+
+Module functions use constants measured on 1280x720 warped images, use
+PixelSpace for warped images of other sizes (see PixelSpace.scaled).
+"""
 
 from alld import polynom2
 
@@ -9,6 +13,39 @@ ym_per_pix = 30 / 720
 xm_per_pix = 3.7 / 700
 
 
+class PixelSpace:
+    """Conversion from pixel space of warped images to real world space"""
+
+    def __init__(self, xm_per_pix=xm_per_pix, ym_per_pix=ym_per_pix):
+        self.xm_per_pix = xm_per_pix
+        self.ym_per_pix = ym_per_pix
+
+    def scaled(self, x_scale, y_scale):
+        """Return PixelSpace of warped images resized by (x_scale, y_scale)"""
+        return PixelSpace(self.xm_per_pix / x_scale, self.ym_per_pix / y_scale)
+
+    def to_real_world(self, poly2):
+        """Convert `poly2` to real world space (exact, cached per polynom)"""
+        key = ('real_world', self.xm_per_pix, self.ym_per_pix)
+        return poly2.cached(key, lambda: poly2.scaled(self.xm_per_pix, self.ym_per_pix))
+
+    def coefficients_to_real_world(self, coefficients):
+        """Convert (N, 3) array of polynom coefficients to real world space"""
+        return polynom2.scale(coefficients, self.xm_per_pix, self.ym_per_pix)
+
+    def x_pix2m(self, pixels):
+        """Convert X-pixels to meters"""
+        return pixels * self.xm_per_pix
+
+    def y_pix2m(self, pixels):
+        """Convert Y-pixels to meters"""
+        return pixels * self.ym_per_pix
+
+
+# pixel space of 1280x720 warped images
+DEFAULT = PixelSpace()
+
+
 def to_real_world_space(xs, ys):
     """Convert `xs` and `ys` from pixel space to real world space and fit `Polynom2`
     
@@ -20,11 +57,24 @@ def to_real_world_space(xs, ys):
     return points.fit_poly2()
 
 
+def to_real_world(poly2):
+    """Convert `poly2` (polynom2.Polynom2) from pixel space to real world space
+
+    Conversion is exact (see Polynom2.scaled) and cached per polynom.
+    """
+    return DEFAULT.to_real_world(poly2)
+
+
+def coefficients_to_real_world(coefficients):
+    """Convert (N, 3) array of polynom coefficients to real world space (see to_real_world)"""
+    return DEFAULT.coefficients_to_real_world(coefficients)
+
+
 def x_pix2m(pixels):
     """Convert X-pixels to meters"""
-    return pixels * xm_per_pix
+    return DEFAULT.x_pix2m(pixels)
 
 
 def y_pix2m(pixels):
     """Convert Y-pixels to meters"""
-    return pixels * ym_per_pix
+    return DEFAULT.y_pix2m(pixels)
@@ -0,0 +1,128 @@
+"""Module contains disk-backed storage of detected line points
+
+PointStore keeps points of all frames in two appendable files:
+
+  - `file_name.points` - int16 (x, y) pairs of all frames
+  - `file_name.index` - int64 (frame, offset, count) record for each frame
+
+Writes are buffered and flushed in chunks, reads are memory-mapped, so
+points of one frame can be read without loading the rest:
+
+    store = pointstore.load('left')
+    points = store.frame(100)  # polynom2.Points
+
+"""
+
+import os
+
+from alld import polynom2
+
+import numpy as np
+
+
+POINT_DTYPE = np.int16
+INDEX_DTYPE = np.dtype([('frame', np.int64), ('offset', np.int64), ('count', np.int64)])
+
+
+def _files(file_name):
+    return file_name + '.points', file_name + '.index'
+
+
+class PointStore:
+    """Append-only storage of per-frame points
+
+    Use PointStore(file_name) to write points and pointstore.load to read them.
+    """
+
+    def __init__(self, file_name, chunk_size=1 << 16):
+        self.file_name = file_name
+        self.chunk_size = chunk_size
+        points_file, index_file = _files(file_name)
+        self._points_f = open(points_file, 'wb')
+        self._index_f = open(index_file, 'wb')
+        self._points = []  # buffered (N, 2) arrays
+        self._index = []  # buffered index records
+        self._buffered = 0  # number of buffered points
+        self._offset = 0  # number of points (written + buffered)
+        self._frames = 0
+
+    def __len__(self):
+        return self._frames
+
+    def append(self, xs, ys, frame=None):
+        """Append points of one frame (`frame` is a sequence number by default)"""
+        if frame is None:
+            frame = self._frames
+        count = len(xs)
+        if count:
+            points = np.empty((count, 2), dtype=POINT_DTYPE)
+            points[:, 0] = xs
+            points[:, 1] = ys
+            self._points.append(points)
+        self._index.append((frame, self._offset, count))
+        self._offset += count
+        self._buffered += count
+        self._frames += 1
+        if self._buffered >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Write buffered points and index to files"""
+        for points in self._points:
+            self._points_f.write(points.tobytes())
+        if self._index:
+            self._index_f.write(np.array(self._index, dtype=INDEX_DTYPE).tobytes())
+        self._points_f.flush()
+        self._index_f.flush()
+        self._points = []
+        self._index = []
+        self._buffered = 0
+
+    def close(self):
+        if self._points_f is None:
+            return
+        self.flush()
+        self._points_f.close()
+        self._index_f.close()
+        self._points_f = None
+        self._index_f = None
+
+
+class PointReader:
+    """Random-access reader of PointStore files"""
+
+    def __init__(self, file_name):
+        points_file, index_file = _files(file_name)
+        self.index = np.fromfile(index_file, dtype=INDEX_DTYPE)
+        if os.path.getsize(points_file):
+            self._points = np.memmap(points_file, dtype=POINT_DTYPE, mode='r').reshape(-1, 2)
+        else:
+            self._points = np.zeros((0, 2), dtype=POINT_DTYPE)
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def frames(self):
+        return self.index['frame']
+
+    def _record(self, frame):
+        i = np.searchsorted(self.index['frame'], frame)
+        if i == len(self.index) or self.index['frame'][i] != frame:
+            raise KeyError('frame is not stored: %s' % frame)
+        return self.index[i]
+
+    def frame(self, frame):
+        """Return polynom2.Points of `frame`"""
+        record = self._record(frame)
+        points = self._points[record['offset']:record['offset'] + record['count']]
+        return polynom2.Points(np.asarray(points[:, 0]), np.asarray(points[:, 1]))
+
+    def __iter__(self):
+        for frame in self.frames:
+            yield frame, self.frame(frame)
+
+
+def load(file_name):
+    """syntax sugar: PointReader(file_name)"""
+    return PointReader(file_name)
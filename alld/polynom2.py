@@ -29,6 +29,19 @@ class Polynom2:
     def __init__(self, polynom):
         super().__init__()
         self._polynom = polynom
+        # values derived from coefficients (see `cached`)
+        self._cache = {}
+
+    def assign(self, polynom):
+        """Replace coefficients in place (cached values are dropped)"""
+        self._polynom = polynom
+        self._cache.clear()
+
+    def cached(self, key, fn):
+        """Return fn() calculated once per polynom instance"""
+        if key not in self._cache:
+            self._cache[key] = fn()
+        return self._cache[key]
 
     @property
     def is_fitted(self):
@@ -50,10 +63,56 @@ class Polynom2:
     def c(self):
         return self._polynom[2]
 
+    def scaled(self, x_scale, y_scale):
+        """Change units: return Polynom2 of (x * x_scale) as function of (y * y_scale)
+
+        x = a * y^2 + b * y + c  =>  X = A * Y^2 + B * Y + C, where X = x * x_scale
+        and Y = y * y_scale, so A = a * x_scale / y_scale^2, B = b * x_scale / y_scale
+        and C = c * x_scale (exact, no fitting).
+        """
+        if not self.is_fitted:
+            return Polynom2(None)
+        return Polynom2(scale(self._polynom, x_scale, y_scale))
+
+    def at(self, y):
+        """Value in scalar `y` (cached)"""
+        return self.cached(('at', y), lambda: self(y))
+
     def curvature(self, y):
         """Curvature in y"""
-        double_a = 2 * self.a
-        return np.power(1 + np.square(double_a * y + self.b), 1.5) / (np.absolute(double_a))
+        return curvature(self._polynom, y)
 
     def __call__(self, y):
-        return self.a * y ** 2 + self.b * y + self.c
+        return evaluate(self._polynom, y)
+
+
+#
+# Functions below work with arrays of coefficients: (3,) for one polynom or
+# (N, 3) for N polynoms. Polynom2 uses them too, so batch results are exactly
+# the same as results of Polynom2 methods.
+#
+
+def stack(polys):
+    """Stack coefficients of fitted Polynom2 objects into (N, 3) array"""
+    return np.array([poly.coefficients for poly in polys], dtype=np.float64).reshape(-1, 3)
+
+
+def evaluate(coefficients, y):
+    """Value of polynom(s) in y (y is a scalar or an array broadcastable to (N,))"""
+    a, b, c = coefficients[..., 0], coefficients[..., 1], coefficients[..., 2]
+    return a * y ** 2 + b * y + c
+
+
+def curvature(coefficients, y):
+    """Curvature of polynom(s) in y"""
+    double_a = 2 * coefficients[..., 0]
+    return np.power(1 + np.square(double_a * y + coefficients[..., 1]), 1.5) / (np.absolute(double_a))
+
+
+def scale(coefficients, x_scale, y_scale):
+    """Change units of polynom(s) (see Polynom2.scaled)"""
+    return np.stack([
+        coefficients[..., 0] * x_scale / y_scale ** 2,
+        coefficients[..., 1] * x_scale / y_scale,
+        coefficients[..., 2] * x_scale,
+    ], axis=-1)
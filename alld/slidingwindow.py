@@ -1,3 +1,5 @@
+import sys
+
 import cv2
 import numpy as np
 
@@ -53,24 +55,100 @@ class SlidingWindow:
 
 
 class BinaryImage:
-    """Wrapper for cv2 binary image"""
+    """Wrapper for cv2 binary image
+
+    Nonzero pixels are stored row by row (CSR-style):
+
+      - `_x` - int16 columns of nonzero pixels (sorted by row, then by column)
+      - `_y` - rows of nonzero pixels
+      - `offsets` - pixels of row `y` are `_x[offsets[y]:offsets[y + 1]]`
+    """
 
     def __init__(self, binary_image):
         self._binary_image = binary_image
-        nonzero = self._binary_image.nonzero()
-        self._x = np.array(nonzero[1])
-        self._y = np.array(nonzero[0])
+        if binary_image.dtype != np.uint8:
+            binary_image = (binary_image != 0).astype(np.uint8)
+        height = binary_image.shape[0]
+        # (N, 1, 2) int32 array of (x, y) sorted by y then by x
+        points = cv2.findNonZero(binary_image)
+        if points is None:
+            points = np.zeros((0, 1, 2), dtype=np.int32)
+        points = points.reshape(-1, 2)
+        self._x = points[:, 0].astype(np.int16)
+        self._y = np.ascontiguousarray(points[:, 1])
+        self.offsets = np.searchsorted(self._y, np.arange(height + 1))
+        # sort keys y * 2^32 + x (pixels are already sorted by key)
+        if sys.byteorder == 'little':
+            # (x, y) int32 pair is y * 2^32 + x int64 number
+            self._keys = points.view(np.int64).ravel()
+        else:
+            self._keys = (self._y.astype(np.int64) << 32) | self._x.astype(np.int64)
+        # prefix sums of x (see ranges_sum), calculated on demand
+        self._x_cumsum = None
+
+    @property
+    def height(self):
+        return len(self.offsets) - 1
+
+    def row_range(self, y_low, y_high):
+        """Return (start, stop): pixels of rows y_low..y_high (inclusive)"""
+        y_low = min(max(y_low, 0), self.height)
+        y_high = min(max(y_high + 1, y_low), self.height)
+        return self.offsets[y_low], self.offsets[y_high]
+
+    def column_ranges(self, ys, x_low, x_high):
+        """Return (lo, hi): pixels with x_low[i] <= x < x_high[i] of row ys[i] are lo[i]..hi[i]"""
+        ys = np.asarray(ys, dtype=np.int64) << 32
+        lo = np.searchsorted(self._keys, ys + x_low)
+        hi = np.searchsorted(self._keys, ys + np.maximum(x_high, x_low))
+        return lo, hi
+
+    def window_ranges(self, sliding_window):
+        """Return column ranges (see column_ranges) of `sliding_window`"""
+        y_low, y_high = sliding_window.y_low, sliding_window.y_high
+        ys = np.arange(max(y_low, 0), min(y_high + 1, self.height))
+        return self.column_ranges(ys, max(sliding_window.x_low, 0), sliding_window.x_high + 1)
+
+    def ranges_sum(self, lo, hi):
+        """Return (count, sum of x) of pixels in ranges without gathering them"""
+        if self._x_cumsum is None:
+            self._x_cumsum = np.concatenate([[0], np.cumsum(self._x, dtype=np.int64)])
+        count = int(np.sum(hi - lo))
+        total = int(np.sum(self._x_cumsum[hi] - self._x_cumsum[lo]))
+        return count, total
+
+    def ranges_indices(self, lo, hi):
+        """Return concatenated indices of ranges lo[i]..hi[i]"""
+        counts = hi - lo
+        total = int(counts.sum())
+        if not total:
+            return np.zeros(0, dtype=np.int64)
+        # concatenate ranges without python loop
+        starts = np.cumsum(counts) - counts
+        return np.arange(total) + np.repeat(lo - starts, counts)
 
     def slice(self, sliding_window):
-        """Return X coords of nonzero points from sliding window"""
-        inds = ((self._x >= sliding_window.x_low) & (self._x <= sliding_window.x_high) &
-                (self._y >= sliding_window.y_low) & (self._y <= sliding_window.y_high))
-        return inds.nonzero()[0]
+        """Return indices of nonzero points from sliding window"""
+        return self.ranges_indices(*self.window_ranges(sliding_window))
+
+    def slice_columns(self, ys, x_low, x_high):
+        """Return indices of pixels (y, x) with x_low[i] <= x < x_high[i] for y = ys[i]
+
+        Work is proportional to len(ys) * log(N) + number of selected pixels.
+        """
+        return self.ranges_indices(*self.column_ranges(ys, x_low, x_high))
 
     def slice_poly2(self, poly2, margin):
-        xs = poly2(self._y)
-        inds = ((self._x > xs - margin) & (self._x < xs + margin))
-        return inds
+        """Return indices of pixels with |x - poly2(y)| < margin
+
+        Polynom is evaluated once per row.
+        """
+        width = self._binary_image.shape[1]
+        ys = np.arange(self.height)
+        xs = poly2(ys)
+        x_low = np.clip(np.floor(xs - margin) + 1, 0, width).astype(np.int64)
+        x_high = np.clip(np.ceil(xs + margin), 0, width).astype(np.int64)
+        return self.slice_columns(ys, x_low, x_high)
 
     def x(self, slice):
         """Return x-coords for slice"""
@@ -79,5 +157,3 @@ class BinaryImage:
     def y(self, slice):
         """Return y-coords for slice"""
         return self._y[slice]
-
-
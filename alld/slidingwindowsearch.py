@@ -1,4 +1,5 @@
 from alld import histogram
+from alld import instrumentation
 from alld import polynom2
 from alld import slidingwindow
 
@@ -11,65 +12,79 @@ def height(binary_image):
     return binary_image.shape[0]
 
 
-def search(binary, nwindows=9, window_margin=100, minpix=50, outimg=None):
+def search(binary, nwindows=9, window_margin=100, minpix=50, outimg=None, timer=instrumentation.NULL):
     """Search left and right lines using sliding window
     
     Return tuple (left, right) where left and right are polynom2.Points
     """
+    timer.count('sliding_window_search')
 
     window_height = height(binary) // nwindows
 
-    hist = histogram.BottomHalfHistogram(binary)
-    binary_image = slidingwindow.BinaryImage(binary)
+    with timer('sliding_window_search.histogram'):
+        hist = histogram.BottomHalfHistogram(binary)
+    with timer('sliding_window_search.nonzero'):
+        binary_image = slidingwindow.BinaryImage(binary)
 
     left_window = slidingwindow.SlidingWindow(hist.left_peak_x, height(binary), window_height, window_margin)
     right_window = slidingwindow.SlidingWindow(hist.right_peak_x, height(binary), window_height, window_margin)
 
-    left_lane = []
-    right_lane = []
+    with timer('sliding_window_search.windows'):
+        left, right = _slide(binary_image, left_window, right_window, nwindows, minpix, outimg)
+
+    timer.observe('pixels.left', len(left))
+    timer.observe('pixels.right', len(right))
+    return left, right
+
+
+def _slide(binary_image, left_window, right_window, nwindows, minpix, outimg):
+    windows = (left_window, right_window)
+    # (lo, hi) column ranges of each window (see BinaryImage.column_ranges)
+    ranges = ([], [])
 
     for _ in range(nwindows):
         if outimg is not None:
             left_window.draw(outimg)
             right_window.draw(outimg)
 
-        left_slice = binary_image.slice(left_window)
-        right_slice = binary_image.slice(right_window)
+        for window, window_ranges in zip(windows, ranges):
+            lo, hi = binary_image.window_ranges(window)
+            window_ranges.append((lo, hi))
 
-        left_lane.append(left_slice)
-        right_lane.append(right_slice)
-
-        if len(left_slice) > minpix:
-            new_x = np.int(np.mean(binary_image.x(left_slice)))
-            left_window.move_x(new_x)
-
-        if len(right_slice) > minpix:
-            new_x = np.int(np.mean(binary_image.x(right_slice)))
-            right_window.move_x(new_x)
+            # recenter window using centroid of its pixels (prefix sums, no gathering)
+            count, total = binary_image.ranges_sum(lo, hi)
+            if count > minpix:
+                window.move_x(int(total / count))
 
         left_window.move_down()
         right_window.move_down()
 
-    left_lane = np.concatenate(left_lane)
-    right_lane = np.concatenate(right_lane)
+    lanes = []
+    for window_ranges in ranges:
+        lo = np.concatenate([r[0] for r in window_ranges])
+        hi = np.concatenate([r[1] for r in window_ranges])
+        lane = binary_image.ranges_indices(lo, hi)
+        lanes.append(polynom2.Points(binary_image.x(lane), binary_image.y(lane)))
 
-    left = polynom2.Points(binary_image.x(left_lane), binary_image.y(left_lane))
-    right = polynom2.Points(binary_image.x(right_lane), binary_image.y(right_lane))
-
-    return left, right
+    return lanes[0], lanes[1]
 
 
-def marginsearch(binary, left_poly2, right_poly2, margin):
+def marginsearch(binary, left_poly2, right_poly2, margin, timer=instrumentation.NULL):
     """Search in a margin around the previous line position"""
+    timer.count('margin_search')
 
-    binary_image = slidingwindow.BinaryImage(binary)
+    with timer('margin_search.nonzero'):
+        binary_image = slidingwindow.BinaryImage(binary)
 
-    left_slice = binary_image.slice_poly2(left_poly2, margin)
-    right_slice = binary_image.slice_poly2(right_poly2, margin)
+    with timer('margin_search.select'):
+        left_slice = binary_image.slice_poly2(left_poly2, margin)
+        right_slice = binary_image.slice_poly2(right_poly2, margin)
 
-    left = polynom2.Points(binary_image.x(left_slice), binary_image.y(left_slice))
-    right = polynom2.Points(binary_image.x(right_slice), binary_image.y(right_slice))
+        left = polynom2.Points(binary_image.x(left_slice), binary_image.y(left_slice))
+        right = polynom2.Points(binary_image.x(right_slice), binary_image.y(right_slice))
 
+    timer.observe('pixels.left', len(left))
+    timer.observe('pixels.right', len(right))
     return left, right
 
 
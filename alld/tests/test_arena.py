@@ -0,0 +1,44 @@
+import unittest
+
+from alld import arena
+from alld import thresholds
+
+import numpy
+
+
+class TestArena(unittest.TestCase):
+
+    def test_buffers_are_reused(self):
+        a = arena.Arena()
+
+        buffer = a.get('gray', (4, 6))
+
+        self.assertIs(a.get('gray', (4, 6)), buffer)
+        self.assertIsNot(a.get('gray', (8, 6)), buffer)
+        self.assertIsNot(a.get('gray', (4, 6), numpy.float32), buffer)
+        self.assertEqual(len(a), 3)
+        self.assertEqual(a.nbytes, 24 + 48 + 96)
+
+    def test_without_arena(self):
+        self.assertIsNot(arena.get(None, 'gray', (4, 6)), arena.get(None, 'gray', (4, 6)))
+
+    def test_plan_results_are_the_same(self):
+        rng = numpy.random.RandomState(0)
+        images = [rng.randint(0, 255, (40, 60, 3)).astype(numpy.uint8) for _ in range(2)]
+        op = thresholds.op
+        expression = (op('sobelx') | op('mag') & op('dir')) | op('s')
+
+        def plan(arena_):
+            th_op = thresholds.Thresholds(
+                thresholds.HLSThreshold('s', 120, 255, thresholds.HLSThreshold.S),
+                thresholds.AbsSobelXThreshold(10, 120),
+                thresholds.MagSobelThreshold(5, 150, 3),
+                thresholds.DirectionThreshold(numpy.pi / 8, numpy.pi / 2 - numpy.pi / 8, 5),
+                arena=arena_)
+            return th_op.compile(expression)
+
+        a = arena.Arena()
+        with_arena, without_arena = plan(a), plan(None)
+        for image in images:
+            numpy.testing.assert_array_equal(with_arena(image), without_arena(image))
+        self.assertGreater(len(a), 0)
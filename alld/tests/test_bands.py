@@ -0,0 +1,36 @@
+import unittest
+
+from alld import bands
+from alld import polynom2
+
+import numpy
+
+
+class TestRects(unittest.TestCase):
+
+    def test_cover_band(self):
+        poly2 = polynom2.Polynom2(numpy.array([0.001, -0.5, 300.0]))
+        shape = (100, 400)
+
+        rects = bands.rects(shape, [poly2], margin=10, strip_height=20)
+
+        covered = numpy.zeros(shape, dtype=bool)
+        for rect in rects:
+            covered[rect.y0:rect.y1, rect.x0:rect.x1] = True
+        ys, xs = numpy.mgrid[0:shape[0], 0:shape[1]]
+        band = numpy.absolute(xs - poly2(ys)) < 10
+        self.assertTrue(covered[band].all())
+        self.assertLess(bands.area(rects), shape[0] * shape[1] / 4)
+
+    def test_merge_overlapping(self):
+        left = polynom2.Polynom2(numpy.array([0, 0, 100.0]))
+        right = polynom2.Polynom2(numpy.array([0, 0, 110.0]))
+
+        rects = bands.rects((10, 400), [left, right], margin=10, strip_height=10)
+
+        self.assertListEqual(rects, [bands.Rect(0, 10, 90, 121)])
+
+    def test_pad(self):
+        rect = bands.pad(bands.Rect(0, 10, 5, 20), 3, (12, 21))
+
+        self.assertEqual(rect, bands.Rect(0, 12, 2, 21))
@@ -0,0 +1,44 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import batch
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def touch(self, file_name):
+        path = os.path.join(self.folder, file_name)
+        open(path, 'w').close()
+        return path
+
+    def test_output_files(self):
+        self.assertEqual(batch.output_files('drives/a.mp4'),
+                         ('drives/a_lanes.avi', 'drives/a_metrics.npy', 'drives/a_metrics.mat'))
+
+    def test_read_manifest(self):
+        manifest = os.path.join(self.folder, 'drives.txt')
+        with open(manifest, 'w') as f:
+            f.write('# comment\n\na.mp4\n  b.avi  \n')
+
+        self.assertListEqual(batch.read_manifest(manifest),
+                             [os.path.join(self.folder, 'a.mp4'), os.path.join(self.folder, 'b.avi')])
+
+    def test_find_videos_skips_outputs(self):
+        a = self.touch('a.mp4')
+        b = self.touch('b.avi')
+        for output_file in batch.output_files(a) + batch.output_files(b):
+            self.touch(os.path.basename(output_file))
+
+        self.assertListEqual(batch.find_videos(os.path.join(self.folder, '*')), [a, b])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import cv2
+import numpy
+
+import calibrate
+
+
+def chessboard(rows, cols, square=40, margin=60, pad=0):
+    """Return gray chessboard image and its inner corners (pixel centre coordinates)
+
+    `pad` pixels are added to the right and bottom borders.
+    """
+    height = (cols + 1) * square + 2 * margin + pad
+    width = (rows + 1) * square + 2 * margin + pad
+    image = numpy.full((height, width), 255, dtype=numpy.uint8)
+    for i in range(cols + 1):
+        for j in range(rows + 1):
+            if (i + j) % 2 == 0:
+                image[margin + i * square:margin + (i + 1) * square, margin + j * square:margin + (j + 1) * square] = 0
+    ys, xs = numpy.mgrid[1:cols + 1, 1:rows + 1]
+    # edge between pixels k - 1 and k is at k - 0.5
+    corners = numpy.stack([margin + xs * square - 0.5, margin + ys * square - 0.5], axis=-1)
+    return image, corners.reshape(-1, 1, 2).astype(numpy.float32)
+
+
+def no_subpix(gray_img, corners, *args):
+    return corners
+
+
+class TestFindCorners(unittest.TestCase):
+
+    def test_corners(self):
+        board = calibrate.Chessboard(8, 6)
+        image, expected = chessboard(8, 6)
+        for scale in (1.0, 0.5, 0.25):
+            with self.subTest(scale=scale):
+                found, corners = board.find_corners(image, scale)
+                self.assertTrue(found)
+                numpy.testing.assert_allclose(corners, expected, atol=0.01)
+
+    def test_downscaled_corners_are_mapped_to_full_resolution(self):
+        board = calibrate.Chessboard(8, 6)
+        # sizes are not multiples of 1 / scale: rounded sizes of copies are not scaled by `scale`
+        for pad in (0, 1, 2, 3):
+            image, expected = chessboard(8, 6, pad=pad)
+            for scale in (0.5, 0.25):
+                with self.subTest(pad=pad, scale=scale), mock.patch('cv2.cornerSubPix', no_subpix):
+                    found, corners = board.find_corners(image, scale)
+                    self.assertTrue(found)
+                    numpy.testing.assert_allclose(corners, expected, atol=0.01)
+
+    def test_not_found(self):
+        found, _ = calibrate.Chessboard(8, 6).find_corners(numpy.full((300, 400), 255, dtype=numpy.uint8), 0.5)
+
+        self.assertFalse(found)
+
+
+class TestCornerCache(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp = self._tmp.name
+        self.board = calibrate.Chessboard(8, 6)
+        self.file_names = []
+        for i, pad in enumerate((0, 1)):
+            file_name = os.path.join(self.tmp, 'calibration%d.png' % i)
+            cv2.imwrite(file_name, chessboard(8, 6, pad=pad)[0])
+            self.file_names.append(file_name)
+        self.cache_file = os.path.join(self.tmp, 'corners.pickle')
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def detect_all(self, scale=calibrate.DETECTION_SCALE):
+        """Return detections and file names detected (not taken from cache)"""
+        detected = []
+        _detect = calibrate.detect
+
+        def detect(file_name, *args):
+            detected.append(file_name)
+            return _detect(file_name, *args)
+
+        cache = calibrate.CornerCache(self.cache_file)
+        with mock.patch('calibrate.detect', detect):
+            detections = calibrate.detect_all(self.file_names, self.board, scale, workers=0, cache=cache)
+        cache.save()
+        return detections, detected
+
+    def test_hit(self):
+        expected, detected = self.detect_all()
+        self.assertListEqual(detected, self.file_names)
+
+        detections, detected = self.detect_all()
+
+        self.assertListEqual(detected, [])
+        for detection, expected_detection in zip(detections, expected):
+            self.assertTrue(detection.found)
+            self.assertEqual(detection.image_size, expected_detection.image_size)
+            numpy.testing.assert_array_equal(detection.corners, expected_detection.corners)
+
+    def test_changed_file_is_detected(self):
+        self.detect_all()
+        cv2.imwrite(self.file_names[1], chessboard(8, 6, pad=5)[0])
+
+        detections, detected = self.detect_all()
+
+        self.assertListEqual(detected, self.file_names[1:])
+        self.assertEqual(detections[1].image_size, (485, 405))
+
+    def test_other_parameters_are_not_hits(self):
+        self.detect_all(scale=0.5)
+
+        _, detected = self.detect_all(scale=1.0)
+        self.assertListEqual(detected, self.file_names)
+
+        with mock.patch('calibrate.SUBPIX_WINDOW', (5, 5)):
+            _, detected = self.detect_all(scale=1.0)
+        self.assertListEqual(detected, self.file_names)
+
+    def test_other_chessboard_is_not_hit(self):
+        self.detect_all()
+        self.board = calibrate.Chessboard(6, 8)
+
+        _, detected = self.detect_all()
+
+        self.assertListEqual(detected, self.file_names)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+
+from alld import deadline
+
+
+class TestDegradation(unittest.TestCase):
+
+    def test_steps_down_when_over_budget(self):
+        degradation = deadline.Degradation(budget=0.04, levels=3)
+
+        self.assertEqual(degradation.update(0.03), 0)
+        self.assertEqual(degradation.update(0.05), 0)  # estimate is 0.032
+        self.assertEqual(degradation.update(0.2), 1)
+        self.assertEqual(degradation.update(0.2), 2)
+        self.assertEqual(degradation.update(0.2), 2)  # the cheapest level
+
+    def test_steps_up_after_fast_frames(self):
+        degradation = deadline.Degradation(budget=0.04, levels=3, recover_frames=3)
+        degradation.update(0.1)
+        self.assertEqual(degradation.level, 1)
+
+        levels = [degradation.update(0.01) for _ in range(4)]
+
+        self.assertListEqual(levels, [1, 1, 0, 0])
+
+    def test_stays_in_the_middle(self):
+        degradation = deadline.Degradation(budget=0.04, levels=3, recover_frames=3)
+
+        levels = [degradation.update(0.03) for _ in range(10)]
+
+        self.assertListEqual(levels, [0] * 10)
@@ -0,0 +1,79 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from alld import instrumentation
+
+
+class TestRecorder(unittest.TestCase):
+
+    def test_stages_counters_values(self):
+        recorder = instrumentation.Recorder()
+
+        for _ in range(3):
+            with recorder('stage'):
+                pass
+        recorder.count('miss')
+        recorder.count('miss', 2)
+        recorder.observe('pixels.left', 10)
+        recorder.observe('pixels.left', 20)
+
+        summary = recorder.summary()
+
+        self.assertEqual(summary['stages']['stage']['count'], 3)
+        self.assertEqual(summary['counters'], {'miss': 3})
+        self.assertEqual(summary['values']['pixels.left']['sum'], 30)
+        self.assertEqual(summary['values']['pixels.left']['p50'], 15)
+
+    def test_window(self):
+        recorder = instrumentation.Recorder(window=2)
+
+        for value in (1, 2, 3):
+            recorder.observe('x', value)
+
+        self.assertEqual(recorder.values['x'].count, 3)
+        self.assertListEqual(list(recorder.values['x'].values), [2, 3])
+
+    def test_null_recorder(self):
+        with instrumentation.NULL('stage'):
+            instrumentation.NULL.count('miss')
+            instrumentation.NULL.observe('x', 1)
+
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.recorder = instrumentation.Recorder(trace=True)
+        with self.recorder('process'):
+            with self.recorder('thresholds'):
+                pass
+        self.recorder.count('margin_search')
+        self.recorder.observe('pixels.left', 5)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_json(self):
+        summary = json.loads(instrumentation.to_json(self.recorder))
+
+        self.assertIn('thresholds', summary['stages'])
+
+    def test_prometheus(self):
+        text = instrumentation.to_prometheus(self.recorder)
+
+        self.assertIn('alld_stage_seconds_count{stage="process"} 1', text)
+        self.assertIn('alld_events_total{event="margin_search"} 1', text)
+        self.assertIn('alld_pixels_left_count{name="pixels.left"} 1', text)
+
+    def test_chrome_trace(self):
+        file_name = os.path.join(self.folder, 'trace.json')
+
+        instrumentation.write_chrome_trace(self.recorder, file_name)
+
+        with open(file_name) as f:
+            events = json.load(f)['traceEvents']
+        self.assertListEqual(sorted(event['name'] for event in events), ['process', 'thresholds'])
+        self.assertTrue(all(event['ph'] == 'X' for event in events))
@@ -0,0 +1,105 @@
+import unittest
+
+from alld import line
+from alld import polynom2
+
+import numpy
+
+
+def poly2(*coefficients):
+    return polynom2.Polynom2(numpy.array(coefficients, dtype=numpy.float64))
+
+
+class TestLine(unittest.TestCase):
+
+    def setUp(self):
+        rng = numpy.random.RandomState(0)
+        self.fits = [poly2(*c) for c in rng.uniform(-10, 10, (12, 3))]
+
+    def test_mean_is_mean_of_last_fits(self):
+        l = line.Line(maxlen=5)
+        self.assertIsNone(l.smoothed)
+
+        for i, fit in enumerate(self.fits):
+            l.fit(fit)
+            expected = numpy.mean([f.coefficients for f in self.fits[max(0, i - 4):i + 1]], axis=0)
+            numpy.testing.assert_allclose(l.smoothed.coefficients, expected, rtol=1e-12)
+
+        self.assertListEqual(l.history, self.fits[-5:])
+        numpy.testing.assert_array_equal(l.history_coefficients, [f.coefficients for f in self.fits[-5:]])
+
+    def test_smoothed_is_updated_in_place(self):
+        l = line.Line(maxlen=2)
+        l.fit(poly2(1, 2, 3))
+        smoothed = l.smoothed
+        self.assertEqual(smoothed.at(10), 123)
+
+        l.fit(poly2(3, 4, 5))
+
+        self.assertIs(l.smoothed, smoothed)
+        numpy.testing.assert_array_equal(smoothed.coefficients, [2, 3, 4])
+        # cached values are recalculated
+        self.assertEqual(smoothed.at(10), 234)
+
+    def test_unfitted_is_ignored(self):
+        l = line.Line(maxlen=5)
+        l.fit(self.fits[0])
+        smoothed = l.smoothed
+
+        l.fit(polynom2.Polynom2(None))
+
+        self.assertFalse(l.detected)
+        self.assertIs(l.smoothed, smoothed)
+
+    def test_ewma(self):
+        l = line.Line(maxlen=5, smoothing=line.EWMA, alpha=0.25)
+
+        l.fit(poly2(0, 0, 100))
+        l.fit(poly2(0, 0, 200))
+
+        numpy.testing.assert_allclose(l.smoothed.coefficients, [0, 0, 125])
+
+    def test_confidence(self):
+        l = line.Line(maxlen=2, smoothing=line.CONFIDENCE)
+
+        l.fit(poly2(0, 0, 100), 1)
+        l.fit(poly2(0, 0, 200), 3)
+        numpy.testing.assert_allclose(l.smoothed.coefficients, [0, 0, 175])
+
+        l.fit(poly2(0, 0, 300), 1)
+        numpy.testing.assert_allclose(l.smoothed.coefficients, [0, 0, 225])
+
+        with self.assertRaises(ValueError):
+            l.fit(poly2(0, 0, 300), 0)
+
+    def test_diffs(self):
+        l = line.Line()
+        l.fit(poly2(1, 2, 3))
+        l.fit(poly2(2, 4, 8))
+
+        numpy.testing.assert_array_equal(l.diffs, [1, 2, 5])
+
+    def test_predict(self):
+        l = line.Line(maxlen=3)
+        self.assertIsNone(l.predict(0))
+
+        l.fit(poly2(1, 2, 100), frame=0)
+        numpy.testing.assert_allclose(l.predict(5).coefficients, [1, 2, 100])
+
+        for frame in (4, 8, 12):
+            l.fit(poly2(1, 2, 100 + 10 * frame), frame=frame)
+
+        numpy.testing.assert_allclose(l.predict(14).coefficients, [1, 2, 240])
+
+    def test_reset(self):
+        l = line.Line(maxlen=3, smoothing=line.EWMA)
+        for fit in self.fits[:5]:
+            l.fit(fit)
+        l.reset()
+        self.assertFalse(l.detected)
+        self.assertIsNone(l.smoothed)
+        self.assertIsNone(l.predict(0))
+
+        l.fit(self.fits[5])
+        numpy.testing.assert_array_equal(l.smoothed.coefficients, self.fits[5].coefficients)
+        self.assertListEqual(l.history, [self.fits[5]])
@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from alld import metrics
+
+import numpy
+import scipy.io
+
+
+FIELDS = [('curvature', numpy.float64), ('sc', numpy.bool_), ('miss', numpy.int32)]
+
+
+class TestMetricsSink(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.folder, 'metrics.npy')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_in_memory(self):
+        sink = metrics.MetricsSink(FIELDS, chunk_size=2)
+
+        for i in range(5):
+            sink.append(curvature=i * 10.0, sc=i % 2, miss=i)
+
+        self.assertEqual(len(sink), 5)
+        self.assertListEqual(list(sink.column('miss')), [0, 1, 2, 3, 4])
+        self.assertListEqual(list(sink.column('sc')), [False, True, False, True, False])
+
+    def test_missing_fields_are_zeros(self):
+        sink = metrics.MetricsSink(FIELDS, chunk_size=2)
+
+        sink.append(miss=3)
+        sink.append(curvature=1.0)
+
+        self.assertListEqual(list(sink.column('miss')), [3, 0])
+        self.assertListEqual(list(sink.column('curvature')), [0.0, 1.0])
+
+    def test_flushed_chunks_are_readable_before_close(self):
+        sink = metrics.MetricsSink(FIELDS, self.file_name, chunk_size=2)
+
+        for i in range(5):
+            sink.append(curvature=i, miss=i)
+
+        # only full chunks are flushed
+        self.assertListEqual(list(numpy.load(self.file_name)['miss']), [0, 1, 2, 3])
+
+        sink.close()
+
+        self.assertListEqual(list(metrics.load(self.file_name)['miss']), [0, 1, 2, 3, 4])
+
+    def test_save_mat(self):
+        sink = metrics.MetricsSink(FIELDS, self.file_name, chunk_size=2)
+        for i in range(3):
+            sink.append(curvature=i, miss=i)
+        mat_file = os.path.join(self.folder, 'metrics.mat')
+
+        sink.save_mat(mat_file)
+        sink.close()
+
+        mat = scipy.io.loadmat(mat_file)
+        self.assertListEqual(list(mat['miss'].ravel()), [0, 1, 2])
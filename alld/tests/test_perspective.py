@@ -0,0 +1,95 @@
+import unittest
+
+from alld import camera
+from alld import perspective
+
+import cv2
+import numpy
+
+
+def _perspective_pairs():
+    a1 = perspective.Pair(src=(580, 460), dst=(260, 0))
+    a2 = perspective.Pair(src=(700, 460), dst=(1040, 0))
+    a3 = perspective.Pair(src=(1040, 680), dst=(1040, 780))
+    a4 = perspective.Pair(src=(260, 680), dst=(260, 780))
+    return a1, a2, a3, a4
+
+
+def _perspective():
+    return perspective.Perspective(*_perspective_pairs())
+
+
+def _camera(k1=0.0):
+    cmx = numpy.array([
+        [1150.0, 0, 640],
+        [0, 1150.0, 360],
+        [0, 0, 1],
+    ])
+    dist = numpy.array([[k1, 0, 0, 0, 0]])
+    return camera.Camera(cmx, dist)
+
+
+class TestUndistortWarp(unittest.TestCase):
+
+    def setUp(self):
+        rng = numpy.random.RandomState(0)
+        # smooth image: fused and two-step results should be close
+        small = rng.randint(0, 255, (18, 32, 3)).astype(numpy.uint8)
+        self.image = numpy.kron(small, numpy.ones((40, 40, 1), dtype=numpy.uint8))
+
+    def test_same_as_warp_without_distortion(self):
+        persp = _perspective()
+        undistort_warp = perspective.UndistortWarp(_camera(), persp)
+
+        expected = persp.warp(self.image).astype(int)
+        actual = undistort_warp(self.image).astype(int)
+
+        self.assertEqual(actual.shape, expected.shape)
+        self.assertLess(numpy.abs(actual - expected).mean(), 1)
+
+    def test_same_as_undistort_and_warp(self):
+        persp = _perspective()
+        cam = _camera(k1=-0.2)
+        undistort_warp = perspective.UndistortWarp(cam, persp)
+
+        expected = persp.warp(cam.undistort(self.image)).astype(int)
+        actual = undistort_warp(self.image).astype(int)
+
+        self.assertLess(numpy.abs(actual - expected).mean(), 2)
+
+    def test_maps_are_cached(self):
+        undistort_warp = perspective.UndistortWarp(_camera(), _perspective())
+
+        maps = undistort_warp.maps(self.image.shape)
+
+        self.assertIs(undistort_warp.maps(self.image.shape), maps)
+        self.assertIsNot(undistort_warp.maps((360, 640)), maps)
+
+    def test_downscaled_warp(self):
+        scale = (0.5, 0.5)
+        pairs = [perspective.scaled(pair, dst_scale=scale) for pair in _perspective_pairs()]
+        undistort_warp = perspective.UndistortWarp(_camera(), perspective.Perspective(*pairs), (640, 360))
+
+        expected = cv2.resize(_perspective().warp(self.image), (640, 360), interpolation=cv2.INTER_AREA)
+        actual = undistort_warp(self.image)
+
+        self.assertEqual(undistort_warp.output_shape(self.image.shape), (360, 640))
+        self.assertEqual(actual.shape, expected.shape)
+        self.assertLess(numpy.abs(actual.astype(int) - expected).mean(), 5)
+
+
+class TestScaled(unittest.TestCase):
+
+    def test_scaled_pair(self):
+        pair = perspective.scaled(perspective.Pair(src=(10, 20), dst=(30, 40)), (2, 3), (0.5, 0.25))
+
+        self.assertEqual(pair, perspective.Pair(src=(20, 60), dst=(15, 10)))
+
+    def test_scaled_camera(self):
+        cam = _camera(k1=-0.2)
+        points = numpy.array([[100.0, 200.0], [640.0, 360.0], [1200.0, 700.0]])
+
+        expected = cam.distort_points(points) * 1.5
+        actual = cam.scaled(1.5, 1.5).distort_points(points * 1.5)
+
+        numpy.testing.assert_allclose(actual, expected, rtol=1e-5)
@@ -0,0 +1,352 @@
+import os
+import unittest
+from unittest import mock
+
+from alld import bands
+from alld import pixelspace
+from alld import polynom2
+from alld.tests import images
+
+import cv2
+import numpy
+
+import pipeline
+
+
+_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class TestLaneBatchGeometry(unittest.TestCase):
+
+    def test_same_as_lane(self):
+        random = numpy.random.RandomState(0)
+        n = 20
+        left = numpy.column_stack([random.uniform(-1e-3, 1e-3, n), random.uniform(-0.5, 0.5, n),
+                                   random.uniform(200, 400, n)])
+        right = left + numpy.column_stack([random.uniform(-1e-4, 1e-4, n), random.uniform(-0.05, 0.05, n),
+                                           random.uniform(600, 800, n)])
+        y, vehicle_center = 720, 640
+        bin = numpy.zeros((y, 1280), dtype=numpy.uint8)
+        ploty = numpy.linspace(0, y - 1, y)
+
+        for space in (pixelspace.DEFAULT, pixelspace.DEFAULT.scaled(0.5, 0.5)):
+            with self.subTest(space=space):
+                geometry = pipeline.Lane.batch_geometry(left, right, y, vehicle_center, space)
+                for i in range(n):
+                    lane = pipeline.Lane(polynom2.Polynom2(left[i].copy()), polynom2.Polynom2(right[i].copy()), space)
+                    left_base, right_base = lane.base(y)
+
+                    self.assertEqual(geometry.left_base[i], left_base)
+                    self.assertEqual(geometry.right_base[i], right_base)
+                    self.assertEqual(geometry.lane_width_m[i], lane.width_m(y))
+                    self.assertEqual(geometry.left_roc[i], pipeline.calc_curvature(bin, lane.left, ploty, space))
+                    self.assertEqual(geometry.right_roc[i], pipeline.calc_curvature(bin, lane.right, ploty, space))
+                    self.assertEqual(geometry.curvature[i], lane.curvature(bin, ploty))
+                    self.assertEqual(geometry.offset[i], space.x_pix2m(vehicle_center - lane.center(y)))
+
+
+class PipelineTestCase(unittest.TestCase):
+    """Pipeline loads camera.pickle from working directory"""
+
+    def setUp(self):
+        self._cwd = os.getcwd()
+        os.chdir(_root)
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+
+
+class TestMetricColumns(PipelineTestCase):
+
+    def test_columns_are_metrics(self):
+        pipe = pipeline.Pipeline()
+        for file_name in ('test1.jpg', 'test2.jpg', 'test3.jpg'):
+            pipe(images.imread(file_name))
+
+        records = pipe.metrics.records()
+        for name in ('curvature', 'offset', 'left_roc', 'sc', 'miss', 'sliding_window'):
+            numpy.testing.assert_array_equal(getattr(pipe, name), records[name])
+        self.assertEqual(len(pipe.curvature), 3)
+        with self.assertRaises(ValueError):
+            pipe.curvature[0] = 0
+
+
+class TestBandBinarization(PipelineTestCase):
+
+    def test_bands_agree_with_full_frame(self):
+        # strongest gradients of these images are outside bands
+        for file_name in ('test2.jpg', 'hard_test1.jpg'):
+            with self.subTest(file_name=file_name):
+                pipe = pipeline.Pipeline(band_binarization=True)
+                frame = images.imread(file_name)
+                pipe.process(frame.copy(), debug=False)
+                polys = (pipe.left.current_poly2, pipe.right.current_poly2)
+
+                full = pipe.binarize(frame)
+                band = pipe.binarize_bands(frame, polys, pipe.margin)
+
+                rects = bands.rects(full.shape, polys, pipe.margin)
+                self.assertTrue(rects)
+                for rect in rects:
+                    numpy.testing.assert_array_equal(band[rect.y0:rect.y1, rect.x0:rect.x1],
+                                                     full[rect.y0:rect.y1, rect.x0:rect.x1])
+
+    def test_full_frame_is_binarized_every_band_refresh_frames(self):
+        frame = images.imread('test1.jpg')
+        pipe = pipeline.Pipeline(band_binarization=True)
+        pipe.BAND_REFRESH = 3
+        binarized = []
+        binarize = pipe._binarize
+
+        def counted(frame, level=pipe.FULL):
+            binarized.append(len(pipe.metrics))
+            return binarize(frame, level)
+
+        pipe._binarize = counted
+        for i in range(8):
+            pipe.process(frame.copy(), debug=False)
+
+        self.assertTrue(pipe.sc.all())
+        self.assertListEqual(binarized, [0, 3, 6])
+
+
+class TestBinarize(PipelineTestCase):
+
+    def test_results_are_not_overwritten(self):
+        pipe = pipeline.Pipeline()
+        first = pipe.binarize(images.imread('test1.jpg'))
+        expected = first.copy()
+        second = pipe.binarize(images.imread('test2.jpg'))
+
+        numpy.testing.assert_array_equal(first, expected)
+        self.assertFalse(numpy.shares_memory(first, second))
+        self.assertFalse(numpy.array_equal(first, second))
+
+
+class TestFrameSize(PipelineTestCase):
+
+    def test_frame_of_other_size_is_rejected(self):
+        pipe = pipeline.Pipeline(frame_size=(640, 360))
+
+        with self.assertRaises(ValueError):
+            pipe.process(images.imread('test1.jpg'), debug=False)
+        self.assertEqual(len(pipe.metrics), 0)
+
+    def test_resized_frames(self):
+        frame = images.imread('test1.jpg')
+        expected = pipeline.Pipeline()
+        expected.process(frame.copy(), debug=False)
+
+        for size in ((640, 360), (1920, 1080)):
+            with self.subTest(size=size):
+                pipe = pipeline.Pipeline(frame_size=size)
+                pipe.process(cv2.resize(frame, size, interpolation=cv2.INTER_AREA), debug=False)
+                record = pipe.metrics.records()[0]
+
+                self.assertTrue(record['sc'])
+                self.assertAlmostEqual(record['lane_width_m'], expected.lane_width_m[0], delta=0.2)
+                self.assertAlmostEqual(record['offset'], expected.offset[0], delta=0.1)
+
+    def test_scale(self):
+        frame = images.imread('test1.jpg')
+        expected = pipeline.Pipeline()
+        expected.process(frame.copy(), debug=False)
+        pipe = pipeline.Pipeline(scale=0.5)
+        pipe.process(frame.copy(), debug=False)
+        record = pipe.metrics.records()[0]
+
+        self.assertEqual(pipe.warped_size, (640, 360))
+        self.assertEqual((pipe.margin, pipe.window_margin, pipe.minpix), (15, 50, 12))
+        self.assertTrue(record['sc'])
+        # metrics are in meters
+        self.assertAlmostEqual(record['curvature'], expected.curvature[0], delta=0.15 * expected.curvature[0])
+        self.assertAlmostEqual(record['lane_width_m'], expected.lane_width_m[0], delta=0.2)
+        self.assertAlmostEqual(record['offset'], expected.offset[0], delta=0.1)
+
+
+class TestDebugImage(PipelineTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.frame = images.imread('test1.jpg')
+
+    def test_not_built_by_default(self):
+        pipe = pipeline.Pipeline()
+        with mock.patch('alld.visual.create_outimg') as create_outimg:
+            for i in range(3):
+                pipe(self.frame.copy())
+
+        create_outimg.assert_not_called()
+        self.assertIsNone(pipe.debug_image)
+
+    def test_sampled_frames(self):
+        calls = []
+        pipe = pipeline.Pipeline(debug_every=2, debug_callback=lambda n, outimg: calls.append((n, outimg)))
+        for i in range(5):
+            pipe(self.frame.copy())
+
+        self.assertListEqual([n for n, _ in calls], [0, 2, 4])
+        for _, outimg in calls:
+            self.assertEqual(outimg.shape, (720, 1280, 3))
+        self.assertIs(pipe.debug_image, calls[-1][1])
+
+    def test_process(self):
+        pipe = pipeline.Pipeline()
+
+        _, outimg = pipe.process(self.frame.copy(), debug=False)
+        self.assertIsNone(outimg)
+
+        _, outimg = pipe.process(self.frame.copy(), debug=True)
+        self.assertEqual(outimg.shape, (720, 1280, 3))
+
+
+class TestFrameSkipping(PipelineTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.frame = images.imread('test1.jpg')
+
+    def run_frames(self, pipe, frames):
+        for frame in frames:
+            pipe.process(frame.copy(), debug=False)
+        return list(pipe.metrics.column('detected'))
+
+    def test_every_kth_frame_is_detected(self):
+        pipe = pipeline.Pipeline(detect_every=3)
+        detected = self.run_frames(pipe, [self.frame] * 7)
+
+        self.assertListEqual(detected, [True, False, False, True, False, False, True])
+        # lines of other frames are predicted
+        self.assertTrue(numpy.isfinite(pipe.curvature).all())
+        self.assertTrue(numpy.isfinite(pipe.offset).all())
+
+    def test_lost_lines_are_detected(self):
+        pipe = pipeline.Pipeline(detect_every=3)
+        self.run_frames(pipe, [self.frame])
+        pipe.left.detected = False
+
+        self.assertListEqual(self.run_frames(pipe, [self.frame] * 2), [True, True, False])
+
+    def test_few_points_are_detected(self):
+        pipe = pipeline.Pipeline(detect_every=3, min_points=10 ** 9)
+
+        self.assertListEqual(self.run_frames(pipe, [self.frame] * 4), [True] * 4)
+
+    def test_motion_is_detected(self):
+        pipe = pipeline.Pipeline(detect_every=5, motion_threshold=5)
+        frames = [self.frame, self.frame, images.imread('test2.jpg'), self.frame]
+
+        self.assertListEqual(self.run_frames(pipe, frames), [True, False, True, True])
+
+    def test_frames_are_detected_by_default(self):
+        pipe = pipeline.Pipeline()
+
+        self.assertListEqual(self.run_frames(pipe, [self.frame] * 3), [True] * 3)
+
+
+class TestDegradation(PipelineTestCase):
+
+    def degraded(self, level):
+        # large budget: level does not change
+        pipe = pipeline.Pipeline(budget=10.0)
+        pipe.degradation.level = level
+        return pipe
+
+    def test_low_resolution_search(self):
+        frame = images.imread('test1.jpg')
+        expected = pipeline.Pipeline()
+        expected.process(frame.copy(), debug=False)
+        pipe = self.degraded(pipeline.Pipeline.LOW_RESOLUTION)
+
+        self.assertEqual(pipe.binarize(frame, pipe.LOW_RESOLUTION).shape, (360, 640))
+
+        for i in range(2):
+            pipe.process(frame.copy(), debug=False)
+        records = pipe.metrics.records()
+
+        self.assertListEqual(list(records['sc']), [True, True])
+        self.assertListEqual(list(records['sliding_window']), [True, False])
+        self.assertListEqual(list(records['degradation']), [pipe.LOW_RESOLUTION] * 2)
+        # lines are tracked in warped_size pixels
+        numpy.testing.assert_allclose(pipe.left.current_poly2.coefficients,
+                                      expected.left.current_poly2.coefficients, rtol=0.1, atol=5)
+        self.assertAlmostEqual(records['lane_width_m'][1], expected.lane_width_m[0], delta=0.1)
+        self.assertAlmostEqual(records['offset'][1], expected.offset[0], delta=0.05)
+
+    def test_generous_budget_stays_at_full(self):
+        # steady state latency is ~50 ms, remap tables are not built by the first frames
+        frame = images.imread('test1.jpg')
+        pipe = pipeline.Pipeline(budget=0.5)
+        for i in range(10):
+            pipe(frame.copy())
+
+        self.assertListEqual(list(pipe.metrics.column('degradation')), [pipe.FULL] * 10)
+
+    def test_margin_search_only_reacquires_lost_lines(self):
+        frame = images.imread('test1.jpg')
+        pipe = self.degraded(pipeline.Pipeline.MARGIN_SEARCH_ONLY)
+        pipe.process(frame.copy(), debug=False)
+        self.assertTrue(pipe.sliding_window[0])
+
+        pipe.left.detected = False
+        pipe.process(frame.copy(), debug=False)
+        self.assertFalse(pipe.sliding_window[1])
+
+        pipe.left.detected = False
+        pipe.misses = pipe.ALLOWED_MISSES
+        pipe.process(frame.copy(), debug=False)
+        self.assertTrue(pipe.sliding_window[2])
+
+
+class TestProcessBatch(PipelineTestCase):
+
+    FILES = ('test1.jpg', 'test2.jpg', 'test3.jpg', 'test4.jpg', 'test5.jpg')
+
+    def batch(self, files=FILES, **kwargs):
+        paths = [os.path.join(images._test_images, file_name) for file_name in files]
+        return list(pipeline.Pipeline.process_batch(paths, **kwargs))
+
+    def assert_results_equal(self, results, expected):
+        self.assertEqual(len(results), len(expected))
+        for (processed, _, record), (expected_processed, _, expected_record) in zip(results, expected):
+            numpy.testing.assert_array_equal(processed, expected_processed)
+            self.assertEqual(record.tobytes(), expected_record.tobytes())
+
+    def test_workers_keep_order(self):
+        expected = self.batch(workers=0)
+        for file_name, (processed, _, record) in zip(self.FILES, expected):
+            pipe = pipeline.Pipeline()
+            numpy.testing.assert_array_equal(processed, pipe(images.imread(file_name)))
+            self.assertEqual(record.tobytes(), pipe.metrics.records()[0].tobytes())
+
+        for threads in (True, False):
+            with self.subTest(threads=threads):
+                self.assert_results_equal(self.batch(workers=2, threads=threads), expected)
+
+    def test_mixed_frame_sizes(self):
+        large = os.path.join(images._test_images, 'test1.jpg')
+        frame = cv2.resize(images.imread('test1.jpg'), (640, 360), interpolation=cv2.INTER_AREA)
+        results = list(pipeline.Pipeline.process_batch([large, frame, large], workers=0))
+
+        self.assertListEqual([result[0].shape for result in results],
+                             [(720, 1280, 3), (360, 640, 3), (720, 1280, 3)])
+        numpy.testing.assert_array_equal(results[0][0], results[2][0])
+
+    def test_degradation_is_disabled(self):
+        pipe = pipeline.Pipeline(budget=10.0)
+        pipe.degradation.level = pipe.NO_RENDERING
+        processed, _, record = pipe.process_image(images.imread('test1.jpg'))
+
+        self.assertEqual(record['degradation'], pipe.FULL)
+        self.assertEqual(pipe.degradation.level, pipe.NO_RENDERING)
+        self.assertEqual(len(pipe.metrics.records()), 0)
+
+    def test_files_are_rejected(self):
+        for name in ('metrics_file', 'points_file', 'collect_points'):
+            with self.subTest(name=name):
+                with self.assertRaises(ValueError):
+                    self.batch(workers=0, **{name: 'x'})
+
+
+if __name__ == '__main__':
+    unittest.main()
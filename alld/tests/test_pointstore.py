@@ -0,0 +1,53 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from alld import pointstore
+
+import numpy
+
+
+class TestPointStore(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.folder, 'left')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_random_access(self):
+        store = pointstore.PointStore(self.file_name, chunk_size=3)
+        store.append(numpy.array([1, 2]), numpy.array([10, 20]))
+        store.append(numpy.array([], dtype=int), numpy.array([], dtype=int))
+        store.append(numpy.array([3, 4, 5]), numpy.array([30, 40, 50]))
+        store.close()
+
+        reader = pointstore.load(self.file_name)
+
+        self.assertEqual(len(reader), 3)
+        points = reader.frame(2)
+        self.assertListEqual(list(points.xs), [3, 4, 5])
+        self.assertListEqual(list(points.ys), [30, 40, 50])
+        self.assertEqual(len(reader.frame(1)), 0)
+
+    def test_frame_numbers(self):
+        store = pointstore.PointStore(self.file_name)
+        store.append(numpy.array([1]), numpy.array([10]), frame=5)
+        store.append(numpy.array([2]), numpy.array([20]), frame=7)
+        store.close()
+
+        reader = pointstore.load(self.file_name)
+
+        self.assertListEqual(list(reader.frames), [5, 7])
+        self.assertListEqual(list(reader.frame(7).xs), [2])
+        with self.assertRaises(KeyError):
+            reader.frame(6)
+
+    def test_int16_storage(self):
+        store = pointstore.PointStore(self.file_name)
+        store.append(numpy.arange(4), numpy.arange(4))
+        store.close()
+
+        self.assertEqual(os.path.getsize(self.file_name + '.points'), 4 * 2 * 2)
@@ -0,0 +1,78 @@
+import unittest
+
+from alld import pixelspace
+from alld import polynom2
+
+import numpy
+
+
+class TestPolynom2(unittest.TestCase):
+
+    def setUp(self):
+        self.poly2 = polynom2.Polynom2(numpy.array([2e-4, -0.3, 350.0]))
+
+    def test_scaled_is_same_as_fit(self):
+        ploty = numpy.linspace(0, 719, 720)
+
+        expected = pixelspace.to_real_world_space(self.poly2(ploty), ploty)
+
+        actual = pixelspace.to_real_world(self.poly2)
+
+        numpy.testing.assert_allclose(actual.coefficients, expected.coefficients, rtol=1e-8)
+
+    def test_scaled_unfitted(self):
+        self.assertFalse(polynom2.Polynom2(None).scaled(2, 3).is_fitted)
+
+    def test_cached(self):
+        calls = []
+
+        def fn():
+            calls.append(1)
+            return 42
+
+        self.assertEqual(self.poly2.cached('key', fn), 42)
+        self.assertEqual(self.poly2.cached('key', fn), 42)
+        self.assertEqual(len(calls), 1)
+        self.assertIs(pixelspace.to_real_world(self.poly2), pixelspace.to_real_world(self.poly2))
+
+    def test_at(self):
+        self.assertAlmostEqual(self.poly2.at(720), self.poly2(720))
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        rng = numpy.random.RandomState(0)
+        self.coefficients = numpy.column_stack([
+            rng.uniform(-5e-4, 5e-4, 20), rng.uniform(-0.5, 0.5, 20), rng.uniform(200, 1000, 20)])
+        self.polys = [polynom2.Polynom2(c) for c in self.coefficients]
+
+    def test_stack(self):
+        numpy.testing.assert_array_equal(polynom2.stack(self.polys), self.coefficients)
+        self.assertEqual(polynom2.stack([]).shape, (0, 3))
+
+    def test_evaluate_and_curvature_are_same_as_scalar(self):
+        numpy.testing.assert_array_equal(polynom2.evaluate(self.coefficients, 720),
+                                         [poly(720) for poly in self.polys])
+        numpy.testing.assert_array_equal(polynom2.curvature(self.coefficients, 30.0),
+                                         [poly.curvature(30.0) for poly in self.polys])
+
+    def test_real_world_is_same_as_scalar(self):
+        numpy.testing.assert_array_equal(
+            pixelspace.coefficients_to_real_world(self.coefficients),
+            [pixelspace.to_real_world(poly).coefficients for poly in self.polys])
+
+
+class TestPixelSpace(unittest.TestCase):
+
+    def test_scaled_curvature_is_same(self):
+        poly2 = polynom2.Polynom2(numpy.array([2e-4, -0.3, 350.0]))
+        # the same curve in 640x360 warped image
+        half = polynom2.Polynom2(numpy.array([2e-4 * 0.5 / 0.5 ** 2, -0.3 * 0.5 / 0.5, 350.0 * 0.5]))
+        space = pixelspace.DEFAULT.scaled(0.5, 0.5)
+
+        expected = pixelspace.to_real_world(poly2).curvature(pixelspace.y_pix2m(720))
+        actual = space.to_real_world(half).curvature(space.y_pix2m(360))
+
+        self.assertAlmostEqual(actual, expected)
+        self.assertAlmostEqual(space.x_pix2m(350), pixelspace.x_pix2m(700))
@@ -0,0 +1,181 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from udacitylib.video import sinks
+
+import numpy
+
+
+SIZE = (6, 4)  # (width, height)
+SHAPE = (4, 6, 3)
+
+
+def frame(i):
+    return numpy.full(SHAPE, i, dtype=numpy.uint8)
+
+
+class FakeSink:
+    """Keeps copies of frames, `fail_at` frame raises, `gate` blocks writes"""
+
+    def __init__(self, fail_at=None, gate=None):
+        self.frames = []
+        self.fail_at = fail_at
+        self.gate = gate
+        self.released = False
+
+    def write(self, frame_):
+        if self.gate is not None:
+            self.gate.wait()
+        if len(self.frames) == self.fail_at:
+            raise IOError('write failed')
+        self.frames.append(frame_.copy())
+
+    def release(self):
+        self.released = True
+
+
+class SinkTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+
+class TestMemmapSink(SinkTestCase):
+
+    def test_read_back(self):
+        file_name = os.path.join(self.folder, 'frames.npy')
+        sink = sinks.MemmapSink(file_name, SIZE)
+        for i in range(3):
+            sink.write(frame(i))
+        sink.flush()
+
+        self.assertEqual(numpy.load(file_name, mmap_mode='r').shape, (3,) + SHAPE)
+
+        sink.write(frame(3))
+        sink.release()
+
+        frames = numpy.load(file_name, mmap_mode='r')
+        self.assertEqual(frames.shape, (4,) + SHAPE)
+        for i in range(4):
+            numpy.testing.assert_array_equal(frames[i], frame(i))
+
+    def test_wrong_frame(self):
+        sink = sinks.MemmapSink(os.path.join(self.folder, 'frames.npy'), SIZE)
+
+        with self.assertRaises(ValueError):
+            sink.write(numpy.zeros((SHAPE[1], SHAPE[0], 3), dtype=numpy.uint8))
+        sink.release()
+
+
+class TestImageSequenceSink(SinkTestCase):
+
+    def test_every(self):
+        sink = sinks.ImageSequenceSink(self.folder, every=3, pattern='frame%03d.png')
+        for i in range(7):
+            sink.write(frame(i))
+        sink.release()
+
+        self.assertEqual(sink.frames, 7)
+        self.assertListEqual(sorted(os.listdir(self.folder)), ['frame000.png', 'frame003.png', 'frame006.png'])
+
+
+class TestAsyncSink(unittest.TestCase):
+
+    def test_frames_are_copied(self):
+        fake = FakeSink()
+        sink = sinks.AsyncSink(fake, queue_size=2)
+        buffer = numpy.empty(SHAPE, dtype=numpy.uint8)
+        for i in range(10):
+            buffer[:] = i
+            sink.write(buffer)
+        sink.release()
+
+        self.assertTrue(fake.released)
+        self.assertListEqual([int(f[0, 0, 0]) for f in fake.frames], list(range(10)))
+
+    def test_buffer_pool_is_bounded(self):
+        gate = threading.Event()
+        sink = sinks.AsyncSink(FakeSink(gate=gate), queue_size=2)
+        writer = threading.Thread(target=lambda: [sink.write(frame(i)) for i in range(10)], daemon=True)
+        writer.start()
+
+        # writer blocks: sink is stuck on the first frame
+        writer.join(timeout=0.2)
+        self.assertTrue(writer.is_alive())
+        self.assertEqual(sink._buffers, 3)
+
+        gate.set()
+        writer.join(timeout=5)
+        sink.release()
+        self.assertEqual(sink._buffers, 3)
+
+    def test_write_error(self):
+        sink = sinks.AsyncSink(FakeSink(fail_at=2), queue_size=2)
+
+        with self.assertRaises(IOError):
+            for i in range(100):
+                sink.write(frame(i))
+        with self.assertRaises(IOError):
+            sink.release()
+        self.assertTrue(sink.sink.released)
+
+    def test_release_error(self):
+        sink = sinks.AsyncSink(FakeSink(fail_at=1), queue_size=8)
+        sink.write(frame(0))
+        sink.write(frame(1))
+
+        with self.assertRaises(IOError):
+            sink.release()
+
+
+class TestOpenSink(SinkTestCase):
+
+    def test_dispatch(self):
+        self.assertIsInstance(sinks.open_sink(None, SIZE, 25), sinks.NullSink)
+        self.assertIsInstance(sinks.open_sink('null', SIZE, 25), sinks.NullSink)
+
+        sink = sinks.open_sink(os.path.join(self.folder, 'frames.npy'), SIZE, 25)
+        self.assertIsInstance(sink, sinks.MemmapSink)
+        sink.release()
+
+        sink = sinks.open_sink(os.path.join(self.folder, 'images') + '/', SIZE, 25)
+        self.assertIsInstance(sink, sinks.AsyncSink)
+        self.assertIsInstance(sink.sink, sinks.ImageSequenceSink)
+        sink.release()
+
+        sink = sinks.open_sink(self.folder, SIZE, 25, async_=False)
+        self.assertIsInstance(sink, sinks.ImageSequenceSink)
+        self.assertEqual(sink.every, 1)
+
+        sink = sinks.open_sink(os.path.join(self.folder, 'sampled') + '/:3', SIZE, 25, async_=False)
+        self.assertIsInstance(sink, sinks.ImageSequenceSink)
+        self.assertEqual(sink.every, 3)
+        self.assertTrue(os.path.isdir(os.path.join(self.folder, 'sampled')))
+
+        sink = sinks.open_sink(os.path.join(self.folder, 'video.avi'), SIZE, 25, async_=False)
+        self.assertIsInstance(sink, sinks.VideoWriterSink)
+        sink.release()
+
+    def test_sampled_images(self):
+        folder = os.path.join(self.folder, 'sampled')
+        sink = sinks.open_sink(folder + '/:3', SIZE, 25)
+        for i in range(7):
+            sink.write(frame(i))
+        sink.release()
+
+        self.assertListEqual(sorted(os.listdir(folder)), ['frame000000.jpg', 'frame000003.jpg', 'frame000006.jpg'])
+
+    def test_missing_ffmpeg(self):
+        with self.assertRaises(RuntimeError):
+            sinks.FFmpegSink(os.path.join(self.folder, 'video.mp4'), SIZE, 25,
+                             executable='no-such-ffmpeg-executable')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
 import unittest
 
+from alld import polynom2
 from alld import slidingwindow
 
 import numpy
@@ -60,3 +61,52 @@ class TestBinaryImage(unittest.TestCase):
             [50, 0, 50, 8],
             [50, 50, 50, 12]
         ])
+
+    def test_offsets(self):
+
+        # binary image mock (shape 3x3)
+        binary = numpy.array([
+            [1, 0, 2],
+            [0, 0, 0],
+            [3, 4, 0],
+        ])
+
+        binary_image = slidingwindow.BinaryImage(binary)
+
+        self.assertListEqual(list(binary_image.offsets), [0, 2, 2, 4])
+        self.assertEqual(binary_image._x.dtype, numpy.int16)
+
+    def test_slice_poly2(self):
+        rng = numpy.random.RandomState(0)
+        binary = (rng.rand(50, 80) > 0.7).astype(numpy.uint8)
+        poly2 = polynom2.Polynom2(numpy.array([0.01, -0.3, 40.0]))
+
+        binary_image = slidingwindow.BinaryImage(binary)
+
+        slice = binary_image.slice_poly2(poly2, 5)
+
+        ys, xs = binary.nonzero()
+        expected = (xs > poly2(ys) - 5) & (xs < poly2(ys) + 5)
+        self.assertListEqual(list(binary_image.x(slice)), list(xs[expected]))
+        self.assertListEqual(list(binary_image.y(slice)), list(ys[expected]))
+
+    def test_ranges_sum(self):
+
+        # binary image mock (shape 3x4)
+        binary = numpy.array([
+            [1, 0, 3, 4],
+            [5, 0, 7, 8],
+            [9, 10, 11, 12],
+        ])
+
+        binary_image = slidingwindow.BinaryImage(binary)
+
+        sliding_window = slidingwindow.SlidingWindow(
+            x_current=1, y_current=2,
+            height=3, margin=1)
+
+        count, total = binary_image.ranges_sum(*binary_image.window_ranges(sliding_window))
+
+        # x coords: 0, 2 / 0, 2 / 0, 1, 2
+        self.assertEqual(count, 7)
+        self.assertEqual(total, 7)
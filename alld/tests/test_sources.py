@@ -0,0 +1,244 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from udacitylib.video import sources
+
+import cv2
+import numpy
+
+
+SHAPE = (4, 6, 3)
+
+
+class FakeSource:
+    """`frames` frames filled with frame number
+
+    Frame `fail_at` raises IOError, reads of frame `block_at` wait until
+    release. `buffers` counts allocated frame buffers.
+    """
+
+    def __init__(self, frames, fail_at=None, block_at=None):
+        self.frames = frames
+        self.fail_at = fail_at
+        self.block_at = block_at
+        self.properties = sources.VideoProperties(width=float(SHAPE[1]), height=float(SHAPE[0]), fps=25.0)
+        self.buffers = 0
+        self.released = threading.Event()
+        self._next = 0
+
+    def isOpened(self):
+        return self._next < self.frames
+
+    def read(self, image=None):
+        if self._next == self.block_at:
+            self.released.wait()
+        if self._next >= self.frames or self.released.is_set():
+            return False, None
+        if self._next == self.fail_at:
+            raise IOError('read failed')
+        if image is None:
+            self.buffers += 1
+            image = numpy.empty(SHAPE, dtype=numpy.uint8)
+        image[:] = self._next
+        self._next += 1
+        return True, image
+
+    def release(self):
+        self.released.set()
+
+
+def read_all(source, image=None):
+    numbers = []
+    while True:
+        ret, frame = source.read(image)
+        if not ret:
+            return numbers
+        numbers.append(int(frame[0, 0, 0]))
+
+
+def buffered(source, size, policy):
+    """BufferedSource which has read all frames of `source`"""
+    result = sources.BufferedSource(source, size=size, policy=policy)
+    result._thread.join(timeout=5)
+    return result
+
+
+class TestBufferedSource(unittest.TestCase):
+
+    def test_block(self):
+        source = sources.BufferedSource(FakeSource(20), size=2, policy=sources.BLOCK)
+
+        numbers = []
+        while source.isOpened():
+            time.sleep(0.001)
+            ret, frame = source.read()
+            if ret:
+                numbers.append(int(frame[0, 0, 0]))
+        source.release()
+
+        self.assertListEqual(numbers, list(range(20)))
+        self.assertEqual(source.dropped, 0)
+
+    def test_drop_oldest(self):
+        fake = FakeSource(20)
+        source = buffered(fake, 2, sources.DROP_OLDEST)
+
+        self.assertListEqual(read_all(source), [18, 19])
+        self.assertEqual(source.dropped, 18)
+        # buffers of dropped frames are reused
+        self.assertLessEqual(fake.buffers, 3)
+        source.release()
+
+    def test_drop_newest(self):
+        fake = FakeSource(20)
+        source = buffered(fake, 2, sources.DROP_NEWEST)
+
+        self.assertListEqual(read_all(source), [0, 1])
+        self.assertEqual(source.dropped, 18)
+        self.assertLessEqual(fake.buffers, 3)
+        source.release()
+
+    def test_read_into_image(self):
+        source = buffered(FakeSource(3), 3, sources.BLOCK)
+        image = numpy.zeros(SHAPE, dtype=numpy.uint8)
+
+        ret, frame = source.read(image)
+
+        self.assertTrue(ret)
+        self.assertIs(frame, image)
+        self.assertEqual(frame[0, 0, 0], 0)
+        # queued buffer is free again
+        self.assertEqual(len(source._free), 1)
+        self.assertListEqual(read_all(source, image), [1, 2])
+        source.release()
+
+    def test_error_is_raised_after_queued_frames(self):
+        source = buffered(FakeSource(10, fail_at=3), 5, sources.BLOCK)
+
+        for i in range(3):
+            ret, frame = source.read()
+            self.assertTrue(ret)
+            self.assertEqual(frame[0, 0, 0], i)
+        with self.assertRaises(IOError):
+            source.read()
+        source.release()
+
+    def test_eof(self):
+        source = buffered(FakeSource(0), 2, sources.BLOCK)
+
+        self.assertFalse(source.isOpened())
+        self.assertEqual(source.read(), (False, None))
+        source.release()
+
+    def test_release_does_not_hang_on_blocked_read(self):
+        fake = FakeSource(10, block_at=2)
+        source = sources.BufferedSource(fake, size=1, policy=sources.BLOCK)
+        time.sleep(0.05)
+
+        start = time.perf_counter()
+        source.release(timeout=0.2)
+
+        self.assertLess(time.perf_counter() - start, 2)
+        self.assertTrue(fake.released.is_set())
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            sources.BufferedSource(FakeSource(1), policy='unknown')
+
+
+class TestRawSource(unittest.TestCase):
+
+    def test_frames(self):
+        frames = [numpy.full(SHAPE, i, dtype=numpy.uint8) for i in range(3)]
+        # the last frame is partial
+        stream = io.BytesIO(b''.join(frame.tobytes() for frame in frames)[:-1])
+        source = sources.RawSource(stream, SHAPE[1], SHAPE[0])
+        image = numpy.empty(SHAPE, dtype=numpy.uint8)
+
+        ret, frame = source.read(image)
+        self.assertTrue(ret)
+        self.assertIs(frame, image)
+        numpy.testing.assert_array_equal(frame, frames[0])
+        self.assertListEqual(read_all(source), [1])
+        self.assertFalse(source.isOpened())
+
+
+class TestImageDirectorySource(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        for i in (2, 0, 1):
+            cv2.imwrite(os.path.join(self.folder, 'frame%d.png' % i), numpy.full(SHAPE, i, dtype=numpy.uint8))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_open_folder(self):
+        cv2.imwrite(os.path.join(self.folder, 'frame.jpg'), numpy.zeros(SHAPE, dtype=numpy.uint8))
+
+        source = sources.open_source(self.folder)
+
+        self.assertIsInstance(source, sources.ImageDirectorySource)
+        self.assertEqual(source.properties.width, SHAPE[1])
+        self.assertEqual(source.properties.height, SHAPE[0])
+        self.assertListEqual(read_all(source), [0])
+
+    def test_png(self):
+        source = sources.ImageDirectorySource(self.folder, pattern='*.png')
+
+        self.assertListEqual(read_all(source), [0, 1, 2])
+
+    def test_empty_folder(self):
+        with self.assertRaises(ValueError):
+            sources.ImageDirectorySource(self.folder)
+
+
+class TestOpenSource(unittest.TestCase):
+
+    def test_raw_frames_require_size(self):
+        with self.assertRaises(ValueError):
+            sources.open_source('-')
+
+    def open_stdin(self, frames, **kwargs):
+        stdin = mock.Mock(buffer=io.BytesIO(bytes(frames * 6 * 4 * 3)))
+        with mock.patch('sys.stdin', stdin):
+            return sources.open_source('-', frame_size=(6, 4), **kwargs)
+
+    def test_live_sources_are_buffered(self):
+        source = self.open_stdin(3)
+        try:
+            self.assertIsInstance(source, sources.BufferedSource)
+            self.assertEqual(source.policy, sources.DROP_OLDEST)
+            self.assertEqual(source.size, 2)
+        finally:
+            source.release()
+
+        with mock.patch('udacitylib.video.sources.CaptureSource', FakeSource):
+            source = sources.open_source('3', policy=sources.BLOCK, queue_size=5)
+        try:
+            self.assertIsInstance(source, sources.BufferedSource)
+            self.assertEqual(source.policy, sources.BLOCK)
+            self.assertEqual(source.size, 5)
+            self.assertEqual(read_all(source), [0, 1, 2])
+        finally:
+            source.release()
+
+    def test_not_buffered(self):
+        source = self.open_stdin(3, policy=None)
+
+        self.assertIsInstance(source, sources.RawSource)
+        self.assertEqual(len(read_all(source)), 3)
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            sources.open_source('-', frame_size=(6, 4), policy='drop_all')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import unittest
+
+from alld import thresholds
+
+import cv2
+import numpy
+
+
+class TestGradients(unittest.TestCase):
+
+    def setUp(self):
+        rng = numpy.random.RandomState(0)
+        self.gray = rng.randint(0, 255, (60, 80)).astype(numpy.uint8)
+
+    def test_sobel_is_shared(self):
+        gradients = thresholds.Gradients(self.gray)
+
+        sobel = gradients.sobel(3)
+
+        self.assertIs(gradients.sobel(3), sobel)
+        self.assertEqual(sobel[0].dtype, numpy.float32)
+
+    def test_scaled_sobel(self):
+        abs_sobel = numpy.absolute(cv2.Sobel(self.gray, cv2.CV_64F, 1, 0))
+        expected = numpy.uint8(255 * abs_sobel / numpy.max(abs_sobel))
+
+        actual = thresholds.scaled_sobel(self.gray, thresholds.Direction.X)
+
+        self.assertLessEqual(numpy.abs(actual.astype(int) - expected).max(), 1)
+
+    def test_magnitude(self):
+        sobelx = cv2.Sobel(self.gray, cv2.CV_64F, 1, 0, ksize=3)
+        sobely = cv2.Sobel(self.gray, cv2.CV_64F, 0, 1, ksize=3)
+        gradmag = numpy.sqrt(sobelx ** 2 + sobely ** 2)
+        expected = (gradmag / (numpy.max(gradmag) / 255)).astype(numpy.uint8)
+
+        actual = thresholds.MagSobelThreshold(0, 255, 3).core(self.gray)
+
+        self.assertLessEqual(numpy.abs(actual.astype(int) - expected).max(), 1)
+
+    def test_direction(self):
+        sobelx = cv2.Sobel(self.gray, cv2.CV_64F, 1, 0, ksize=5)
+        sobely = cv2.Sobel(self.gray, cv2.CV_64F, 0, 1, ksize=5)
+        expected = numpy.arctan2(numpy.absolute(sobely), numpy.absolute(sobelx))
+
+        actual = thresholds.DirectionThreshold(0, numpy.pi / 2, 5).core(self.gray)
+
+        # cv2.cartToPolar precision is about 0.3 degrees
+        self.assertLess(numpy.abs(actual - expected).max(), 0.01)
+
+
+class TestPlan(unittest.TestCase):
+
+    def setUp(self):
+        rng = numpy.random.RandomState(0)
+        self.image = rng.randint(0, 255, (40, 60, 3)).astype(numpy.uint8)
+        self.th_op = thresholds.Thresholds(
+            thresholds.HLSThreshold('h', 20, 40, thresholds.HLSThreshold.H),
+            thresholds.HLSThreshold('s', 120, 255, thresholds.HLSThreshold.S),
+            thresholds.HLSThreshold('l', 200, 255, thresholds.HLSThreshold.L),
+            thresholds.AbsSobelXThreshold(10, 120),
+        )
+
+    def test_same_as_binaries(self):
+        op = thresholds.op
+        plan = self.th_op.compile((op('h') & op('s')) | ~op('l') & op('sobelx'))
+
+        binaries = self.th_op(self.image)
+        expected = ((binaries['h'] == 1) & (binaries['s'] == 1)) | (binaries['l'] == 0) & (binaries['sobelx'] == 1)
+
+        actual = plan(self.image)
+
+        self.assertEqual(actual.dtype, numpy.uint8)
+        self.assertListEqual(actual.ravel().tolist(), expected.astype(numpy.uint8).ravel().tolist())
+
+    def test_evaluates_only_used_thresholds(self):
+        op = thresholds.op
+        plan = self.th_op.compile(op('h') | op('h') & op('s'))
+
+        self.assertEqual(plan.colorspaces, frozenset([thresholds.Colorspace.HLS]))
+        self.assertEqual(len([step for step in plan._steps if step[0] == 'op']), 2)
+
+    def test_unknown_threshold(self):
+        with self.assertRaises(KeyError):
+            self.th_op.compile(thresholds.op('unknown'))
+
+    def test_regions(self):
+        th_op = thresholds.Thresholds(
+            thresholds.HLSThreshold('s', 120, 255, thresholds.HLSThreshold.S),
+            thresholds.AbsSobelXThreshold(10, 120),
+            thresholds.MagSobelThreshold(5, 150, 3),
+            thresholds.DirectionThreshold(0.4, 1.2, 5),
+        )
+        op = thresholds.op
+        plan = th_op.compile(op('s') | op('sobelx') | op('mag') & op('dir'))
+        halo = plan.halo
+
+        expected = plan(self.image)
+
+        # two regions split by column 30 (crops include halo)
+        left, right = plan.regions([self.image[:, :30 + halo], self.image[:, 30 - halo:]])
+
+        self.assertEqual(halo, 2)
+        self.assertTrue((left[:, :30] == expected[:, :30]).all())
+        self.assertTrue((right[:, halo:] == expected[:, 30:]).all())
+
+    def test_regions_use_maxima_of_full_image(self):
+        th_op = thresholds.Thresholds(
+            thresholds.AbsSobelXThreshold(10, 120),
+            thresholds.MagSobelThreshold(5, 150, 3),
+        )
+        op = thresholds.op
+        plan = th_op.compile(op('sobelx') | op('mag'))
+        halo = plan.halo
+        image = self.image.copy()
+        # strongest gradients are outside the band
+        image[:, 50:] = 0
+        image[:, 55:] = 255
+
+        expected = plan(image)
+        band, = plan.regions([image[10 - halo:30 + halo, 10 - halo:30 + halo]], image.shape)
+
+        self.assertTrue((band[halo:-halo, halo:-halo] == expected[10:30, 10:30]).all())
+        # without full image maxima gradients are rescaled by band maxima
+        band, = th_op.compile(op('sobelx') | op('mag')).regions([image[10 - halo:30 + halo, 10 - halo:30 + halo]])
+        self.assertFalse((band[halo:-halo, halo:-halo] == expected[10:30, 10:30]).all())
+
+    def test_region_buffers_are_reused(self):
+        th_op = thresholds.Thresholds(
+            thresholds.AbsSobelXThreshold(10, 120),
+            thresholds.MagSobelThreshold(5, 150, 3),
+        )
+        op = thresholds.op
+        plan = th_op.compile(op('sobelx') | op('mag'))
+        expected = [plan.regions([self.image[:40, :50]])[0].copy(), plan.regions([self.image[:20, :30]])[0].copy()]
+
+        large, = plan.regions([self.image[:40, :50]])
+        small, = plan.regions([self.image[:20, :30]])
+
+        # smaller region reuses storage of the larger one
+        self.assertTrue(numpy.shares_memory(large, small))
+        numpy.testing.assert_array_equal(small, expected[1])
+        large, = plan.regions([self.image[:40, :50]])
+        numpy.testing.assert_array_equal(large, expected[0])
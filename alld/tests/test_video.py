@@ -0,0 +1,159 @@
+import threading
+import unittest
+
+from udacitylib import video
+from udacitylib.video.sources import VideoProperties
+
+import numpy
+
+
+SHAPE = (4, 6, 3)
+
+
+class FakeSource:
+    """Frames filled with frame number, `fail_at` frame raises"""
+
+    def __init__(self, frames, fail_at=None):
+        self.frames = frames
+        self.fail_at = fail_at
+        self.properties = VideoProperties(width=float(SHAPE[1]), height=float(SHAPE[0]), fps=25.0)
+        self.released = False
+        self._next = 0
+
+    def isOpened(self):
+        return self._next < self.frames
+
+    def read(self, image=None):
+        if self._next >= self.frames:
+            return False, None
+        if self._next == self.fail_at:
+            raise IOError('decode failed')
+        if image is None:
+            image = numpy.empty(SHAPE, dtype=numpy.uint8)
+        image[:] = self._next
+        self._next += 1
+        return True, image
+
+    def release(self):
+        self.released = True
+
+
+class FakeSink:
+
+    def __init__(self, fail_at=None, fail_release=False):
+        self.frames = []
+        self.fail_at = fail_at
+        self.fail_release = fail_release
+        self.released = False
+
+    def write(self, frame):
+        if len(self.frames) == self.fail_at:
+            raise IOError('encode failed')
+        self.frames.append(frame.copy())
+
+    def release(self):
+        self.released = True
+        if self.fail_release:
+            raise IOError('release failed')
+
+
+class FakePipeline:
+
+    def __init__(self, fail_at=None):
+        self.fail_at = fail_at
+        self.frames = 0
+
+    def __call__(self, frame):
+        if self.frames == self.fail_at:
+            raise ValueError('process failed')
+        self.frames += 1
+        # new frame: input buffers are reused by convert
+        return frame + 1
+
+
+def numbers(sink):
+    return [int(frame[0, 0, 0]) for frame in sink.frames]
+
+
+class TestConvert(unittest.TestCase):
+
+    def convert(self, threaded, source=None, pipeline=None, sink=None):
+        source = source or FakeSource(50)
+        sink = sink or FakeSink()
+        stats = video.convert(source, pipeline or FakePipeline(), sink, threaded=threaded, queue_size=2)
+        return stats, sink
+
+    def test_sequential(self):
+        stats, sink = self.convert(threaded=False)
+
+        self.assertEqual(stats.frames, 50)
+        self.assertListEqual(numbers(sink), list(range(1, 51)))
+
+    def test_threaded_keeps_order(self):
+        stats, sink = self.convert(threaded=True)
+        _, expected = self.convert(threaded=False)
+
+        self.assertEqual(stats.frames, 50)
+        self.assertListEqual(numbers(sink), numbers(expected))
+        for frame, expected_frame in zip(sink.frames, expected.frames):
+            numpy.testing.assert_array_equal(frame, expected_frame)
+
+    def test_null_sink(self):
+        stats = video.convert(FakeSource(5), FakePipeline(), None, threaded=True)
+
+        self.assertEqual(stats.frames, 5)
+
+    def assert_raises_without_deadlock(self, error, **kwargs):
+        source = kwargs.setdefault('source', FakeSource(50))
+        sink = kwargs.setdefault('sink', FakeSink())
+        result = []
+
+        def run():
+            try:
+                self.convert(threaded=True, **kwargs)
+            except Exception as e:
+                result.append(e)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        thread.join(timeout=10)
+        self.assertFalse(thread.is_alive(), 'convert is deadlocked')
+        self.assertEqual(len(result), 1)
+        self.assertIsInstance(result[0], error)
+        self.assertTrue(source.released)
+        self.assertTrue(sink.released)
+
+    def test_threaded_decode_error(self):
+        self.assert_raises_without_deadlock(IOError, source=FakeSource(50, fail_at=10))
+
+    def test_threaded_process_error(self):
+        self.assert_raises_without_deadlock(ValueError, pipeline=FakePipeline(fail_at=10))
+
+    def test_threaded_encode_error(self):
+        self.assert_raises_without_deadlock(IOError, sink=FakeSink(fail_at=10))
+
+    def test_sink_error_does_not_hide_process_error(self):
+        for threaded in (False, True):
+            with self.subTest(threaded=threaded):
+                sink = FakeSink(fail_release=True)
+                with self.assertRaises(ValueError):
+                    self.convert(threaded, pipeline=FakePipeline(fail_at=3), sink=sink)
+                self.assertTrue(sink.released)
+
+    def test_sink_error_is_raised(self):
+        with self.assertRaises(IOError):
+            self.convert(False, sink=FakeSink(fail_release=True))
+
+
+class TestStageStats(unittest.TestCase):
+
+    def test_utilisation(self):
+        stats = video.StageStats(frames=10, wall=2.0, decode=1.0, process=2.0, encode=0.5)
+
+        self.assertEqual(stats.fps, 5.0)
+        self.assertEqual(stats.utilisation('decode'), 0.5)
+        self.assertEqual(stats.utilisation('encode'), 0.25)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+
+from alld import perspective
+from alld import polynom2
+from alld import visual
+
+import cv2
+import numpy
+
+
+def _perspective():
+    a1 = perspective.Pair(src=(580, 460), dst=(260, 0))
+    a2 = perspective.Pair(src=(700, 460), dst=(1040, 0))
+    a3 = perspective.Pair(src=(1040, 680), dst=(1040, 780))
+    a4 = perspective.Pair(src=(260, 680), dst=(260, 780))
+    return perspective.Perspective(a1, a2, a3, a4)
+
+
+class TestOverlayLane(unittest.TestCase):
+
+    def setUp(self):
+        rng = numpy.random.RandomState(0)
+        self.image = rng.randint(0, 200, (720, 1280, 3)).astype(numpy.uint8)
+        ploty = numpy.linspace(0, 719, 720)
+        left = polynom2.Polynom2(numpy.array([1e-4, -0.1, 300.0]))
+        right = polynom2.Polynom2(numpy.array([1e-4, -0.1, 1000.0]))
+        self.lanepoly = visual.lanepoly(ploty, left, right)
+        self.persp = _perspective()
+
+    def test_same_as_full_frame_unwarp(self):
+        laneimg = numpy.zeros_like(self.image)
+        cv2.fillPoly(laneimg, numpy.int_([self.lanepoly]), (0, 255, 0))
+        expected = cv2.addWeighted(self.image, 1, self.persp.unwarp(laneimg), 0.3, 0).astype(int)
+
+        image = self.image.copy()
+        actual = visual.overlay_lane(image, self.lanepoly, self.persp.backmtx, self.image.shape)
+
+        self.assertIs(actual, image)
+        diff = numpy.abs(actual.astype(int) - expected)
+        # polygon edges are rasterized differently
+        self.assertLess((diff > 3).mean(), 0.005)
+
+    def test_outside_of_image(self):
+        lanepoly = self.lanepoly.copy()
+        lanepoly[..., 0] += 5000
+
+        image = self.image.copy()
+        visual.overlay_lane(image, lanepoly, self.persp.backmtx, self.image.shape)
+
+        numpy.testing.assert_array_equal(image, self.image)
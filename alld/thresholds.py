@@ -1,8 +1,12 @@
 """Module to create a thresholded binary image"""
 
+from alld import arena as arena_
 from alld import colorspace
+from alld import instrumentation
 
 import abc
+import collections
+
 import cv2
 import numpy as np
 
@@ -11,6 +15,7 @@ class Colorspace:
     RGB = 0
     HLS = 1
     GRAY = 2
+    GRADIENTS = 3  # alld.thresholds.Gradients of grayscaled image
 
 
 class Threshold(abc.ABC):
@@ -26,15 +31,21 @@ class Threshold(abc.ABC):
     def core(self, image):
         pass
 
+    def _in_range(self, candidate, out=None):
+        return cv2.inRange(candidate, self.min, self.max, dst=out)
+
     def filter_(self, candidate):
-        """Create binary image by 'candidate'"""
-        binary_output = np.zeros_like(candidate)
-        binary_output[(candidate >= self.min) & (candidate <= self.max)] = 1
-        return binary_output
+        """Create binary image (0 or 1) by 'candidate'"""
+        binary_output = self._in_range(candidate)
+        return np.minimum(binary_output, 1, out=binary_output)
+
+    def mask(self, image, out=None):
+        """Create uint8 mask (0 or 255) by `image`"""
+        return self._in_range(self.core(image), out)
 
     def __call__(self, image):
-        candidate = self.core(image)
-        return self.filter_(candidate)
+        binary_output = self.mask(image)
+        return np.minimum(binary_output, 1, out=binary_output)
 
 
 class Direction:
@@ -42,19 +53,128 @@ class Direction:
     Y = 2
 
 
+def _scale_to_uint8(image, max_value, out=None, tmp=None):
+    """Rescale non-negative float image to 8 bit integer (0 .. 255)
+
+    `out` (uint8) and `tmp` (float32) are optional buffers of image shape.
+    """
+    if out is None:
+        out = np.empty(image.shape, dtype=np.uint8)
+    if max_value <= 0:
+        out.fill(0)
+        return out
+    tmp = np.multiply(image, np.float32(255 / max_value), out=tmp)
+    # truncates as astype(np.uint8)
+    out[...] = tmp
+    return out
+
+
+class Gradients:
+    """Per-frame bundle of float32 Sobel gradients
+
+    Sobel passes, magnitude and direction are computed once per kernel size
+    and shared by all gradient thresholds applied to the same gray image.
+
+    `maxima` maps scale keys (see `maximum`) to values used to rescale
+    gradients to 8 bit. Missing maxima are calculated over the image.
+
+    If `arena` (alld.arena.Arena) is set images are written into its buffers.
+    """
+
+    def __init__(self, gray_image, arena=None):
+        self.gray = gray_image
+        self.maxima = {}
+        self.arena = arena
+        self._cache = {}
+
+    def _buffer(self, name, dtype=np.float32):
+        return arena_.get(self.arena, 'gradients.' + name, self.gray.shape, dtype)
+
+    def _cached(self, key, fn):
+        if key not in self._cache:
+            self._cache[key] = fn()
+        return self._cache[key]
+
+    def sobel(self, ksize=3):
+        """Return (sobelx, sobely) float32 images"""
+        return self._cached(('sobel', ksize), lambda: (
+            cv2.Sobel(self.gray, cv2.CV_32F, 1, 0, ksize=ksize, dst=self._buffer('sobelx%d' % ksize)),
+            cv2.Sobel(self.gray, cv2.CV_32F, 0, 1, ksize=ksize, dst=self._buffer('sobely%d' % ksize)),
+        ))
+
+    def abs_sobel(self, direction, ksize=3):
+        """Absolute Sobel (float32)"""
+        def abs_sobel():
+            sobelx, sobely = self.sobel(ksize)
+            out = self._buffer('abs_sobel%d_%d' % (direction, ksize))
+            return np.absolute(sobelx if direction == Direction.X else sobely, out=out)
+        return self._cached(('abs_sobel', direction, ksize), abs_sobel)
+
+    def polar(self, ksize=3):
+        """Return (magnitude, direction) float32 images
+
+        Direction is an angle of absolute gradient in [0, pi / 2].
+        """
+        def polar():
+            abs_sobelx = self.abs_sobel(Direction.X, ksize)
+            abs_sobely = self.abs_sobel(Direction.Y, ksize)
+            return cv2.cartToPolar(abs_sobelx, abs_sobely,
+                                   magnitude=self._buffer('magnitude%d' % ksize),
+                                   angle=self._buffer('direction%d' % ksize))
+        return self._cached(('polar', ksize), polar)
+
+    def magnitude(self, ksize=3):
+        """Gradient magnitude (float32)"""
+        magnitude, _ = self.polar(ksize)
+        return magnitude
+
+    def maximum(self, key):
+        """Max value of image described by scale key
+
+        Scale key is a tuple (method name, *arguments), e.g. ('magnitude', 3).
+        """
+        image = getattr(self, key[0])(*key[1:])
+        _, max_value, _, _ = cv2.minMaxLoc(image)
+        return max_value
+
+    def _scaled(self, key):
+        if key not in self.maxima:
+            self.maxima[key] = self.maximum(key)
+        name = 'scaled_' + '_'.join(str(k) for k in key)
+        return _scale_to_uint8(getattr(self, key[0])(*key[1:]), self.maxima[key],
+                               self._buffer(name, np.uint8), self._buffer('scale_tmp'))
+
+    def scaled_sobel(self, direction, ksize=3):
+        """Absolute Sobel rescaled to 8 bit integer"""
+        key = ('abs_sobel', direction, ksize)
+        return self._cached(('scaled',) + key, lambda: self._scaled(key))
+
+    def scaled_magnitude(self, ksize=3):
+        """Gradient magnitude rescaled to 8 bit integer"""
+        key = ('magnitude', ksize)
+        return self._cached(('scaled',) + key, lambda: self._scaled(key))
+
+    def direction(self, ksize=3):
+        """Absolute gradient direction in radians"""
+        _, direction = self.polar(ksize)
+        return direction
+
+
+def as_gradients(image):
+    """Wrap gray image into Gradients (Gradients are returned as is)"""
+    if isinstance(image, Gradients):
+        return image
+    return Gradients(image)
+
+
 def scaled_sobel(gray_image, direction):
     """Calculate absolute scaled cv2.Sobel
     
-    Applies (HEIGHT, WIDTH, CHANNELS) image.
+    Applies (HEIGHT, WIDTH) gray image.
     
     Returns (HEIGHT, WIDTH) matrix.    
     """
-    if direction == Direction.X:
-        abs_sobel = np.absolute(cv2.Sobel(gray_image, cv2.CV_64F, 1, 0))
-    else:
-        abs_sobel = np.absolute(cv2.Sobel(gray_image, cv2.CV_64F, 0, 1))
-    # Rescale back to 8 bit integer
-    return np.uint8(255 * abs_sobel / np.max(abs_sobel))
+    return Gradients(gray_image).scaled_sobel(direction)
 
 
 class GrayscaleThreshold(Threshold):
@@ -62,25 +182,40 @@ class GrayscaleThreshold(Threshold):
     COLORSPACE = Colorspace.GRAY
 
 
-class AbsSobelXThreshold(GrayscaleThreshold):
+class GradientThreshold(Threshold):
+    """Applies Gradients (or grayscaled image)"""
+
+    COLORSPACE = Colorspace.GRADIENTS
+
+    @property
+    def scale_key(self):
+        """Gradients scale key of rescaled candidate (None if it is not rescaled)"""
+        return None
+
+
+class AbsSobelXThreshold(GradientThreshold):
     """Applies grayscaled image and returns binary image (Direction.X)"""
 
     NAME = 'sobelx'
 
+    scale_key = ('abs_sobel', Direction.X, 3)
+
     def core(self, gray_image):
-        return scaled_sobel(gray_image, Direction.X)
+        return as_gradients(gray_image).scaled_sobel(Direction.X)
 
 
-class AbsSobelYThreshold(GrayscaleThreshold):
+class AbsSobelYThreshold(GradientThreshold):
     """Applies grayscaled image and returns binary image (Direction.Y)"""
 
     NAME = 'sobely'
 
+    scale_key = ('abs_sobel', Direction.Y, 3)
+
     def core(self, gray_image):
-        return scaled_sobel(gray_image, Direction.Y)
+        return as_gradients(gray_image).scaled_sobel(Direction.Y)
 
 
-class MagSobelThreshold(GrayscaleThreshold):
+class MagSobelThreshold(GradientThreshold):
     """Applies grayscaled image and returns binary image (magnitude)"""
 
     NAME = 'mag'
@@ -89,16 +224,15 @@ class MagSobelThreshold(GrayscaleThreshold):
         super().__init__(min, max)
         self.kernel_size = kernel_size
 
+    @property
+    def scale_key(self):
+        return ('magnitude', self.kernel_size)
+
     def core(self, gray_image):
-        sobelx = np.absolute(cv2.Sobel(gray_image, cv2.CV_64F, 1, 0, ksize=self.kernel_size))
-        sobely = np.absolute(cv2.Sobel(gray_image, cv2.CV_64F, 0, 1, ksize=self.kernel_size))
-        gradmag = np.sqrt(sobelx ** 2 + sobely ** 2)
-        scale_factor = np.max(gradmag) / 255
-        gradmag = (gradmag / scale_factor).astype(np.uint8)
-        return gradmag
+        return as_gradients(gray_image).scaled_magnitude(self.kernel_size)
 
 
-class DirectionThreshold(GrayscaleThreshold):
+class DirectionThreshold(GradientThreshold):
 
     NAME = 'dir'
 
@@ -107,10 +241,7 @@ class DirectionThreshold(GrayscaleThreshold):
         self.kernel_size = kernel_size
 
     def core(self, gray_image):
-        sobelx = cv2.Sobel(gray_image, cv2.CV_64F, 1, 0, ksize=self.kernel_size)
-        sobely = cv2.Sobel(gray_image, cv2.CV_64F, 0, 1, ksize=self.kernel_size)
-        absgraddir = np.arctan2(np.absolute(sobely), np.absolute(sobelx))
-        return absgraddir
+        return as_gradients(gray_image).direction(self.kernel_size)
 
 
 class HLSThreshold(Threshold):
@@ -130,39 +261,257 @@ class HLSThreshold(Threshold):
     def core(self, image):
         return image[:, :, self.channel]
 
+    def mask(self, image, out=None):
+        """Select `channel` range directly on HLS image (no channel copy)"""
+        lower = np.zeros(3)
+        upper = np.full(3, 255.0)
+        lower[self.channel] = self.min
+        upper[self.channel] = self.max
+        return cv2.inRange(image, lower, upper, dst=out)
+
+
+class Expression:
+    """Node of threshold expression
+
+    Expressions are combined with `&`, `|` and `~`:
+
+      (op('sobelx') | op('mag') & op('dir')) | op('white_l')
+
+    and compiled into a Plan by Thresholds.compile.
+    """
+
+    def __and__(self, other):
+        return _Node('and', self, other)
+
+    def __or__(self, other):
+        return _Node('or', self, other)
+
+    def __invert__(self):
+        return _Node('not', self)
+
+
+class Op(Expression):
+    """Reference to a threshold by its NAME"""
+
+    def __init__(self, name):
+        self.name = name
+
+    @property
+    def key(self):
+        return ('op', self.name)
+
+    @property
+    def children(self):
+        return ()
+
+
+class _Node(Expression):
+
+    def __init__(self, kind, *children):
+        self.kind = kind
+        self.children = children
+
+    @property
+    def key(self):
+        return (self.kind,) + tuple(child.key for child in self.children)
+
+
+def op(name):
+    """syntax sugar: thresholds.Op(name)"""
+    return Op(name)
+
+
+class Plan:
+    """Compiled threshold expression
+
+    Evaluates only thresholds used by the expression. Color conversions and
+    common subexpressions are computed once, masks are written into uint8
+    buffers preallocated per image shape and reused between frames.
+
+    Plan(image) returns binary image (0 or 1).
+
+    `maxima` keeps gradient maxima of the last evaluated image of each size,
+    `regions` rescales gradients by them (see `regions`).
+    """
+
+    def __init__(self, thresholds, expression):
+        self._thresholds = thresholds
+        # {(height, width): {scale key: max value}}
+        self.maxima = {}
+        # steps: (kind, filter, input registers or stage name, output register)
+        self._steps = []
+        self._nregisters = 0
+        self._buffers = {}
+        # (registers, pixels) storage of each region of `regions` (grows to the largest region)
+        self._region_storage = []
+
+        uses = collections.Counter()
+        self._count_uses(expression, uses, set())
+        free = []
+        registers = {}
+
+        def emit(node):
+            if node.key in registers:
+                return registers[node.key]
+            inputs = [emit(child) for child in node.children]
+            for child in node.children:
+                uses[child.key] -= 1
+                if uses[child.key] == 0:
+                    free.append(registers[child.key])
+            if free:
+                out = free.pop()
+            else:
+                out = self._nregisters
+                self._nregisters += 1
+            if isinstance(node, Op):
+                self._steps.append(('op', thresholds.filter_by_name(node.name), 'thresholds.' + node.name, out))
+            else:
+                self._steps.append((node.kind, None, tuple(inputs), out))
+            registers[node.key] = out
+            return out
+
+        self._result = emit(expression)
+        filters = [filter_ for kind, filter_, _, _ in self._steps if kind == 'op']
+        self.colorspaces = frozenset(filter_.COLORSPACE for filter_ in filters)
+        self._scale_keys = [filter_.scale_key for filter_ in filters
+                            if filter_.COLORSPACE == Colorspace.GRADIENTS and filter_.scale_key]
+        # pixels around region which affect region result (Sobel kernels)
+        self.halo = max([getattr(filter_, 'kernel_size', 3) // 2 for filter_ in filters
+                         if filter_.COLORSPACE == Colorspace.GRADIENTS] or [0])
+
+    def _count_uses(self, node, uses, seen):
+        uses[node.key] += 1
+        if node.key in seen:
+            return
+        seen.add(node.key)
+        for child in node.children:
+            self._count_uses(child, uses, seen)
+
+    def buffers(self, shape):
+        """Return uint8 buffers for `shape` images (cached)"""
+        size = tuple(shape[:2])
+        if size not in self._buffers:
+            self._buffers[size] = [np.empty(size, dtype=np.uint8) for _ in range(self._nregisters)]
+        return self._buffers[size]
+
+    def region_buffers(self, index, shape):
+        """Return uint8 buffers for `shape` region `index` of `regions`
+
+        Regions change shape between frames, so buffers are views of one
+        storage per region index reallocated only for larger regions.
+        """
+        size = shape[0] * shape[1]
+        while len(self._region_storage) <= index:
+            self._region_storage.append(None)
+        storage = self._region_storage[index]
+        if storage is None or storage.shape[1] < size:
+            storage = self._region_storage[index] = np.empty((self._nregisters, size), dtype=np.uint8)
+        return [storage[i, :size].reshape(shape[:2]) for i in range(self._nregisters)]
+
+    def __call__(self, image, out=None):
+        timer = self._thresholds.timer
+        with timer('thresholds.colorspace'):
+            inputs = self._thresholds.inputs(image, self.colorspaces, self._thresholds.arena)
+        result = self._evaluate(inputs, self.buffers(image.shape))
+        if self._scale_keys:
+            self.maxima[tuple(image.shape[:2])] = dict(inputs[Colorspace.GRADIENTS].maxima)
+        return np.minimum(result, 1, out=out)
+
+    def regions(self, images, shape=None):
+        """Evaluate plan on several regions (crops) of one `shape` image
+
+        Gradients are rescaled to 8 bit by maxima of the last evaluated
+        image of `shape`, so regions select the same pixels as the whole
+        image. If there is no such image maxima are taken over all regions.
+        Crops should include `halo` pixels around region of interest.
+
+        Returns a list of binary images (0 or 1), they are overwritten by
+        the next call.
+        """
+        timer = self._thresholds.timer
+        with timer('thresholds.colorspace'):
+            inputs = [self._thresholds.inputs(image, self.colorspaces) for image in images]
+        if self._scale_keys:
+            maxima = {}
+            if shape is not None:
+                maxima.update(self.maxima.get(tuple(shape[:2]), {}))
+            for key in self._scale_keys:
+                if key not in maxima:
+                    maxima[key] = max([region[Colorspace.GRADIENTS].maximum(key) for region in inputs] or [0])
+            for region in inputs:
+                region[Colorspace.GRADIENTS].maxima = maxima
+        results = []
+        for i, (region, image) in enumerate(zip(inputs, images)):
+            result = self._evaluate(region, self.region_buffers(i, image.shape))
+            results.append(np.minimum(result, 1, out=result))
+        return results
+
+    def _evaluate(self, inputs, buffers):
+        timer = self._thresholds.timer
+        for kind, filter_, args, dst in self._steps:
+            if kind == 'op':
+                with timer(args):
+                    filter_.mask(inputs[filter_.COLORSPACE], buffers[dst])
+            elif kind == 'and':
+                cv2.bitwise_and(buffers[args[0]], buffers[args[1]], dst=buffers[dst])
+            elif kind == 'or':
+                cv2.bitwise_or(buffers[args[0]], buffers[args[1]], dst=buffers[dst])
+            else:
+                cv2.bitwise_not(buffers[args[0]], dst=buffers[dst])
+        return buffers[self._result]
+
 
 class Thresholds:
 
-    def __init__(self, *filters):
+    def __init__(self, *filters, timer=instrumentation.NULL, arena=None):
         self._filters = []
         self._filters.extend(filters)
+        # alld.instrumentation recorder
+        self.timer = timer
+        # alld.arena.Arena for color conversions and gradients of compiled plans
+        self.arena = arena
+
+    def filter_by_name(self, name):
+        for filter_ in self._filters:
+            if filter_.NAME == name:
+                return filter_
+        raise KeyError('unknown threshold: %s' % name)
+
+    def inputs(self, image, colorspaces=None, arena=None):
+        """Return {colorspace => converted image} for `colorspaces` (all by default)
+
+        Images are written into buffers of `arena` if it is set.
+        """
+        if colorspaces is None:
+            colorspaces = {filter_.COLORSPACE for filter_ in self._filters}
+        inputs = {Colorspace.RGB: image}
+        if Colorspace.HLS in colorspaces:
+            hls = None if arena is None else arena.get('hls', image.shape)
+            inputs[Colorspace.HLS] = colorspace.bgr2hls(image, hls)
+        if Colorspace.GRAY in colorspaces or Colorspace.GRADIENTS in colorspaces:
+            gray = None if arena is None else arena.get('gray', image.shape[:2])
+            gray = colorspace.bgr2gray(image, gray)
+            inputs[Colorspace.GRAY] = gray
+            inputs[Colorspace.GRADIENTS] = Gradients(gray, arena)
+        return inputs
+
+    def compile(self, expression):
+        """Compile threshold expression (see Expression) into Plan"""
+        return Plan(self, expression)
 
     def cores(self, image):
-        gray = colorspace.bgr2gray(image)
-        hls = colorspace.bgr2hls(image)
+        inputs = self.inputs(image)
         binaries = {}
         for filter_ in self._filters:
-            if filter_.COLORSPACE == Colorspace.GRAY:
-                binary = filter_.core(gray)
-            elif filter_.COLORSPACE == Colorspace.HLS:
-                binary = filter_.core(hls)
-            else:
-                binary = filter_.core(image)
-            binaries[filter_.NAME] = binary
+            binaries[filter_.NAME] = filter_.core(inputs[filter_.COLORSPACE])
         return binaries
 
     def __call__(self, image):
-        gray = colorspace.bgr2gray(image)
-        hls = colorspace.bgr2hls(image)
+        timer = self.timer
+        with timer('thresholds.colorspace'):
+            inputs = self.inputs(image)
         binaries = {}
         for filter_ in self._filters:
-            if filter_.COLORSPACE == Colorspace.GRAY:
-                binary = filter_(gray)
-            elif filter_.COLORSPACE == Colorspace.HLS:
-                binary = filter_(hls)
-            else:
-                binary = filter_(image)
-            binaries[filter_.NAME] = binary
+            with timer('thresholds.' + filter_.NAME):
+                binaries[filter_.NAME] = filter_(inputs[filter_.COLORSPACE])
         return binaries
-
-
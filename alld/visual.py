@@ -28,6 +28,41 @@ def lanepoly(ploty, left, right):
     return np.hstack([left, right])
 
 
+def overlay_lane(img, lanepoly, backmtx, warped_shape, color=(0, 255, 0), alpha=0.3, layer=None):
+    """Blend lane polygon into `img` in place and return `img`
+
+    `lanepoly` (see `lanepoly`) is in warped space of shape `warped_shape`,
+    its vertices are mapped to `img` with `backmtx` (see Perspective.backmtx),
+    so only the polygon bounding box is touched (no full-frame unwarp).
+    `layer` is an optional buffer of `img` shape used to draw the polygon.
+    """
+    points = np.array(lanepoly, dtype=np.float64).reshape(-1, 1, 2)
+    # only the part of polygon inside warped image is visible after unwarp
+    np.clip(points[:, :, 0], 0, warped_shape[1] - 1, out=points[:, :, 0])
+    if cv2.contourArea(points.astype(np.float32)) == 0:
+        return img
+    points = cv2.perspectiveTransform(points, backmtx).reshape(-1, 2)
+
+    x0, y0 = np.maximum(np.floor(points.min(axis=0)).astype(np.int64), 0)
+    x1, y1 = np.ceil(points.max(axis=0)).astype(np.int64) + 1
+    x1, y1 = min(x1, img.shape[1]), min(y1, img.shape[0])
+    if x0 >= x1 or y0 >= y1:
+        return img
+
+    roi = img[y0:y1, x0:x1]
+    if layer is None:
+        layer = np.zeros_like(roi)
+    else:
+        layer = layer[y0:y1, x0:x1]
+        layer.fill(0)
+    # fixed point coordinates (4 fractional bits), anti-aliased edges
+    shift = 4
+    vertices = np.round((points - (x0, y0)) * (1 << shift)).astype(np.int32)
+    cv2.fillPoly(layer, [vertices], color, cv2.LINE_AA, shift)
+    cv2.addWeighted(roi, 1, layer, alpha, 0, dst=roi)
+    return img
+
+
 def draw_text(img, curvature, offset):
     cv2.putText(img, 'Radius of curvature = ' + str("{0:.2f}".format(curvature)) + 'm', (10, 100), cv2.FONT_HERSHEY_SIMPLEX, 2, (0, 0, 0), 5, cv2.LINE_AA)
     cv2.putText(img, 'Vehicle offset = ' + str("{0:.2f}".format(offset)) + 'm', (10, 200), cv2.FONT_HERSHEY_SIMPLEX, 2, (0, 0, 0), 5, cv2.LINE_AA)
\ No newline at end of file
@@ -0,0 +1,215 @@
+"""batch.py runs the pipeline over many videos in a process pool
+
+Each video is processed by its own Pipeline. Output video and metrics are
+written next to the input file (`drive.mp4` => `drive_lanes.avi`,
+`drive_metrics.npy` streamed while processing, `drive_metrics.mat`).
+
+Usage:
+
+  python batch.py --videos 'drives/*.mp4' --workers 4
+
+  python batch.py --manifest drives.txt --workers 4
+
+Manifest is a text file with one video path per line (empty lines and
+lines starting with # are ignored).
+
+Still images are processed independently of each other (see
+Pipeline.process_batch), processed images and metrics (one record per
+image, in order of sorted file names) are written to --output-dir:
+
+  python batch.py --images 'test_images/*.jpg' --output-dir processed_images --workers 4
+
+"""
+
+import concurrent.futures
+import glob
+import os
+import sys
+import time
+
+import cv2
+
+from alld import metrics
+
+import pipeline
+
+
+def die(message):
+    sys.stderr.write(message)
+    sys.stderr.write('\n')
+    exit(1)
+
+
+def read_manifest(file_name):
+    """read_manifest returns a list of video paths from manifest file
+
+    Relative paths are resolved against the manifest folder.
+    """
+    folder = os.path.dirname(os.path.abspath(file_name))
+    videos = []
+    with open(file_name) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            videos.append(os.path.join(folder, line))
+    return videos
+
+
+# suffixes of output files (see output_files)
+OUTPUT_SUFFIXES = ('_lanes.avi', '_metrics.npy', '_metrics.mat')
+
+
+def output_files(input_file):
+    """Return (output video, streamed metrics, MAT metrics) file names next to `input_file`"""
+    base, _ = os.path.splitext(input_file)
+    return tuple(base + suffix for suffix in OUTPUT_SUFFIXES)
+
+
+def find_videos(pattern=None, manifest=None):
+    """Return input videos matching glob `pattern` and listed in `manifest`
+
+    Output files of previous runs (see output_files) are skipped.
+    """
+    videos = []
+    if pattern:
+        videos.extend(sorted(glob.glob(pattern)))
+    if manifest:
+        videos.extend(read_manifest(manifest))
+    return [video for video in videos if not video.endswith(OUTPUT_SUFFIXES)]
+
+
+def _init_worker(opencv_threads):
+    # each worker is a separate process: cap OpenCV internal thread pool
+    # to avoid oversubscription (workers * opencv_threads <= cores)
+    cv2.setNumThreads(opencv_threads)
+
+
+def process_video(input_file, threaded=False, write_video=True):
+    """Process one video with independent Pipeline
+
+    If `write_video` is False only metrics are written (no encoding).
+
+    Returns (input_file, udacitylib.video.StageStats).
+    """
+    from udacitylib import video
+    from udacitylib.video import sources
+
+    output_file, metrics_file, mat_file = output_files(input_file)
+    if not write_video:
+        output_file = None
+    source = sources.open_source(input_file)
+    frame_size = (int(source.properties.width), int(source.properties.height))
+    try:
+        pipe = pipeline.Pipeline(metrics_file=metrics_file, frame_size=frame_size)
+    except BaseException:
+        source.release()
+        raise
+    try:
+        stats = video.convert(source, pipe, output_file, threaded=threaded)
+        pipe.save_metrics(mat_file)
+    finally:
+        pipe.close()
+    return input_file, stats
+
+
+def run(videos, workers, opencv_threads=1, threaded=False, write_video=True):
+    """Process `videos` in a pool of `workers` processes
+
+    Yields (input_file, stats, error) in completion order.
+    """
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(opencv_threads,)) as executor:
+        futures = {executor.submit(process_video, video, threaded, write_video): video for video in videos}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                input_file, stats = future.result()
+                yield input_file, stats, None
+            except Exception as e:
+                yield futures[future], None, e
+
+
+def process_images(images, output_dir, workers, opencv_threads=1, threads=False):
+    """Process still `images` (file names) and write results to `output_dir`
+
+    Processed images keep their file names, metrics are written to
+    metrics.npy and metrics.mat. Returns number of images with detected lane.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    sink = metrics.MetricsSink(pipeline.Pipeline.METRICS, os.path.join(output_dir, 'metrics.npy'))
+    detected = 0
+    try:
+        results = pipeline.Pipeline.process_batch(images, workers=workers, threads=threads,
+                                                  opencv_threads=opencv_threads)
+        for input_file, (processed, _, record) in zip(images, results):
+            cv2.imwrite(os.path.join(output_dir, os.path.basename(input_file)), processed)
+            sink.append(**{name: record[name] for name in record.dtype.names})
+            if record['sc']:
+                detected += 1
+            print('%s: curvature %.1f m, offset %.2f m' % (input_file, record['curvature'], record['offset']))
+        sink.save_mat(os.path.join(output_dir, 'metrics.mat'))
+    finally:
+        sink.close()
+    return detected
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser('python batch.py')
+    parser.add_argument('--videos', help='glob of input videos (quote it)')
+    parser.add_argument('--manifest', help='text file with one input video per line')
+    parser.add_argument('--images', help='glob of still images (quote it), processed independently')
+    parser.add_argument('--output-dir', help='output folder of --images (required with --images)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('--opencv-threads', type=int, default=1, help='OpenCV threads per worker')
+    parser.add_argument('--threaded', default=False, action='store_true',
+                        help='decode and encode in separate threads inside each worker, '
+                             'process --images in worker threads instead of processes')
+    parser.add_argument('--no-video', default=False, action='store_true',
+                        help='write metrics only (do not encode output videos)')
+
+    args = parser.parse_args()
+
+    if args.images:
+        if not args.output_dir:
+            die('--output-dir is required with --images')
+        images = sorted(glob.glob(args.images))
+        if not images:
+            die('no images found')
+        start = time.perf_counter()
+        detected = process_images(images, args.output_dir, args.workers, args.opencv_threads, args.threaded)
+        wall = time.perf_counter() - start
+        print('%d images (%d with detected lane) in %.2fs with %d workers' % (
+            len(images), detected, wall, args.workers))
+        exit(0)
+
+    if not args.videos and not args.manifest:
+        die('either --videos, --manifest or --images is required')
+
+    videos = find_videos(args.videos, args.manifest)
+    if not videos:
+        die('no videos found')
+
+    start = time.perf_counter()
+    frames = 0
+    failed = 0
+
+    for input_file, stats, error in run(videos, args.workers, args.opencv_threads, args.threaded,
+                                         not args.no_video):
+        if error is not None:
+            failed += 1
+            print('FAILED %s: %s' % (input_file, error))
+            continue
+        frames += stats.frames
+        print('%s: %s' % (input_file, stats))
+
+    wall = time.perf_counter() - start
+    fps = frames / wall if wall else 0.0
+    print('%d videos (%d failed), %d frames in %.2fs: %.1f fps with %d workers' % (
+        len(videos), failed, frames, wall, fps, args.workers))
+
+    if failed:
+        exit(1)
@@ -0,0 +1,147 @@
+"""benchmark.py measures latency of each stage of Pipeline.process
+
+Frames are taken from test_images/ and from synthetic frames (test images
+resized to several resolutions). For each dataset script reports p50, p95
+and p99 latency of each stage (see Pipeline.process) and frames per second.
+
+Usage:
+
+  python benchmark.py --frames 100 --save-baseline baseline.json
+
+  python benchmark.py --frames 100 --baseline baseline.json --tolerance 0.15
+
+Script exits with code 1 if a stage is slower than in the baseline.
+
+"""
+
+import glob
+import json
+import os
+import sys
+
+import cv2
+
+from alld import instrumentation
+
+import pipeline
+
+
+PERCENTILES = (50, 95, 99)
+
+# ignore regressions smaller than this (seconds): timer noise
+MIN_REGRESSION = 0.0002
+
+
+def load_images(folder='test_images', mask='*.jpg'):
+    """Return a list of BGR images from folder (sorted by file name)"""
+    return [cv2.imread(file_name) for file_name in sorted(glob.glob(os.path.join(folder, mask)))]
+
+
+def parse_resolution(resolution):
+    """'1280x720' => (1280, 720)"""
+    width, height = resolution.lower().split('x')
+    return int(width), int(height)
+
+
+def datasets(images, resolutions):
+    """Return a list of (dataset name, frames)"""
+    result = [('test_images', images)]
+    for width, height in resolutions:
+        frames = [cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA) for image in images]
+        result.append(('synthetic_%dx%d' % (width, height), frames))
+    return result
+
+
+def run(frames, nframes, warmup=5, debug=False):
+    """Process `nframes` frames (cycling `frames`) and return Recorder
+
+    Set `debug` to True to measure debug image stages too. Pipeline is
+    built for the size of the first frame.
+    """
+    timer = instrumentation.Recorder(window=None)
+    height, width = frames[0].shape[:2]
+    pipe = pipeline.Pipeline(timer=timer, frame_size=(width, height))
+    for i in range(warmup + nframes):
+        if i == warmup:
+            timer.reset()
+        # process() draws text on the frame, so pass a copy
+        pipe.process(frames[i % len(frames)].copy(), debug=debug)
+    return timer
+
+
+def summary(timer):
+    """Return {'fps': .., 'stages': {stage: {'n': .., 'p50': .., ..}}}"""
+    stages = {}
+    for name, durations in sorted(timer.durations.items()):
+        stage = {'n': durations.count}
+        for q, value in zip(PERCENTILES, durations.percentiles(PERCENTILES)):
+            stage['p%d' % q] = float(value)
+        stages[name] = stage
+    process = timer.durations['process']
+    fps = process.count / process.total if process.total else 0.0
+    return {'fps': fps, 'stages': stages, 'counters': dict(timer.counters)}
+
+
+def report(name, result, out=sys.stdout):
+    out.write('%s: %.1f fps %s\n' % (name, result['fps'], result['counters']))
+    out.write('  %-32s %6s %9s %9s %9s\n' % ('stage', 'n', 'p50 ms', 'p95 ms', 'p99 ms'))
+    for stage, values in result['stages'].items():
+        out.write('  %-32s %6d %9.2f %9.2f %9.2f\n' % (
+            stage, values['n'], 1000 * values['p50'], 1000 * values['p95'], 1000 * values['p99']))
+
+
+def regressions(results, baseline, tolerance):
+    """Return a list of messages about stages slower than in `baseline`"""
+    messages = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        if result['fps'] < base['fps'] * (1 - tolerance):
+            messages.append('%s: fps %.1f < baseline %.1f' % (name, result['fps'], base['fps']))
+        for stage, values in result['stages'].items():
+            if stage not in base['stages']:
+                continue
+            for q in PERCENTILES[:2]:
+                key = 'p%d' % q
+                current, expected = values[key], base['stages'][stage][key]
+                if current > expected * (1 + tolerance) and current - expected > MIN_REGRESSION:
+                    messages.append('%s: %s %s %.2f ms > baseline %.2f ms' % (
+                        name, stage, key, 1000 * current, 1000 * expected))
+    return messages
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser('python benchmark.py')
+    parser.add_argument('--frames', type=int, default=50, help='number of measured frames per dataset')
+    parser.add_argument('--resolutions', default='640x360,1280x720,1920x1080',
+                        help='comma separated resolutions of synthetic frames (empty to skip)')
+    parser.add_argument('--baseline', help='compare results with baseline file')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed slowdown (0.1 is 10%%)')
+    parser.add_argument('--save-baseline', help='save results to baseline file')
+    parser.add_argument('--debug', default=False, action='store_true', help='build debug images')
+
+    args = parser.parse_args()
+
+    images = load_images()
+    resolutions = [parse_resolution(r) for r in args.resolutions.split(',') if r]
+
+    results = {}
+    for name, frames in datasets(images, resolutions):
+        results[name] = summary(run(frames, args.frames, debug=args.debug))
+        report(name, results[name])
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        messages = regressions(results, baseline, args.tolerance)
+        for message in messages:
+            print('REGRESSION ' + message)
+        if messages:
+            exit(1)
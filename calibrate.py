@@ -2,12 +2,22 @@
 
 Usage:
 
-  python calibrate.py --chessboards photos --rows 8 --cols 6
+  python calibrate.py --chessboards photos --rows 8 --cols 6 --output camera.pickle --workers 4
+
+Corners are detected on downscaled copies of images in a process pool and
+refined by cv2.cornerSubPix at full resolution. Detected corners are cached
+by file content (`camera_corners.pickle` next to the output file by default),
+so re-runs detect only new or changed images.
 
 """
 
+from collections import namedtuple
+import concurrent.futures
 import glob
+import hashlib
+import itertools
 import os
+import pickle
 import sys
 
 import cv2
@@ -16,6 +26,14 @@ import numpy
 from alld import camera
 
 
+# chessboards are detected on images downscaled by this factor
+DETECTION_SCALE = 0.5
+
+# cv2.cornerSubPix parameters
+SUBPIX_WINDOW = (11, 11)
+SUBPIX_CRITERIA = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
+
+
 class Chessboard:
 
     def __init__(self, rows, cols):
@@ -38,12 +56,124 @@ class Chessboard:
         obj_points[:, :2] = numpy.mgrid[0:self.rows, 0:self.cols].T.reshape(-1, 2)
         return obj_points
 
-    def find_corners(self, gray_img):
+    def find_corners(self, gray_img, scale=1.0):
         """find_corners uses cv2 function to find chessboard corners
-        
+
+        Corners are searched on a copy downscaled by `scale` (on `gray_img`
+        if they are not found there) and refined by cv2.cornerSubPix at
+        full resolution.
+
         Returns found flag and corners array
         """
-        return cv2.findChessboardCorners(gray_img, self.shape, None)
+        found = False
+        if scale < 1:
+            small = cv2.resize(gray_img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            found, corners = cv2.findChessboardCorners(small, self.shape, None)
+            if found:
+                # pixel centers of the copy => pixel centers of gray_img
+                # (cv2.resize maps by 1 / scale, not by ratio of rounded sizes)
+                corners = (corners + 0.5) / numpy.float32(scale) - 0.5
+        if not found:
+            found, corners = cv2.findChessboardCorners(gray_img, self.shape, None)
+            if not found:
+                return found, corners
+        corners = cv2.cornerSubPix(gray_img, corners, SUBPIX_WINDOW, (-1, -1), SUBPIX_CRITERIA)
+        return found, corners
+
+
+# corners of one image, `image_size` is (width, height)
+Detection = namedtuple('Detection', ['found', 'corners', 'image_size'])
+
+
+class CornerCache:
+    """Detections of chessboard images keyed by file content digest and detection parameters
+
+    Parameters are chessboard shape, detection scale, SUBPIX_WINDOW and
+    SUBPIX_CRITERIA: detections made with other parameters are not returned.
+    Cache is loaded from `file_name` (if it exists) and saved by `save`.
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self._detections = {}
+        if os.path.exists(file_name):
+            with open(file_name, 'rb') as f:
+                self._detections = pickle.load(f)
+
+    def __len__(self):
+        return len(self._detections)
+
+    @staticmethod
+    def _key(digest, shape, scale):
+        return (digest, tuple(shape), float(scale), tuple(SUBPIX_WINDOW), tuple(SUBPIX_CRITERIA))
+
+    def get(self, digest, shape, scale=DETECTION_SCALE):
+        """Return Detection or None"""
+        return self._detections.get(self._key(digest, shape, scale))
+
+    def put(self, digest, shape, detection, scale=DETECTION_SCALE):
+        self._detections[self._key(digest, shape, scale)] = detection
+
+    def save(self):
+        tmp = self.file_name + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(self._detections, f)
+        os.replace(tmp, self.file_name)
+
+
+def file_digest(file_name):
+    """Return SHA-1 hex digest of file content"""
+    digest = hashlib.sha1()
+    with open(file_name, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def detect(file_name, rows, cols, scale=DETECTION_SCALE):
+    """detect finds chessboard corners of image file, returns Detection"""
+    bgr = cv2.imread(file_name)
+    if bgr is None:
+        raise ValueError('cannot read %s' % file_name)
+    gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
+    found, corners = Chessboard(rows, cols).find_corners(gray, scale)
+    return Detection(found, corners if found else None, gray.shape[::-1])
+
+
+def _init_worker():
+    # workers are separate processes: one OpenCV thread each
+    cv2.setNumThreads(1)
+
+
+def detect_all(file_names, chessboard, scale=DETECTION_SCALE, workers=None, cache=None):
+    """detect_all returns a list of Detection (in order of `file_names`)
+
+    Images missing in `cache` (CornerCache) are detected in a pool of `workers`
+    processes (in this process if `workers` is 0) and added to `cache`.
+    """
+    digests = [file_digest(file_name) for file_name in file_names]
+    detections = [None] * len(file_names)
+    if cache is not None:
+        detections = [cache.get(digest, chessboard.shape, scale) for digest in digests]
+    missing = [i for i, detection in enumerate(detections) if detection is None]
+    if not missing:
+        return detections
+
+    args = ([file_names[i] for i in missing],
+            itertools.repeat(chessboard.rows), itertools.repeat(chessboard.cols), itertools.repeat(scale))
+    if workers == 0:
+        results = map(detect, *args)
+        for i, detection in zip(missing, results):
+            detections[i] = detection
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            for i, detection in zip(missing, executor.map(detect, *args)):
+                detections[i] = detection
+
+    if cache is not None:
+        for i in missing:
+            cache.put(digests[i], chessboard.shape, detections[i], scale)
+    return detections
 
 
 def die(message):
@@ -52,11 +182,9 @@ def die(message):
     exit(1)
 
 
-def shots(folder, mask='*.jpg'):
-    """shots reads images from folder (by mask) and converts them to gray"""
-    for file_name in glob.glob(os.path.join(folder, mask)):
-        bgr = cv2.imread(file_name)
-        yield file_name, cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
+def shot_files(folder, mask='*.jpg'):
+    """shot_files returns sorted file names of images in folder (by mask)"""
+    return sorted(glob.glob(os.path.join(folder, mask)))
 
 
 if __name__ == '__main__':
@@ -68,6 +196,12 @@ if __name__ == '__main__':
     parser.add_argument('--cols', required=True, type=int, help='number of chessboard cols')
     parser.add_argument('--stop-on-fail', default=False, action='store_true', help='die if corners cannot be found at least for one image')
     parser.add_argument('-o', '--output', required=True, help='an output file name (camera file)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='number of detection processes (0 to detect in this process)')
+    parser.add_argument('--scale', type=float, default=DETECTION_SCALE,
+                        help='detect corners on images downscaled by this factor')
+    parser.add_argument('--cache', help='file with cached corners (default: OUTPUT_corners.pickle)')
+    parser.add_argument('--no-cache', default=False, action='store_true', help='detect corners of all images')
 
     args = parser.parse_args()
 
@@ -78,19 +212,36 @@ if __name__ == '__main__':
 
     chess_points = chessboard.obj_points()
 
+    cache = None
+    if not args.no_cache:
+        cache = CornerCache(args.cache or os.path.splitext(args.output)[0] + '_corners.pickle')
+
+    file_names = shot_files(args.chessboards)
+    if not file_names:
+        die('no shots found: %s' % args.chessboards)
+
+    detections = detect_all(file_names, chessboard, args.scale, args.workers, cache)
+    if cache is not None:
+        cache.save()
+
     obj_points = []
     img_points = []
+    image_size = None
 
-    for file_name, shot in shots(args.chessboards):
-        found, corners = chessboard.find_corners(shot)
-        if not found:
+    for file_name, detection in zip(file_names, detections):
+        if not detection.found:
             if args.stop_on_fail:
                 die('cannot find corners: %s' % file_name)
             continue
+        if image_size is None:
+            image_size = detection.image_size
         obj_points.append(chess_points)
-        img_points.append(corners)
+        img_points.append(detection.corners)
+
+    if not img_points:
+        die('cannot find corners in any image')
 
-    ret, cmx, dist, rvecs, tvecs = cv2.calibrateCamera(obj_points, img_points, shot.shape[::-1], None, None)
+    ret, cmx, dist, rvecs, tvecs = cv2.calibrateCamera(obj_points, img_points, image_size, None, None)
 
     cam = camera.Camera(cmx, dist)
     cam.save(args.output)
@@ -1,46 +1,154 @@
 """SDC Advanced Lane Line Detection pipeline
 
-NOTE: if collect_pixels is True script collects a lot of data and stores it in memory (~ 4Gb)
+NOTE: if collect_points is True script collects a lot of data and stores it in memory (~ 4Gb),
+use `points_file` to store points on disk (see alld.pointstore)
 """
 
+from alld import arena
+from alld import bands
 from alld import camera
+from alld import deadline
+from alld import instrumentation
 from alld import line
+from alld import metrics
 from alld import perspective
 from alld import pixelspace
+from alld import pointstore
+from alld import polynom2
 from alld import slidingwindowsearch
 from alld import thresholds
 from alld import visual
 
+import collections
+import concurrent.futures
+import itertools
+import multiprocessing.util
+import os
+import threading
+import time
+
 import cv2
 import numpy
-import scipy.io
 
 
-def calc_curvature(bin, poly2, ploty):
+def calc_curvature(bin, poly2, ploty=None, space=pixelspace.DEFAULT):
     """Calculate curvature of poly2 in `y_closest_to_vehicle` point
     
-    Return value in meters.
+    Return value in meters (cached per poly2). `ploty` is not used
+    (conversion to meters is analytic). `space` is pixelspace.PixelSpace
+    of `bin`.
     """
     y_closest_to_vehicle = bin.shape[0]
-    poly2_meters = pixelspace.to_real_world_space(poly2(ploty), ploty)
-    y_closest_to_vehicle_in_meters = pixelspace.y_pix2m(y_closest_to_vehicle)
-    return poly2_meters.curvature(y_closest_to_vehicle_in_meters)
+
+    def curvature():
+        poly2_meters = space.to_real_world(poly2)
+        y_closest_to_vehicle_in_meters = space.y_pix2m(y_closest_to_vehicle)
+        return poly2_meters.curvature(y_closest_to_vehicle_in_meters)
+
+    return poly2.cached(('curvature', y_closest_to_vehicle, space.xm_per_pix, space.ym_per_pix), curvature)
+
+
+# lane geometry of N frames (see Lane.batch_geometry), all fields are (N,) arrays
+LaneGeometry = collections.namedtuple(
+    'LaneGeometry', ['left_base', 'right_base', 'lane_width_m', 'left_roc', 'right_roc', 'curvature', 'offset'])
+
+
+def _thumbnail(frame, size, out=None):
+    """Return `size` int16 copy of `frame` (reuse `out` if set)"""
+    small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    if out is None:
+        return small.astype(numpy.int16)
+    out[...] = small
+    return out
+
+
+def _read_image(image):
+    """Return `image` (file names are read by cv2.imread)"""
+    if isinstance(image, str):
+        file_name, image = image, cv2.imread(image)
+        if image is None:
+            raise ValueError('can not read %s' % file_name)
+    return image
+
+
+# pipelines of process_batch workers: {(batch key, frame size): Pipeline} of each thread
+_batch_worker = threading.local()
+
+
+class _Batch:
+    """Pipeline arguments of one process_batch call (passed with each image)
+
+    Workers create pipelines on demand: one per thread and frame size
+    (unless `frame_size` is set).
+    """
+
+    _ids = itertools.count()
+
+    def __init__(self, cls, kwargs):
+        for name in ('metrics_file', 'points_file', 'collect_points'):
+            if kwargs.get(name):
+                raise ValueError('%s is not supported by process_batch (metrics are returned)' % name)
+        self.key = (os.getpid(), next(self._ids))
+        self.cls = cls
+        self.kwargs = kwargs
+        self._created = []  # pipelines created in this process
+
+    def __getstate__(self):
+        return {'key': self.key, 'cls': self.cls, 'kwargs': self.kwargs, '_created': []}
+
+    def pipeline(self, image):
+        """Pipeline of this thread for `image`"""
+        pipelines = getattr(_batch_worker, 'pipelines', None)
+        if pipelines is None:
+            pipelines = _batch_worker.pipelines = {}
+        size = (image.shape[1], image.shape[0])
+        key = (self.key, size)
+        if key not in pipelines:
+            kwargs = dict(self.kwargs)
+            kwargs.setdefault('frame_size', size)
+            pipe = pipelines[key] = self.cls(**kwargs)
+            if self.key[0] == os.getpid():
+                self._created.append(pipe)
+            else:
+                # worker process: close on exit
+                multiprocessing.util.Finalize(None, pipe.close, exitpriority=0)
+        return pipelines[key]
+
+    def close(self):
+        """Close pipelines created by threads of this process"""
+        for pipe in self._created:
+            pipe.close()
+        self._created = []
+        pipelines = getattr(_batch_worker, 'pipelines', {})
+        for key in [key for key in pipelines if key[0] == self.key]:
+            del pipelines[key]
+
+
+def _init_batch_worker(opencv_threads):
+    if opencv_threads is not None:
+        cv2.setNumThreads(opencv_threads)
+
+
+def _process_batch_image(batch, image, debug):
+    image = _read_image(image)
+    return batch.pipeline(image).process_image(image, debug)
 
 
 class Lane:
 
-    def __init__(self, left, right):
+    def __init__(self, left, right, space=pixelspace.DEFAULT):
         self.left = left
         self.right = right
+        # pixelspace.PixelSpace of warped image
+        self.space = space
 
     def width_m(self, y):
         """Lane width in meters
         
         `y` should be in pixel space
         """
-        left_base = self.left(y)
-        right_base = self.right(y)
-        lane_width_m = pixelspace.x_pix2m(right_base - left_base)
+        left_base, right_base = self.base(y)
+        lane_width_m = self.space.x_pix2m(right_base - left_base)
         return lane_width_m
 
     def curvature(self, bin, ploty):
@@ -48,21 +156,68 @@ class Lane:
         
         `ploty` should be in pixel space
         """
-        left_roc = calc_curvature(bin, self.left, ploty)
-        right_roc = calc_curvature(bin, self.right, ploty)
+        left_roc = calc_curvature(bin, self.left, ploty, self.space)
+        right_roc = calc_curvature(bin, self.right, ploty, self.space)
         return (left_roc + right_roc) / 2
 
     def base(self, y):
-        """Return left base and right base in pixel space"""
-        left_base = self.left(y)
-        right_base = self.right(y)
-        return left_base, right_base
+        """Return left base and right base in pixel space (cached per polynom)"""
+        return self.left.at(y), self.right.at(y)
 
     def center(self, y):
         """Return lane center X in pixel space"""
         left_base, right_base = self.base(y)
         return (left_base + right_base) / 2
 
+    @staticmethod
+    def batch_geometry(left, right, y, vehicle_center, space=pixelspace.DEFAULT):
+        """Calculate geometry of N lanes at once
+
+        `left` and `right` are (N, 3) arrays of polynom coefficients (see
+        polynom2.stack), `y` (closest to vehicle) and `vehicle_center` are in
+        pixel space of `space` (pixelspace.PixelSpace). Results are the same
+        as `base`, `width_m`, `curvature` and offset calculated by Pipeline
+        for each lane.
+
+        Return LaneGeometry
+        """
+        left = numpy.asarray(left, dtype=numpy.float64).reshape(-1, 3)
+        right = numpy.asarray(right, dtype=numpy.float64).reshape(-1, 3)
+
+        left_base = polynom2.evaluate(left, y)
+        right_base = polynom2.evaluate(right, y)
+
+        y_in_meters = space.y_pix2m(y)
+        left_roc = polynom2.curvature(space.coefficients_to_real_world(left), y_in_meters)
+        right_roc = polynom2.curvature(space.coefficients_to_real_world(right), y_in_meters)
+
+        center = (left_base + right_base) / 2
+
+        return LaneGeometry(
+            left_base=left_base,
+            right_base=right_base,
+            lane_width_m=space.x_pix2m(right_base - left_base),
+            left_roc=left_roc,
+            right_roc=right_roc,
+            curvature=(left_roc + right_roc) / 2,
+            offset=space.x_pix2m(vehicle_center - center),
+        )
+
+
+def _metric(name):
+    """Read-only array of metric `name` of all processed frames (see Pipeline.METRICS)"""
+    def column(self):
+        values = self.metrics.column(name).view()
+        values.flags.writeable = False
+        return values
+
+    return property(column, doc='%s of all processed frames' % name)
+
+
+# lane line search parameters of one warped image resolution: pixelspace.PixelSpace,
+# margin search margin, sliding window margin and minimal number of pixels of a window
+SearchParameters = collections.namedtuple('SearchParameters', ['space', 'margin', 'window_margin', 'minpix'])
+
 
 class Pipeline:
 
@@ -70,27 +225,161 @@ class Pipeline:
 
     ALLOWED_MISSES = 5  # max misses in a row
 
+    # with `band_binarization` full frame is binarized at least every BAND_REFRESH
+    # detections (bands are rescaled by gradient maxima of the last full frame)
+    BAND_REFRESH = 25
+
     # Sanity Check parameters
     LANE_WIDTH_PRECISION = 1  # meter
     ROC_DIFF = 1000  # meters
 
-
-    def __init__(self, margin=30, history_length=5, collect_points=False):
+    # perspective pairs, camera.pickle, pixelspace constants, `margin` and
+    # sliding window parameters are tuned for frames of this size (width, height)
+    REFERENCE_FRAME_SIZE = (1280, 720)
+
+    # sliding window search parameters (for REFERENCE_FRAME_SIZE)
+    WINDOW_MARGIN = 100
+    MINPIX = 50
+
+    # per-frame metrics: (name, dtype)
+    METRICS = [
+        ('left_points_n', numpy.int32),
+        ('right_points_n', numpy.int32),
+        ('curvature', numpy.float64),
+        ('offset', numpy.float64),
+        ('left_base', numpy.float64),
+        ('right_base', numpy.float64),
+        ('lane_width_m', numpy.float64),  # detected lane width in meters
+        ('left_roc', numpy.float64),  # roc means 'radius of curvature'
+        ('right_roc', numpy.float64),
+        ('sc', numpy.bool_),  # "sanity check" flag
+        ('sliding_window', numpy.bool_),  # True if sliding windows was used for frame
+        ('miss', numpy.int32),  # miss count
+        ('detected', numpy.bool_),  # False if lines were predicted (see `detect_every`)
+        ('degradation', numpy.int8),  # degradation level (see `budget`)
+    ]
+
+    # per-frame metric columns (read-only numpy arrays backed by self.metrics)
+    left_points_n = _metric('left_points_n')
+    right_points_n = _metric('right_points_n')
+    curvature = _metric('curvature')
+    offset = _metric('offset')
+    left_base = _metric('left_base')
+    right_base = _metric('right_base')
+    lane_width_m = _metric('lane_width_m')
+    left_roc = _metric('left_roc')
+    right_roc = _metric('right_roc')
+    sc = _metric('sc')
+    sliding_window = _metric('sliding_window')
+    miss = _metric('miss')
+
+    # degradation levels (see `budget`), each level includes previous ones
+    FULL = 0
+    COLOUR_ONLY = 1  # skip Sobel thresholds
+    LOW_RESOLUTION = 2  # binarize and search warped image of LOW_RESOLUTION_SCALE
+    MARGIN_SEARCH_ONLY = 3  # run sliding window search only to reacquire lost lines
+    NO_RENDERING = 4  # do not draw lane and text
+    DEGRADATION_LEVELS = 5
+
+    LOW_RESOLUTION_SCALE = 0.5
+
+    # frames are compared by thumbnails of this size (see `motion_threshold`)
+    THUMBNAIL_SIZE = (32, 18)
+
+    def __init__(self, margin=30, history_length=5, collect_points=False, metrics_file=None,
+                 points_file=None, timer=instrumentation.NULL, band_binarization=False,
+                 smoothing=line.MEAN, debug_every=0, debug_callback=None,
+                 frame_size=REFERENCE_FRAME_SIZE, scale=1.0,
+                 detect_every=1, motion_threshold=None, min_points=0, budget=None):
         """Construct Pipeline
         
-        Set `collect_points` to True to save coords of detected pixels.        
+        Set `collect_points` to True to save coords of detected pixels.
+        If `points_file` is set points are stored on disk
+        (`points_file`_left.* and `points_file`_right.*).
+
+        Set `metrics_file` to stream metrics to .npy file (see alld.metrics),
+        otherwise metrics are kept in memory (72 bytes per frame, ~6.5 MB
+        per hour of 25 fps video). Columns are available as read-only
+        arrays too (`curvature`, `offset`, `sc`, ...).
+
+        Set `timer` to instrumentation.Recorder() to measure pipeline stages
+        and count events (see alld.instrumentation for exports).
+
+        Set `band_binarization` to True to compute thresholds only inside
+        bands around tracked lines (full frame is binarized for sliding window
+        and every BAND_REFRESH frames).
+
+        `smoothing` is a smoothing method of lines (see alld.line), fits are
+        weighted by number of detected points for line.CONFIDENCE.
+
+        Debug image (`outimg`, see `process`) is not built by `__call__`
+        unless `debug_every` is set: then it is built for every
+        `debug_every`-th frame and passed to `debug_callback(frame_number, outimg)`
+        (the last one is kept in `debug_image` too).
+
+        `frame_size` is (width, height) of input frames. Frames are warped
+        into images `scale` times smaller or larger than input frames, and
+        thresholds and search run on them. Perspective pairs, `margin`
+        (given for REFERENCE_FRAME_SIZE), window sizes and pixel to meter
+        factors are rescaled, so curvature and offset are still in meters.
+
+        Set `detect_every` to k > 1 to run full detection only for every
+        k-th frame, lines of other frames are extrapolated from history
+        (see Line.predict). Detection runs earlier if lines were lost, if the
+        last detection found less than `min_points` points of a line or if
+        mean absolute difference of frame thumbnails since the last detection
+        exceeds `motion_threshold` (intensity levels, None to disable).
+
+        Set `budget` (seconds per frame) to degrade quality when the running
+        estimate of frame latency exceeds the budget (see alld.deadline):
+        levels are COLOUR_ONLY, LOW_RESOLUTION, MARGIN_SEARCH_ONLY and
+        NO_RENDERING, the level of each frame is recorded in metrics.
         """
         self.collect_points = collect_points
+        self.timer = timer
+        self.band_binarization = band_binarization
+        self.debug_every = debug_every
+        self.debug_callback = debug_callback
+        self.debug_image = None
+
+        # reusable per-resolution buffers of intermediate images (output frames are not
+        # taken from arena: they can be queued by udacitylib.video.convert)
+        self.arena = arena.Arena()
+
+        # input frames and warped images relative to REFERENCE_FRAME_SIZE
+        self.frame_size = tuple(frame_size)
+        reference_width, reference_height = self.REFERENCE_FRAME_SIZE
+        frame_scale = (frame_size[0] / reference_width, frame_size[1] / reference_height)
+        warped_size = (int(round(frame_size[0] * scale)), int(round(frame_size[1] * scale)))
+        warped_scale = (warped_size[0] / reference_width, warped_size[1] / reference_height)
+        self.warped_size = warped_size
 
         # tune warp perspective
         a1 = perspective.Pair(src=(580, 460), dst=(260, 0))
         a2 = perspective.Pair(src=(700, 460), dst=(1040, 0))
         a3 = perspective.Pair(src=(1040, 680), dst=(1040, 780))
         a4 = perspective.Pair(src=(260, 680), dst=(260, 780))
-        self.persp = perspective.Perspective(a1, a2, a3, a4)
+        pairs = [perspective.scaled(pair, frame_scale, warped_scale) for pair in (a1, a2, a3, a4)]
+        self.persp = perspective.Perspective(*pairs)
+
+        # warp for LOW_RESOLUTION degradation level (lines are searched in low_size
+        # images and scaled to warped_size)
+        low_size = tuple(int(round(v * self.LOW_RESOLUTION_SCALE)) for v in warped_size)
+        low_scale = (low_size[0] / reference_width, low_size[1] / reference_height)
+        low_pairs = [perspective.scaled(pair, frame_scale, low_scale) for pair in (a1, a2, a3, a4)]
 
         # load camera from file (camera.pickle was created by calibrate.py)
         self.cam = camera.fromfile('camera.pickle')
+        if frame_scale != (1, 1):
+            self.cam = self.cam.scaled(*frame_scale)
+
+        # undistort and warp raw frames with one precomputed remap table
+        self.undistort_warp = perspective.UndistortWarp(self.cam, self.persp, warped_size)
+        self.undistort_warp_low = perspective.UndistortWarp(
+            self.cam, perspective.Perspective(*low_pairs), low_size)
+
+        # pixel to meters conversion for warped images
+        self.space = pixelspace.DEFAULT.scaled(*warped_scale)
 
         self.yellow_h_op = thresholds.HLSThreshold('yellow_h', 20, 40, thresholds.HLSThreshold.H)
         self.yellow_s_op = thresholds.HLSThreshold('yellow_s', 120, 255, thresholds.HLSThreshold.S)
@@ -104,83 +393,169 @@ class Pipeline:
         # each *_op object has NAME attribute
         # self.th_op(frame) returns dictionary {op_name => binary_image}
         self.th_op = thresholds.Thresholds(self.yellow_s_op, self.yellow_h_op, self.white_l_op,
-                                           self.sobelx_op, self.sobely_op, self.mag_op, self.dir_op)
+                                           self.sobelx_op, self.sobely_op, self.mag_op, self.dir_op,
+                                           timer=timer, arena=self.arena)
+
+        # compile combination of thresholds into one evaluation plan
+        # self.combine(frame) returns combined binary image
+        op = thresholds.op
+        self.combine = self.th_op.compile(
+            (op('sobelx') | op('mag') & op('dir')) |
+            (op('yellow_s') & op('yellow_h')) |
+            op('white_l'))
+        # the same without Sobel thresholds (COLOUR_ONLY degradation level)
+        self.combine_colour = self.th_op.compile(
+            (op('yellow_s') & op('yellow_h')) |
+            op('white_l'))
+
+        left_store = right_store = None
+        if collect_points and points_file:
+            left_store = pointstore.PointStore(points_file + '_left')
+            right_store = pointstore.PointStore(points_file + '_right')
 
         # self.left represents "left line" object
-        self.left = line.Line(maxlen=history_length)
+        self.left = line.Line(maxlen=history_length, point_store=left_store, smoothing=smoothing)
         # self.right represnets "right line" object
-        self.right = line.Line(maxlen=history_length)
-
-        self.margin = margin
+        self.right = line.Line(maxlen=history_length, point_store=right_store, smoothing=smoothing)
+
+        self.margin = max(int(round(margin * warped_scale[0])), 1)
+        self.window_margin = max(int(round(self.WINDOW_MARGIN * warped_scale[0])), 1)
+        self.minpix = int(round(self.MINPIX * warped_scale[0] * warped_scale[1]))
+
+        # search parameters of warped images and of LOW_RESOLUTION images
+        self.search = SearchParameters(self.space, self.margin, self.window_margin, self.minpix)
+        self.search_low = SearchParameters(
+            pixelspace.DEFAULT.scaled(*low_scale),
+            max(int(round(margin * low_scale[0])), 1),
+            max(int(round(self.WINDOW_MARGIN * low_scale[0])), 1),
+            int(round(self.MINPIX * low_scale[0] * low_scale[1])))
+        # low_size pixels => warped_size pixels
+        self.low_to_warped = (warped_size[0] / low_size[0], warped_size[1] / low_size[1])
 
         self.misses = 0
 
-        # metrics
-        self.left_points_n = []
-        self.right_points_n = []
-        self.curvature = []
-        self.offset = []
-        self.left_base = []
-        self.right_base = []
-        self.lane_width_m = []  # detected lane width in meters
-        self.left_roc = []  # roc means 'radius of curvature'
-        self.right_roc = []
-        self.sc = []  # stores "sanity check" flags for each frame
-        self.sliding_window = []  # True if sliding windows was used for frame
-        self.miss = []  # miss count
+        self.detect_every = detect_every
+        self.motion_threshold = motion_threshold
+        self.min_points = min_points
+        self._detected_frame = 0  # number of the last frame with full detection
+        self._detected_points = 0  # min number of line points of the last detection
+        self._detected_thumbnail = None
+        self._thumbnail = None
+        self._full_binarized_frame = None  # number of the last full resolution frame binarized as a whole
+
+        self.degradation = None
+        if budget is not None:
+            self.degradation = deadline.Degradation(budget, self.DEGRADATION_LEVELS)
+
+        # build remap tables now: the first frames would pay for them (and would be
+        # taken for slow frames by degradation)
+        frame_shape = (self.frame_size[1], self.frame_size[0])
+        self.undistort_warp.maps(frame_shape)
+        if self.degradation is not None:
+            self.undistort_warp_low.maps(frame_shape)
+
+        # metrics (see METRICS)
+        self.metrics = metrics.MetricsSink(self.METRICS, metrics_file)
 
     def _collect_points(self, left_points, right_points):
         # add points and poly2 to Line
         if self.collect_points:
-            self.left.collect_points(left_points)
-            self.right.collect_points(right_points)
+            frame = len(self.metrics)
+            self.left.collect_points(left_points, frame)
+            self.right.collect_points(right_points, frame)
 
     def save_metrics(self, output_file_name):
         """Save collected metrics to MAT file"""
-        scipy.io.savemat(output_file_name, dict(
-            curvature=self.curvature,
-            offset=self.offset,
-            left_base=self.left_base,
-            right_base=self.right_base,
-            lane_width_m=self.lane_width_m,
-            left_roc=self.left_roc,
-            right_roc=self.right_roc,
-            sc=self.sc,
-            sliding_window=self.sliding_window,
-            miss=self.miss,
-        ))
-
-    def binarize(self, frame):
-        """Return binary image"""
-        frame = self.cam.undistort(frame)
-        frame = self.persp.warp(frame)
+        self.metrics.save_mat(output_file_name)
 
-        # use thresholds: see `__init__` to understand which thresholds will be calculated
-        binaries = self.th_op(frame)
+    def close(self):
+        """Flush metrics and collected points"""
+        self.metrics.close()
+        for line_ in (self.left, self.right):
+            if line_.point_store is not None:
+                line_.point_store.close()
+
+    @property
+    def degradation_level(self):
+        """Degradation level of the next frame (see `budget`)"""
+        if self.degradation is None:
+            return self.FULL
+        return self.degradation.level
+
+    def binarize(self, frame, level=FULL):
+        """Return binary image (computed as cheap as degradation `level` allows)
+
+        Binary image is `warped_size` (low resolution for LOW_RESOLUTION level).
+        """
+        return self._binarize(frame, level).copy()
+
+    def _binarize(self, frame, level=FULL):
+        """binarize into arena buffer (overwritten by the next frame)"""
+        combine = self.combine_colour if level >= self.COLOUR_ONLY else self.combine
+        undistort_warp = self.undistort_warp_low if level >= self.LOW_RESOLUTION else self.undistort_warp
 
-        select_yellow = (binaries['yellow_s'] == 1) & (binaries['yellow_h'] == 1)
-        select_white = binaries['white_l'] == 1
-        select_sobel = (binaries['sobelx'] == 1) | (binaries['mag'] == 1) & (binaries['dir'] == 1)
+        shape = undistort_warp.output_shape(frame.shape)
+        with self.timer('undistort_warp'):
+            frame = undistort_warp(frame, self.arena.get('warped', shape + frame.shape[2:]))
 
-        # combine
-        combined = numpy.zeros_like(binaries['sobelx'])
-        combined[select_sobel | select_yellow | select_white] = 1
+        # use thresholds: see `__init__` to understand which thresholds will be calculated
+        with self.timer('thresholds'):
+            return combine(frame, self.arena.get('binary', shape))
 
-        return combined
+    def binarize_bands(self, frame, polys, margin, level=FULL):
+        """Return binary image computed only inside bands around `polys`
 
-    def _sanity_check(self, bin, ploty, y, left_candidate, right_candidate):
-        roc_diff = numpy.absolute(calc_curvature(bin, left_candidate, ploty) -
-                                  calc_curvature(bin, right_candidate, ploty))
+        Pixels outside bands are zeros. Gradients are rescaled by maxima
+        of the last full frame (see `binarize`), so pixels inside bands are
+        the same as in full frame binary image. `level` is a degradation
+        level (COLOUR_ONLY at most).
+        """
+        return self._binarize_bands(frame, polys, margin, level).copy()
+
+    def _binarize_bands(self, frame, polys, margin, level=FULL):
+        """binarize_bands into arena buffer (overwritten by the next frame)"""
+        combine = self.combine_colour if level >= self.COLOUR_ONLY else self.combine
+        shape = self.undistort_warp.output_shape(frame.shape)
+        halo = combine.halo
+        with self.timer('undistort_warp'):
+            rects = bands.rects(shape, polys, margin)
+            padded = [bands.pad(rect, halo, shape) for rect in rects]
+            crops = [self.undistort_warp.crop(frame, *rect) for rect in padded]
+
+        with self.timer('thresholds'):
+            masks = combine.regions(crops, shape)
+
+        binary = self.arena.get('binary', shape)
+        binary.fill(0)
+        for rect, pad, mask in zip(rects, padded, masks):
+            binary[rect.y0:rect.y1, rect.x0:rect.x1] = mask[rect.y0 - pad.y0:rect.y1 - pad.y0,
+                                                            rect.x0 - pad.x0:rect.x1 - pad.x0]
+        self.timer.observe('band_area', bands.area(rects) / (shape[0] * shape[1]))
+        return binary
+
+    def _sanity_check(self, bin, ploty, y, left_candidate, right_candidate, space=None):
+        if not left_candidate.is_fitted or not right_candidate.is_fitted:
+            return False
+
+        space = space or self.space
+        roc_diff = numpy.absolute(calc_curvature(bin, left_candidate, ploty, space) -
+                                  calc_curvature(bin, right_candidate, ploty, space))
         if (roc_diff > self.ROC_DIFF):
             return False
 
-        lane_candidate = Lane(left_candidate, right_candidate)
+        lane_candidate = Lane(left_candidate, right_candidate, space)
 
         if numpy.absolute(self.ETALON_LINE_WIDTH_M - lane_candidate.width_m(y) > self.LANE_WIDTH_PRECISION):
             return False
 
         return True
 
+    @property
+    def _has_lines(self):
+        """True if both lines were fitted at least once"""
+        return all(line_.current_poly2 is not None and line_.current_poly2.is_fitted
+                   for line_ in (self.left, self.right))
+
     @property
     def should_run_sliding_window(self):
         """Return True if a program should use sliding window for current frame"""
@@ -188,102 +563,380 @@ class Pipeline:
             return True
         return not self.left.detected or not self.right.detected
 
-    def process(self, frame):
+    def should_build_debug_image(self, frame_number):
+        """Return True if debug image is sampled for `frame_number` (see `debug_every`)"""
+        return self.debug_every > 0 and frame_number % self.debug_every == 0
+
+    def process(self, frame, debug=True):
         """Process `frame` and return processed image and `outimg`
         
-        I used `outimg` for debug purposes.
-        
+        I used `outimg` for debug purposes. It is None if `debug` is False,
+        if `debug` is None it is built for sampled frames only (see `debug_every`).
+
+        Raises ValueError if `frame` size is not `frame_size`.
         """
-        bin = self.binarize(frame)
+        if frame.shape[1] != self.frame_size[0] or frame.shape[0] != self.frame_size[1]:
+            raise ValueError('expected %dx%d frame (see frame_size), got %dx%d' % (
+                self.frame_size[0], self.frame_size[1], frame.shape[1], frame.shape[0]))
+        if debug is None:
+            debug = self.should_build_debug_image(len(self.metrics))
+        self.timer.count('frames')
+        if self.degradation is None:
+            with self.timer('process'):
+                return self._process(frame, debug)
+
+        start = time.perf_counter()
+        with self.timer('process'):
+            result = self._process(frame, debug)
+        level = self.degradation.level
+        if self.degradation.update(time.perf_counter() - start) > level:
+            self.timer.count('degradation.step_down')
+        return result
+
+    def should_detect(self, frame, frame_number):
+        """Return True if full detection should run for `frame` (see `detect_every`)"""
+        if self.detect_every <= 1 or self.should_run_sliding_window:
+            return True
+        if frame_number - self._detected_frame >= self.detect_every:
+            return True
+        if self._detected_points < self.min_points:
+            self.timer.count('trigger.points')
+            return True
+        if self.motion_threshold is not None and self._detected_thumbnail is not None:
+            self._thumbnail = _thumbnail(frame, self.THUMBNAIL_SIZE, self._thumbnail)
+            motion = numpy.mean(numpy.absolute(self._thumbnail - self._detected_thumbnail))
+            self.timer.observe('motion', motion)
+            if motion > self.motion_threshold:
+                self.timer.count('trigger.motion')
+                return True
+        return False
+
+    def _process(self, frame, debug):
+        frame_number = len(self.metrics)
+        if self.should_detect(frame, frame_number):
+            return self._detect(frame, frame_number, debug)
+        return self._predict(frame, frame_number)
+
+    def _predict(self, frame, frame_number):
+        """Extrapolate lines from history (no detection), draw lane and record metrics"""
+        self.timer.count('predicted')
+        with self.timer('prediction'):
+            left = self.left.predict(frame_number)
+            right = self.right.predict(frame_number)
+        height, width = self.undistort_warp.output_shape(frame.shape)
+        return self._render(frame, (height, width), left, right, None, detected=False, miss=self.misses,
+                            degradation=self.degradation_level)
+
+    def _detect(self, frame, frame_number, debug):
+        timer = self.timer
+        level = self.degradation_level
+
+        sliding_window = self.should_run_sliding_window
+        if (sliding_window and level >= self.MARGIN_SEARCH_ONLY and self._has_lines and
+                self.misses < self.ALLOWED_MISSES):
+            # search around the last fitted lines (until they are lost)
+            sliding_window = False
+
+        low_resolution = level >= self.LOW_RESOLUTION
+        search = self.search_low if low_resolution else self.search
+        polys = (self.left.current_poly2, self.right.current_poly2)
+        if low_resolution:
+            polys = tuple(None if poly2 is None else poly2.scaled(1 / self.low_to_warped[0],
+                                                                  1 / self.low_to_warped[1])
+                          for poly2 in polys)
+
+        if (sliding_window or not self.band_binarization or low_resolution or
+                self._full_binarized_frame is None or
+                frame_number - self._full_binarized_frame >= self.BAND_REFRESH):
+            bin = self._binarize(frame, level)
+            if not low_resolution:
+                self._full_binarized_frame = frame_number
+        else:
+            # pixels farther than margin are ignored by margin search anyway
+            bin = self._binarize_bands(frame, polys, self.margin, level)
 
         ploty = numpy.linspace(0, bin.shape[0] - 1, bin.shape[0])
         y_closest_to_vehicle = bin.shape[0]
 
-        outimg = visual.create_outimg(bin)
+        outimg = None
+        if debug:
+            with timer('debug_image'):
+                outimg = visual.create_outimg(bin)
 
         # find points for each line of the lane
-        if self.should_run_sliding_window:
-            left_points, right_points = slidingwindowsearch.search(bin, outimg=outimg)
+        if sliding_window:
+            with timer('sliding_window_search'):
+                left_points, right_points = slidingwindowsearch.search(
+                    bin, window_margin=search.window_margin, minpix=search.minpix, outimg=outimg, timer=timer)
             sliding_window_was_used = True
         else:
-            left_points, right_points = slidingwindowsearch.marginsearch(
-                bin, self.left.current_poly2, self.right.current_poly2, self.margin)
+            with timer('margin_search'):
+                left_points, right_points = slidingwindowsearch.marginsearch(
+                    bin, polys[0], polys[1], search.margin, timer=timer)
             sliding_window_was_used = False
 
-        left_points.draw(outimg, (255, 0, 0))
-        right_points.draw(outimg, (0, 0, 255))
-        self._collect_points(left_points, right_points)
-
-        # fit polynom2 for each line of the lane
-        left_candidate = left_points.fit_poly2()
-        right_candidate = right_points.fit_poly2()
-
-        sc = self._sanity_check(bin, ploty, y_closest_to_vehicle,
-                                left_candidate, right_candidate)
-
-        if sc:
-            # sanity check is passed
-            self.left.fit(left_candidate)
-            self.right.fit(right_candidate)
-            self.misses = 0
+        if outimg is not None:
+            with timer('debug_points'):
+                left_points.draw(outimg, (255, 0, 0))
+                right_points.draw(outimg, (0, 0, 255))
+        if low_resolution and self.collect_points:
+            x_scale, y_scale = self.low_to_warped
+            self._collect_points(*(polynom2.Points(points.xs * x_scale, points.ys * y_scale)
+                                   for points in (left_points, right_points)))
         else:
-            self.left.detected = False
-            self.right.detected = False
-            self.misses += 1
+            self._collect_points(left_points, right_points)
 
-        # calculate smoothed line
-        left = self.left.smoothed
-        right = self.right.smoothed
+        # fit polynom2 for each line of the lane
+        with timer('polyfit'):
+            left_candidate = left_points.fit_poly2()
+            right_candidate = right_points.fit_poly2()
+
+        with timer('sanity_check'):
+            sc = self._sanity_check(bin, ploty, y_closest_to_vehicle,
+                                    left_candidate, right_candidate, search.space)
+
+        if sc and low_resolution:
+            # lines are tracked in warped_size pixels
+            left_candidate = left_candidate.scaled(*self.low_to_warped)
+            right_candidate = right_candidate.scaled(*self.low_to_warped)
+
+        with timer('tracking'):
+            if sc:
+                # sanity check is passed
+                self.left.fit(left_candidate, len(left_points), frame_number)
+                self.right.fit(right_candidate, len(right_points), frame_number)
+                self.misses = 0
+            else:
+                self.left.detected = False
+                self.right.detected = False
+                self.misses += 1
+                timer.count('miss')
+
+            # calculate smoothed line
+            left = self.left.smoothed
+            right = self.right.smoothed
+
+            # state for frame skipping (see should_detect)
+            self._detected_frame = frame_number
+            self._detected_points = min(len(left_points), len(right_points))
+            if self.detect_every > 1 and self.motion_threshold is not None:
+                self._detected_thumbnail = _thumbnail(frame, self.THUMBNAIL_SIZE, self._detected_thumbnail)
+
+        return self._render(frame, (self.warped_size[1], self.warped_size[0]), left, right, outimg,
+                            left_points_n=len(left_points),
+                            right_points_n=len(right_points),
+                            sc=sc,
+                            sliding_window=sliding_window_was_used,
+                            miss=self.misses,
+                            detected=True,
+                            degradation=level)
+
+    def _render(self, frame, shape, left, right, outimg, **values):
+        """Draw lane on `frame` and record metrics (`values` are metrics of detection)
+
+        `shape` is (height, width) of warped image.
+        """
+        timer = self.timer
+
+        if left is None or right is None:
+            # lane was not detected yet: nothing to draw
+            with timer('metrics'):
+                self.metrics.append(
+                    curvature=numpy.nan,
+                    offset=numpy.nan,
+                    left_base=numpy.nan,
+                    right_base=numpy.nan,
+                    lane_width_m=numpy.nan,
+                    left_roc=numpy.nan,
+                    right_roc=numpy.nan,
+                    **values
+                )
+            return frame, outimg
+
+        height, width = shape[:2]
+        ploty = numpy.linspace(0, height - 1, height)
+        y_closest_to_vehicle = height
+
+        with timer('geometry'):
+            # curvature, offset, bases and lane width of one lane
+            geometry = Lane.batch_geometry(left.coefficients, right.coefficients,
+                                           y_closest_to_vehicle, width / 2, self.space)
+            geometry = {name: value[0] for name, value in geometry._asdict().items()}
+
+        if values.get('degradation', self.FULL) >= self.NO_RENDERING:
+            with timer('metrics'):
+                self.metrics.append(**geometry, **values)
+            return frame, outimg
+
+        with timer('render'):
+            lanepoly = visual.lanepoly(ploty, left, right)
+
+            # draw text
+            visual.draw_text(frame, geometry['curvature'], geometry['offset'])
 
-        lane = Lane(left, right)
+        #
+        # collect metrics
+        #
+        with timer('metrics'):
+            self.metrics.append(**geometry, **values)
 
-        # calculate curvature
-        curvature = lane.curvature(bin, ploty)
+        # TODO: return outimg or use dashboard
+        with timer('overlay'):
+            # draw lane (blended in place, only inside lane bounding box)
+            visual.overlay_lane(frame, lanepoly, self.persp.backmtx, shape,
+                                layer=self.arena.get('overlay', frame.shape))
+            return frame, outimg
 
-        # calculate offset
-        vehicle_center = bin.shape[1] / 2
-        offset = pixelspace.x_pix2m(vehicle_center - lane.center(y_closest_to_vehicle))
+    def reset(self):
+        """Forget line history, misses and frame skipping state
 
-        # draw lane
-        zero = numpy.zeros_like(bin).astype(numpy.uint8)
-        laneimg = numpy.dstack((zero, zero, zero))
-        lanepoly = visual.lanepoly(ploty, left, right)
-        cv2.fillPoly(laneimg, numpy.int_([lanepoly]), (0, 255, 0))
+        Degradation level is kept: it depends on latency, not on frames.
+        """
+        self.left.reset()
+        self.right.reset()
+        self.misses = 0
+        self._detected_frame = 0
+        self._detected_points = 0
+        self._detected_thumbnail = None
+        self._full_binarized_frame = None
 
-        # draw text
-        visual.draw_text(frame, curvature, offset)
+    def process_image(self, image, debug=False):
+        """Process still `image` independently of previous frames
 
-        #
-        # collect metrics
-        #
-        left_base, right_base = lane.base(y_closest_to_vehicle)
-        left_roc = calc_curvature(bin, left, ploty)
-        right_roc = calc_curvature(bin, right, ploty)
-
-        self.left_points_n.append(len(left_points))
-        self.right_points_n.append(len(right_points))
-        self.curvature.append(curvature)
-        self.offset.append(offset)
-        self.left_base.append(left_base)
-        self.right_base.append(right_base)
-        self.lane_width_m.append(lane.width_m(y_closest_to_vehicle))
-        self.left_roc.append(left_roc)
-        self.right_roc.append(right_roc)
-        self.sc.append(sc)
-        self.sliding_window.append(sliding_window_was_used)
-        self.miss.append(self.misses)
+        Lines are found by sliding window search and are not smoothed,
+        quality is not degraded (see `budget`). Metrics are not recorded
+        by `self.metrics`, they are returned.
 
-        # TODO: return outimg or use dashboard
-        return (cv2.addWeighted(frame, 1, self.persp.unwarp(laneimg), 0.3, 0),
-                outimg)
+        Returns (processed image, outimg, metrics record).
+        """
+        self.reset()
+        sink, self.metrics = self.metrics, metrics.MetricsSink(self.METRICS, chunk_size=1)
+        degradation, self.degradation = self.degradation, None
+        try:
+            processed, outimg = self.process(image, debug)
+            record = self.metrics.records()[0]
+        finally:
+            self.metrics = sink
+            self.degradation = degradation
+        return processed, outimg, record
+
+    @classmethod
+    def process_batch(cls, images, workers=None, threads=False, debug=False, opencv_threads=None, **kwargs):
+        """Process still `images` (BGR images or file names) by `process_image` in a pool
+
+        Images are spread across `workers` processes (threads if `threads` is
+        True, the calling thread if `workers` is 0), each worker has its own
+        Pipeline(**kwargs) for each image size (unless `frame_size` is set).
+        At most 2 * `workers` images are in flight. `opencv_threads` caps
+        OpenCV threads of each worker process. Files are not supported:
+        `metrics_file`, `points_file` and `collect_points` raise ValueError.
+
+        Yields (processed image, outimg, metrics record) in order of `images`.
+        """
+        batch = _Batch(cls, kwargs)
+        if workers == 0:
+            try:
+                for image in images:
+                    yield _process_batch_image(batch, image, debug)
+            finally:
+                batch.close()
+            return
+
+        workers = workers or os.cpu_count()
+        if threads:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        else:
+            executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_batch_worker, initargs=(opencv_threads,))
+        pending = collections.deque()
+        try:
+            for image in images:
+                if len(pending) >= 2 * workers:
+                    yield pending.popleft().result()
+                pending.append(executor.submit(_process_batch_image, batch, image, debug))
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown()
+            batch.close()
 
     def __call__(self, frame):
-        processed_frame, _ = self.process(frame)
+        frame_number = len(self.metrics)
+        processed_frame, outimg = self.process(frame, debug=None)
+        if outimg is not None:
+            self.debug_image = outimg
+            if self.debug_callback is not None:
+                self.debug_callback(frame_number, outimg)
         return processed_frame
 
 
 if __name__ == '__main__':
-    pipeline = Pipeline()
+    import argparse
+
     from udacitylib import video
-    video.convert('project_video.mp4', pipeline, 'output.avi')
-    pipeline.save_metrics('metrics.mat')
+    from udacitylib.video import sources
+
+    parser = argparse.ArgumentParser('python pipeline.py')
+    parser.add_argument('--input', default='project_video.mp4',
+                        help='video file, folder of images, capture device number or - (raw BGR frames on stdin)')
+    parser.add_argument('--output', default='output.avi',
+                        help='video file, ffmpeg:FILE, folder/ (images), folder/:N (every N-th frame), '
+                             'FILE.npy (raw frames) or null')
+    parser.add_argument('--metrics', default='metrics.mat', help='MAT file with per-frame metrics')
+    parser.add_argument('--bands', default=False, action='store_true',
+                        help='binarize only bands around tracked lines')
+    parser.add_argument('--frame-size', help='WIDTHxHEIGHT of raw input frames (other inputs report their size)')
+    parser.add_argument('--policy', default='drop_oldest', choices=sources.POLICIES + ('none',),
+                        help='what to do with frames of live inputs (device, -) which arrive faster '
+                             'than they are processed (none: do not buffer)')
+    parser.add_argument('--queue', type=int, default=2, help='number of buffered frames of live inputs')
+    parser.add_argument('--scale', type=float, default=1.0, help='processing scale (0.5 is half resolution)')
+    parser.add_argument('--detect-every', type=int, default=1,
+                        help='run full detection for every N-th frame, predict lines of others')
+    parser.add_argument('--motion-threshold', type=float, help='detect lines if frame changed more than this')
+    parser.add_argument('--min-points', type=int, default=0, help='detect lines if less points were found')
+    parser.add_argument('--budget', type=float, help='latency budget per frame (seconds), degrade quality to meet it')
+    parser.add_argument('--debug-every', type=int, default=0, help='save debug image of every N-th frame')
+    parser.add_argument('--debug-dir', default='debug_images', help='folder for debug images')
+    parser.add_argument('--profile', help='write instrumentation summary to PROFILE.json, '
+                                          'PROFILE.prom and Chrome trace PROFILE.trace.json')
+
+    args = parser.parse_args()
+
+    timer = instrumentation.Recorder(trace=True) if args.profile else instrumentation.NULL
+
+    # metrics are streamed to .npy file and converted to MAT file at the end
+    metrics_file = os.path.splitext(args.metrics)[0] + '.npy'
+
+    # pipeline is built for frames of the source
+    frame_size = None
+    if args.frame_size:
+        frame_size = tuple(int(v) for v in args.frame_size.lower().split('x'))
+    policy = None if args.policy == 'none' else args.policy
+    source = sources.open_source(args.input, frame_size=frame_size, policy=policy, queue_size=args.queue)
+    frame_size = (int(source.properties.width), int(source.properties.height))
+
+    debug_callback = None
+    if args.debug_every:
+        os.makedirs(args.debug_dir, exist_ok=True)
+
+        def debug_callback(frame_number, outimg):
+            cv2.imwrite(os.path.join(args.debug_dir, 'frame%06d.png' % frame_number), outimg)
+
+    pipeline = Pipeline(metrics_file=metrics_file, timer=timer, band_binarization=args.bands,
+                        debug_every=args.debug_every, debug_callback=debug_callback,
+                        frame_size=frame_size, scale=args.scale,
+                        detect_every=args.detect_every, motion_threshold=args.motion_threshold,
+                        min_points=args.min_points, budget=args.budget)
+    stats = video.convert(source, pipeline, args.output, threaded=True, timer=timer)
+    print(stats)
+    pipeline.save_metrics(args.metrics)
+    pipeline.close()
+
+    if args.profile:
+        instrumentation.to_json(timer, args.profile + '.json')
+        with open(args.profile + '.prom', 'w') as f:
+            f.write(instrumentation.to_prometheus(timer))
+        instrumentation.write_chrome_trace(timer, args.profile + '.trace.json')
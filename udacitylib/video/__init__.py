@@ -6,50 +6,282 @@
 
 Note: convert function reads video file as a stream of BGR images
 
+Use `threaded=True` to decode, process and encode frames in separate threads
+(stages are joined by bounded queues, frame order is preserved):
+
+   stats = convert(input_file_name, pipeline, output_file_name, threaded=True)
+   print(stats)
+
+`input_file_name` can be a frame source (see udacitylib.video.sources):
+
+   source = sources.BufferedSource(sources.CaptureSource(0), policy=sources.DROP_OLDEST)
+   convert(source, pipeline, output_file_name)
+
+`output_file_name` can be a frame sink (see udacitylib.video.sinks), use
+None to skip encoding (e.g. when only metrics are needed):
+
+   convert(input_file_name, pipeline, None)
+
+Frame buffers are reused: `pipeline` must not keep references to its input
+frames (use `reuse_buffers=False` otherwise).
+
 """
 
 from collections import namedtuple
+import queue
+import threading
+import time
 
-import cv2
+from udacitylib.video import sinks
+from udacitylib.video import sources
+from udacitylib.video.sources import VideoProperties
 
 
-VideoProperties = namedtuple('VideoProperties', ['width', 'height', 'fps'])
+class StageStats(namedtuple('StageStats', ['frames', 'wall', 'decode', 'process', 'encode'])):
+    """Busy time (seconds) of each convert stage
 
+    Utilisation of a stage is its busy time divided by wall time.
+    """
 
-def _vprops(vcap):
-    if vcap.isOpened():
-        # get vcap property
-        width = vcap.get(cv2.CAP_PROP_FRAME_WIDTH)  # float
-        height = vcap.get(cv2.CAP_PROP_FRAME_HEIGHT)  # float
-        fps = vcap.get(cv2.CAP_PROP_FPS)  # float
+    def utilisation(self, stage):
+        if not self.wall:
+            return 0.0
+        return getattr(self, stage) / self.wall
 
-        return VideoProperties(width=width, height=height, fps=fps)
+    @property
+    def fps(self):
+        if not self.wall:
+            return 0.0
+        return self.frames / self.wall
 
-    raise ValueError('vcap is closed, sorry')
+    def __str__(self):
+        return '%d frames in %.2fs (%.1f fps): decode %.0f%%, process %.0f%%, encode %.0f%%' % (
+            self.frames, self.wall, self.fps,
+            100 * self.utilisation('decode'),
+            100 * self.utilisation('process'),
+            100 * self.utilisation('encode'),
+        )
 
 
-def convert(input_file, pipeline, output_file):
-    """Converts input_file to output_file using pipeline"""
-    input_ = cv2.VideoCapture(input_file)
+# marks the end of frame stream in queues
+_EOF = object()
 
-    input_props = _vprops(input_)
 
-    try:
-        fourcc = cv2.VideoWriter_fourcc(*'XVID')
-        out_size = (int(input_props.width), int(input_props.height))
-        out = cv2.VideoWriter(output_file, fourcc, int(input_props.fps), out_size)
+class _Stage(threading.Thread):
+    """Thread which runs `fn` and remembers busy time and exception"""
+
+    def __init__(self, name, fn, stop):
+        super().__init__(name=name, daemon=True)
+        self._fn = fn
+        self._stop_event = stop
+        self.busy = 0.0
+        self.error = None
 
+    def run(self):
         try:
-            while input_.isOpened():
-                ret, bgr_frame = input_.read()
+            self._fn(self)
+        except BaseException as e:
+            self.error = e
+            self._stop_event.set()
+
+
+def _put(q, item, stop):
+    """Put item to bounded queue (blocks while queue is full, gives up on stop)"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get(q, stop):
+    """Get item from queue (returns _EOF on stop)"""
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return _EOF
+
+
+class _NullTimer:
+
+    def add(self, name, seconds, start=None):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Buffers:
+    """Ring of `size` frame buffers (None if buffers are not reused)
+
+    A buffer is passed to source.read again after `size` reads, so at
+    most `size` frames can be in flight.
+    """
+
+    def __init__(self, size):
+        self._buffers = [None] * size
+        self._next = 0
+
+    def read(self, input_):
+        if not self._buffers:
+            return input_.read()
+        ret, frame = input_.read(self._buffers[self._next])
+        if ret:
+            self._buffers[self._next] = frame
+            self._next = (self._next + 1) % len(self._buffers)
+        return ret, frame
+
+
+def _convert_sequential(input_, pipeline, out, timer, buffers):
+    decode = process = encode = 0.0
+    frames = 0
+    while input_.isOpened():
+        start = time.perf_counter()
+        ret, bgr_frame = buffers.read(input_)
+        elapsed = time.perf_counter() - start
+        decode += elapsed
+        timer.add('decode', elapsed, start)
 
+        if not ret:
+            break
+
+        start = time.perf_counter()
+        out_frame = pipeline(bgr_frame)
+        process += time.perf_counter() - start
+
+        start = time.perf_counter()
+        out.write(out_frame)
+        elapsed = time.perf_counter() - start
+        encode += elapsed
+        timer.add('encode', elapsed, start)
+
+        frames += 1
+    return frames, decode, process, encode
+
+
+def _convert_threaded(input_, pipeline, out, queue_size, timer, buffers):
+    stop = threading.Event()
+    frames_q = queue.Queue(maxsize=queue_size)
+    processed_q = queue.Queue(maxsize=queue_size)
+
+    def decode(stage):
+        try:
+            while input_.isOpened() and not stop.is_set():
+                start = time.perf_counter()
+                ret, bgr_frame = buffers.read(input_)
+                elapsed = time.perf_counter() - start
+                stage.busy += elapsed
+                timer.add('decode', elapsed, start)
                 if not ret:
+                    break
+                if not _put(frames_q, bgr_frame, stop):
                     return
+        finally:
+            _put(frames_q, _EOF, stop)
 
-                out_frame = pipeline(bgr_frame)
+    def encode(stage):
+        while True:
+            out_frame = _get(processed_q, stop)
+            if out_frame is _EOF:
+                return
+            start = time.perf_counter()
+            out.write(out_frame)
+            elapsed = time.perf_counter() - start
+            stage.busy += elapsed
+            timer.add('encode', elapsed, start)
 
-                out.write(out_frame)
-        finally:
-            out.release()
+    decoder = _Stage('decode', decode, stop)
+    encoder = _Stage('encode', encode, stop)
+    decoder.start()
+    encoder.start()
+
+    process = 0.0
+    frames = 0
+    try:
+        while True:
+            bgr_frame = _get(frames_q, stop)
+            if bgr_frame is _EOF:
+                break
+            start = time.perf_counter()
+            out_frame = pipeline(bgr_frame)
+            process += time.perf_counter() - start
+            frames += 1
+            if not _put(processed_q, out_frame, stop):
+                break
+        _put(processed_q, _EOF, stop)
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        decoder.join()
+        encoder.join()
+
+    for stage in (decoder, encoder):
+        if stage.error is not None:
+            raise stage.error
+
+    return frames, decoder.busy, process, encoder.busy
+
+
+def convert(input_file, pipeline, output_file, threaded=False, queue_size=8, timer=None, reuse_buffers=True):
+    """Converts input_file to output_file using pipeline
+
+    `input_file` is a source name (see sources.open_source) or a source,
+    `output_file` is a sink name (see sinks.open_sink, None to discard
+    frames) or a sink.
+
+    If `threaded` is True decoding and encoding run in their own threads
+    joined to the processing (calling) thread by queues of `queue_size` frames.
+
+    `timer` is an optional recorder with add(name, seconds, start) method
+    (see alld.instrumentation), it receives 'decode' and 'encode' durations.
+
+    If `reuse_buffers` is True frames are decoded into a ring of buffers
+    (one buffer, or enough for all frames in flight in threaded mode).
+
+    Returns StageStats.
+    """
+    if isinstance(input_file, str):
+        input_ = sources.open_source(input_file)
+    else:
+        input_ = input_file
+
+    input_props = input_.properties
+
+    try:
+        if output_file is None or isinstance(output_file, str):
+            out_size = (int(input_props.width), int(input_props.height))
+            # threaded mode encodes in its own thread already
+            out = sinks.open_sink(output_file, out_size, input_props.fps, async_=not threaded)
+        else:
+            out = output_file
+
+        if timer is None:
+            timer = _NULL_TIMER
+        start = time.perf_counter()
+        try:
+            if threaded:
+                # decoding, two queues, processing and encoding
+                buffers = _Buffers(2 * queue_size + 3 if reuse_buffers else 0)
+                frames, decode, process, encode = _convert_threaded(input_, pipeline, out, queue_size, timer,
+                                                                    buffers)
+            else:
+                buffers = _Buffers(1 if reuse_buffers else 0)
+                frames, decode, process, encode = _convert_sequential(input_, pipeline, out, timer, buffers)
+        except BaseException:
+            # errors of the sink must not hide the original error
+            try:
+                out.release()
+            except Exception:
+                pass
+            raise
+        # waits for asynchronous sinks
+        out.release()
+        wall = time.perf_counter() - start
+        return StageStats(frames=frames, wall=wall, decode=decode, process=process, encode=encode)
     finally:
         input_.release()
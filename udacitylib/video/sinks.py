@@ -0,0 +1,250 @@
+"""udacitylib.video.sinks contains sinks of processed BGR frames
+
+Sinks have the same interface as cv2.VideoWriter (write, release):
+
+  - VideoWriterSink - video file encoded by cv2.VideoWriter (XVID by default)
+  - FFmpegSink - video file encoded by ffmpeg subprocess fed with raw frames
+  - ImageSequenceSink - every N-th frame saved as an image
+  - MemmapSink - raw frames in .npy file (numpy.load(file_name, mmap_mode='r'))
+  - NullSink - frames are only counted (metrics-only runs)
+
+AsyncSink encodes frames of another sink in a background thread, frames
+are copied into a bounded pool of buffers, so `write` blocks only when
+`queue_size` frames are waiting for the encoder:
+
+   sink = AsyncSink(FFmpegSink('out.mp4', (1280, 720), 25))
+
+"""
+
+import os
+import queue
+import shutil
+import subprocess
+import threading
+
+import cv2
+import numpy as np
+
+
+class NullSink:
+    """Counts frames and discards them"""
+
+    def __init__(self):
+        self.frames = 0
+
+    def write(self, frame):
+        self.frames += 1
+
+    def release(self):
+        pass
+
+
+class VideoWriterSink:
+    """cv2.VideoWriter sink, `size` is (width, height)"""
+
+    def __init__(self, file_name, size, fps, fourcc='XVID'):
+        self._writer = cv2.VideoWriter(file_name, cv2.VideoWriter_fourcc(*fourcc), int(fps), size)
+
+    def write(self, frame):
+        self._writer.write(frame)
+
+    def release(self):
+        self._writer.release()
+
+
+class FFmpegSink:
+    """Video file encoded by ffmpeg subprocess (raw BGR frames are written to its stdin)
+
+    `output_args` are ffmpeg arguments placed before `file_name`.
+    """
+
+    OUTPUT_ARGS = ('-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p')
+
+    def __init__(self, file_name, size, fps, output_args=OUTPUT_ARGS, executable='ffmpeg'):
+        path = shutil.which(executable)
+        if path is None:
+            raise RuntimeError('%s is not installed' % executable)
+        width, height = size
+        command = [path, '-loglevel', 'error', '-y',
+                   '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', '%dx%d' % (width, height), '-r', str(fps),
+                   '-i', '-']
+        command.extend(output_args)
+        command.append(file_name)
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def write(self, frame):
+        self._process.stdin.write(memoryview(np.ascontiguousarray(frame)).cast('B'))
+
+    def release(self):
+        if self._process is None:
+            return
+        self._process.stdin.close()
+        code = self._process.wait()
+        self._process = None
+        if code:
+            raise RuntimeError('ffmpeg exited with code %d' % code)
+
+
+class ImageSequenceSink:
+    """Saves every `every`-th frame to `folder` (file names are `pattern` % frame number)"""
+
+    def __init__(self, folder, every=1, pattern='frame%06d.jpg'):
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.every = every
+        self.pattern = pattern
+        self.frames = 0
+
+    def write(self, frame):
+        if self.frames % self.every == 0:
+            cv2.imwrite(os.path.join(self.folder, self.pattern % self.frames), frame)
+        self.frames += 1
+
+    def release(self):
+        pass
+
+
+_MAGIC = b'\x93NUMPY\x01\x00'
+
+# header is padded to this size, so it can be rewritten in place
+_HEADER_SIZE = 128
+
+
+def _header(shape):
+    header = "{'descr': '|u1', 'fortran_order': False, 'shape': %r, }" % (tuple(shape),)
+    # magic (8 bytes) + header length (2 bytes) + header + '\n'
+    header = header.ljust(_HEADER_SIZE - len(_MAGIC) - 2 - 1) + '\n'
+    return _MAGIC + np.uint16(len(header)).astype('<u2').tobytes() + header.encode('latin1')
+
+
+class MemmapSink:
+    """Raw uint8 frames appended to .npy file
+
+    The header is rewritten on `flush` and `release`, frames can be read
+    with numpy.load(file_name, mmap_mode='r') as (N, height, width, 3) array.
+    """
+
+    def __init__(self, file_name, size):
+        width, height = size
+        self.file_name = file_name
+        self.frame_shape = (height, width, 3)
+        self.frames = 0
+        self._f = open(file_name, 'wb')
+        self._f.write(_header((0,) + self.frame_shape))
+
+    def write(self, frame):
+        if frame.shape != self.frame_shape or frame.dtype != np.uint8:
+            raise ValueError('expected %s uint8 frame, got %s %s' % (self.frame_shape, frame.shape, frame.dtype))
+        self._f.write(memoryview(np.ascontiguousarray(frame)).cast('B'))
+        self.frames += 1
+
+    def flush(self):
+        self._f.seek(0)
+        self._f.write(_header((self.frames,) + self.frame_shape))
+        self._f.seek(0, os.SEEK_END)
+        self._f.flush()
+
+    def release(self):
+        if self._f is None:
+            return
+        self.flush()
+        self._f.close()
+        self._f = None
+
+
+# stops AsyncSink thread
+_EOF = object()
+
+
+class AsyncSink:
+    """Writes frames to `sink` in a background thread
+
+    At most `queue_size` frames wait for `sink`. Frames are copied, so
+    callers can reuse their buffers. Errors of `sink` are raised by
+    `write` and `release`.
+    """
+
+    def __init__(self, sink, queue_size=8):
+        self.sink = sink
+        self.error = None
+        self._queue = queue.Queue(maxsize=queue_size)
+        # free frame buffers (queue_size queued + one being written)
+        self._free = queue.Queue()
+        self._buffers = 0
+        self._max_buffers = queue_size + 1
+        self._thread = threading.Thread(target=self._run, name='sink', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            frame = self._queue.get()
+            if frame is _EOF:
+                return
+            try:
+                if self.error is None:
+                    self.sink.write(frame)
+            except BaseException as e:
+                self.error = e
+            finally:
+                self._free.put(frame)
+
+    def _buffer(self, frame):
+        while True:
+            try:
+                buffer = self._free.get_nowait()
+            except queue.Empty:
+                if self._buffers < self._max_buffers:
+                    self._buffers += 1
+                    return np.empty_like(frame)
+                buffer = self._free.get()
+            if buffer.shape == frame.shape and buffer.dtype == frame.dtype:
+                return buffer
+            # frame size changed: drop old buffer
+            self._buffers -= 1
+
+    def write(self, frame):
+        if self.error is not None:
+            raise self.error
+        buffer = self._buffer(frame)
+        np.copyto(buffer, frame)
+        self._queue.put(buffer)
+
+    def release(self):
+        if self._thread is None:
+            return
+        self._queue.put(_EOF)
+        self._thread.join()
+        self._thread = None
+        self.sink.release()
+        if self.error is not None:
+            raise self.error
+
+
+def open_sink(name, size, fps, async_=True, queue_size=8):
+    """Open sink by name, `size` is (width, height)
+
+      - None or 'null' - NullSink
+      - 'ffmpeg:FILE' - FFmpegSink
+      - a folder name ending with '/' (or an existing folder) - ImageSequenceSink,
+        'folder/:N' saves every N-th frame
+      - '*.npy' - MemmapSink
+      - other names - VideoWriterSink
+
+    Encoding sinks are wrapped into AsyncSink if `async_` is True.
+    """
+    if name is None or name == 'null':
+        return NullSink()
+    if name.endswith('.npy'):
+        return MemmapSink(name, size)
+    folder, sep, every = name.rpartition('/:')
+    if name.startswith('ffmpeg:'):
+        sink = FFmpegSink(name[len('ffmpeg:'):], size, fps)
+    elif sep and every.isdigit() and int(every) > 0:
+        sink = ImageSequenceSink(folder + '/', every=int(every))
+    elif name.endswith('/') or os.path.isdir(name):
+        sink = ImageSequenceSink(name)
+    else:
+        sink = VideoWriterSink(name, size, fps)
+    if async_:
+        return AsyncSink(sink, queue_size)
+    return sink
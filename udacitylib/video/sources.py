@@ -0,0 +1,278 @@
+"""udacitylib.video.sources contains sources of BGR frames
+
+Sources have the same interface as cv2.VideoCapture (isOpened, read,
+release) and `properties` (VideoProperties):
+
+   source = open_source('project_video.mp4')
+   ret, frame = source.read()
+   ret, frame = source.read(frame)  # reuse frame buffer
+
+Available sources:
+
+  - CaptureSource - video file, URL or capture device (cv2.VideoCapture)
+  - ImageDirectorySource - images of a folder (sorted by name)
+  - RawSource - raw BGR frames from a binary stream (stdin, pipe)
+
+BufferedSource reads frames of another source in a background thread,
+its overflow policy (BLOCK, DROP_OLDEST, DROP_NEWEST) decides what to do
+when frames arrive faster than they are processed. Use DROP_OLDEST for live
+sources to keep latency bounded.
+
+"""
+
+from collections import deque
+from collections import namedtuple
+import glob
+import os
+import sys
+import threading
+
+import cv2
+import numpy as np
+
+
+VideoProperties = namedtuple('VideoProperties', ['width', 'height', 'fps'])
+
+# overflow policies of BufferedSource
+BLOCK = 'block'  # wait until there is room in the queue (no frames are lost)
+DROP_OLDEST = 'drop_oldest'  # drop the oldest queued frame
+DROP_NEWEST = 'drop_newest'  # drop the frame which was just read
+
+POLICIES = (BLOCK, DROP_OLDEST, DROP_NEWEST)
+
+
+def _vprops(vcap):
+    if vcap.isOpened():
+        # get vcap property
+        width = vcap.get(cv2.CAP_PROP_FRAME_WIDTH)  # float
+        height = vcap.get(cv2.CAP_PROP_FRAME_HEIGHT)  # float
+        fps = vcap.get(cv2.CAP_PROP_FPS)  # float
+
+        return VideoProperties(width=width, height=height, fps=fps)
+
+    raise ValueError('vcap is closed, sorry')
+
+
+def _buffer(image, shape):
+    """Return `image` if it is an uint8 buffer of `shape`, new buffer otherwise"""
+    if image is not None and image.shape == shape and image.dtype == np.uint8 and image.flags.c_contiguous:
+        return image
+    return np.empty(shape, dtype=np.uint8)
+
+
+class CaptureSource:
+    """cv2.VideoCapture source: video file, URL or capture device index
+
+    `width`, `height` and `fps` are requested from capture devices.
+    """
+
+    def __init__(self, source, width=None, height=None, fps=None):
+        self._capture = cv2.VideoCapture(source)
+        for prop, value in ((cv2.CAP_PROP_FRAME_WIDTH, width),
+                            (cv2.CAP_PROP_FRAME_HEIGHT, height),
+                            (cv2.CAP_PROP_FPS, fps)):
+            if value is not None:
+                self._capture.set(prop, value)
+        self.properties = _vprops(self._capture)
+
+    def isOpened(self):
+        return self._capture.isOpened()
+
+    def read(self, image=None):
+        if image is None:
+            return self._capture.read()
+        return self._capture.read(image)
+
+    def release(self):
+        self._capture.release()
+
+
+class ImageDirectorySource:
+    """Images of `folder` matching `pattern` (sorted by file name)"""
+
+    def __init__(self, folder, pattern='*.jpg', fps=25):
+        self.file_names = sorted(glob.glob(os.path.join(folder, pattern)))
+        if not self.file_names:
+            raise ValueError('no images in %s' % os.path.join(folder, pattern))
+        first = cv2.imread(self.file_names[0])
+        if first is None:
+            raise ValueError('can not read %s' % self.file_names[0])
+        self.properties = VideoProperties(width=float(first.shape[1]), height=float(first.shape[0]), fps=fps)
+        self._next = 0
+
+    def isOpened(self):
+        return self._next < len(self.file_names)
+
+    def read(self, image=None):
+        if not self.isOpened():
+            return False, None
+        frame = cv2.imread(self.file_names[self._next])
+        self._next += 1
+        if frame is None:
+            return False, None
+        if image is None or image.shape != frame.shape or image.dtype != frame.dtype:
+            return True, frame
+        np.copyto(image, frame)
+        return True, image
+
+    def release(self):
+        self._next = len(self.file_names)
+
+
+class RawSource:
+    """Raw BGR frames (`width` x `height`, uint8) from binary `stream`
+
+    Frames are read straight into frame buffers (no intermediate copies),
+    for example from ffmpeg (stdin is a live source for pipeline.py, use
+    `--policy block` to process every frame of a file):
+
+       ffmpeg -i video.mp4 -f rawvideo -pix_fmt bgr24 - | python pipeline.py --input - --policy block ...
+
+    """
+
+    def __init__(self, stream, width, height, fps=25):
+        self._stream = stream
+        self._shape = (int(height), int(width), 3)
+        self.properties = VideoProperties(width=float(width), height=float(height), fps=fps)
+        self._eof = False
+
+    def isOpened(self):
+        return not self._eof
+
+    def read(self, image=None):
+        if self._eof:
+            return False, None
+        image = _buffer(image, self._shape)
+        view = memoryview(image).cast('B')
+        n = 0
+        while n < len(view):
+            count = self._stream.readinto(view[n:])
+            if not count:
+                # end of stream (a partial frame is dropped)
+                self._eof = True
+                return False, None
+            n += count
+        return True, image
+
+    def release(self):
+        self._eof = True
+
+
+class BufferedSource:
+    """Reads frames of `source` in a background thread
+
+    At most `size` frames are queued, `policy` (see POLICIES) decides what
+    to do with frames which do not fit. Frame buffers of dropped and copied
+    frames are reused. `read(image)` copies a frame into `image`,
+    `read()` passes the queued buffer to the caller.
+    """
+
+    def __init__(self, source, size=2, policy=DROP_OLDEST):
+        if policy not in POLICIES:
+            raise ValueError('unknown overflow policy: %s' % policy)
+        self.source = source
+        self.properties = source.properties
+        self.size = size
+        self.policy = policy
+        self.dropped = 0  # number of dropped frames
+        self.error = None
+        self._queue = deque()
+        self._free = []  # free frame buffers
+        self._cond = threading.Condition()
+        self._eof = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='source', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            while not self._closed:
+                with self._cond:
+                    buffer = self._free.pop() if self._free else None
+                ret, frame = self.source.read(buffer)
+                if not ret:
+                    break
+                with self._cond:
+                    if len(self._queue) >= self.size:
+                        if self.policy == BLOCK:
+                            while len(self._queue) >= self.size and not self._closed:
+                                self._cond.wait()
+                        elif self.policy == DROP_OLDEST:
+                            self._free.append(self._queue.popleft())
+                            self.dropped += 1
+                        else:
+                            self._free.append(frame)
+                            self.dropped += 1
+                            continue
+                    self._queue.append(frame)
+                    self._cond.notify_all()
+        except BaseException as e:
+            self.error = e
+        finally:
+            with self._cond:
+                self._eof = True
+                self._cond.notify_all()
+
+    def isOpened(self):
+        with self._cond:
+            return bool(self._queue) or not self._eof
+
+    def read(self, image=None):
+        with self._cond:
+            while not self._queue and not self._eof:
+                self._cond.wait()
+            if not self._queue:
+                if self.error is not None:
+                    raise self.error
+                return False, None
+            frame = self._queue.popleft()
+            self._cond.notify_all()
+        if image is None or image.shape != frame.shape or image.dtype != frame.dtype:
+            return True, frame
+        np.copyto(image, frame)
+        with self._cond:
+            self._free.append(frame)
+        return True, image
+
+    def release(self, timeout=1.0):
+        """Stop reading and release `source`
+
+        The reader thread can be blocked in `source.read` (pipes, capture
+        devices): it is waited for at most `timeout` seconds, then `source`
+        is released anyway (the thread is a daemon).
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        self.source.release()
+
+
+def _live(source, policy, queue_size):
+    if policy is None:
+        return source
+    return BufferedSource(source, size=queue_size, policy=policy)
+
+
+def open_source(name, frame_size=None, fps=25, policy=DROP_OLDEST, queue_size=2):
+    """Open source by name
+
+      - '-' - raw BGR frames of `frame_size` (width, height) from stdin
+      - a number - capture device
+      - a folder - images of the folder
+      - other names are passed to cv2.VideoCapture (files, URLs)
+
+    Live sources (stdin and capture devices) are read by BufferedSource
+    with overflow `policy` and `queue_size` (not buffered if `policy` is None).
+    """
+    if policy is not None and policy not in POLICIES:
+        raise ValueError('unknown overflow policy: %s' % policy)
+    if name == '-':
+        if frame_size is None:
+            raise ValueError('frame_size is required for raw frames')
+        return _live(RawSource(sys.stdin.buffer, frame_size[0], frame_size[1], fps), policy, queue_size)
+    if name.isdigit():
+        return _live(CaptureSource(int(name)), policy, queue_size)
+    if os.path.isdir(name):
+        return ImageDirectorySource(name, fps=fps)
+    return CaptureSource(name)